@@ -0,0 +1,262 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+from collections import deque
+import math
+import time
+from typing import Callable, Deque, Optional, Tuple, TypeVar
+
+
+_AggregateType = TypeVar('_AggregateType', bound='Aggregate')
+_WindowedAggregateType = TypeVar('_WindowedAggregateType', bound='_WindowedAggregate')
+
+
+class Aggregate(object):
+    """
+    An abstract aggregate that is maintained incrementally, one new value at a time.
+    Aggregates back aggregate columns (see ContainerItem.add_aggregate_column()).
+    """
+
+    def update(self: _AggregateType, value: float) -> None:
+        """Add a new value."""
+        raise NotImplementedError('Aggregate::update() is not implemented.')
+
+    def get_value(self: _AggregateType) -> Optional[float]:
+        """Current value of the aggregate. None if it is not defined yet."""
+        raise NotImplementedError('Aggregate::get_value() is not implemented.')
+
+    def reset(self: _AggregateType) -> None:
+        """Forget all values."""
+        raise NotImplementedError('Aggregate::reset() is not implemented.')
+
+
+class _WindowedAggregate(Aggregate):
+    """
+    An aggregate over a rolling window of either the last window values or the values of the
+    last window_seconds seconds (by the clock).
+    """
+
+    def __init__(
+        self: _WindowedAggregateType,
+        window: Optional[int] = None,
+        window_seconds: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Initialize."""
+        super().__init__()
+        if (window is None) == (window_seconds is None):
+            raise ValueError(
+                f'{type(self).__name__}::__init__(): Exactly one of window or window_seconds '
+                f'must be given'
+            )
+        self._window: Optional[int] = window
+        self._window_seconds: Optional[float] = window_seconds
+        self._clock: Callable[[], float] = clock
+        self._values: Deque[Tuple[float, float]] = deque()  # (time, value)
+
+    def update(self: _WindowedAggregateType, value: float) -> None:
+        """Add a new value and evict the ones that fell out of the window."""
+        now = self._clock() if self._window_seconds is not None else 0.0
+        self._values.append((now, value))
+        self._add(value)
+        if self._window is not None:
+            while len(self._values) > self._window:
+                self._remove(self._values.popleft()[1])
+        else:
+            while now - self._values[0][0] > self._window_seconds:
+                self._remove(self._values.popleft()[1])
+
+    def reset(self: _WindowedAggregateType) -> None:
+        """Forget all values."""
+        while self._values:
+            self._remove(self._values.popleft()[1])
+
+    def count(self: _WindowedAggregateType) -> int:
+        """Number of values in the window."""
+        return len(self._values)
+
+    def _add(self: _WindowedAggregateType, value: float) -> None:
+        """A value entered the window."""
+        raise NotImplementedError(f'{type(self).__name__}::_add() is not implemented.')
+
+    def _remove(self: _WindowedAggregateType, value: float) -> None:
+        """A value left the window."""
+        raise NotImplementedError(f'{type(self).__name__}::_remove() is not implemented.')
+
+
+class RollingSum(_WindowedAggregate):
+    """Sum over a rolling window."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        """Initialize."""
+        super().__init__(*args, **kwargs)
+        self._sum: float = 0.0
+
+    def _add(self, value: float) -> None:
+        """A value entered the window."""
+        self._sum += value
+
+    def _remove(self, value: float) -> None:
+        """A value left the window."""
+        self._sum -= value
+        if not self._values:
+            self._sum = 0.0  # Do not carry rounding errors into the next window
+
+    def get_value(self) -> Optional[float]:
+        """Current sum."""
+        return self._sum
+
+
+class RollingMean(RollingSum):
+    """Mean over a rolling window."""
+
+    def get_value(self) -> Optional[float]:
+        """Current mean."""
+        return self._sum / len(self._values) if self._values else None
+
+
+class RollingVariance(_WindowedAggregate):
+    """Sample variance over a rolling window, using Welford's algorithm with removal."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        """Initialize."""
+        super().__init__(*args, **kwargs)
+        self._count: int = 0
+        self._mean: float = 0.0
+        self._m2: float = 0.0  # Sum of squared deviations from the mean
+
+    def _add(self, value: float) -> None:
+        """A value entered the window."""
+        self._count += 1
+        delta = value - self._mean
+        self._mean += delta / self._count
+        self._m2 += delta * (value - self._mean)
+
+    def _remove(self, value: float) -> None:
+        """A value left the window."""
+        self._count -= 1
+        if self._count == 0:
+            self._mean = self._m2 = 0.0
+            return
+        delta = value - self._mean
+        self._mean -= delta / self._count
+        self._m2 = max(self._m2 - delta * (value - self._mean), 0.0)
+
+    def get_value(self) -> Optional[float]:
+        """Current sample variance."""
+        return self._m2 / (self._count - 1) if self._count > 1 else None
+
+    def std(self) -> Optional[float]:
+        """Current sample standard deviation."""
+        variance = self.get_value()
+        return math.sqrt(variance) if variance is not None else None
+
+
+class _RollingExtreme(_WindowedAggregate):
+    """
+    Min or max over a rolling window, using a monotonic deque. Every value is pushed and popped
+    at most once, so an update is O(1) amortized.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        """Initialize."""
+        super().__init__(*args, **kwargs)
+        self._sequence: int = 0  # Sequence number of the next value
+        self._evicted: int = 0  # Sequence number of the oldest value still in the window
+        self._extremes: Deque[Tuple[int, float]] = deque()  # (sequence, value)
+
+    def _dominates(self, lhs: float, rhs: float) -> bool:
+        """Does lhs make rhs irrelevant for the rest of the window?"""
+        raise NotImplementedError(f'{type(self).__name__}::_dominates() is not implemented.')
+
+    def _add(self, value: float) -> None:
+        """A value entered the window."""
+        while self._extremes and self._dominates(value, self._extremes[-1][1]):
+            self._extremes.pop()
+        self._extremes.append((self._sequence, value))
+        self._sequence += 1
+
+    def _remove(self, value: float) -> None:
+        """A value left the window. Values leave in the order they entered."""
+        if self._extremes and self._extremes[0][0] == self._evicted:
+            self._extremes.popleft()
+        self._evicted += 1
+
+    def get_value(self) -> Optional[float]:
+        """Current min or max."""
+        return self._extremes[0][1] if self._extremes else None
+
+
+class RollingMin(_RollingExtreme):
+    """Min over a rolling window."""
+
+    def _dominates(self, lhs: float, rhs: float) -> bool:
+        """A newer smaller (or equal) value makes older larger ones irrelevant."""
+        return lhs <= rhs
+
+
+class RollingMax(_RollingExtreme):
+    """Max over a rolling window."""
+
+    def _dominates(self, lhs: float, rhs: float) -> bool:
+        """A newer larger (or equal) value makes older smaller ones irrelevant."""
+        return lhs >= rhs
+
+
+class Ewma(Aggregate):
+    """Exponentially weighted moving average. alpha is the weight of the newest value."""
+
+    def __init__(self, alpha: float) -> None:
+        """Initialize."""
+        super().__init__()
+        if not 0.0 < alpha <= 1.0:
+            raise ValueError(f'Ewma::__init__(): alpha {alpha} must be in (0, 1]')
+        self._alpha: float = alpha
+        self._mean: Optional[float] = None
+
+    def update(self, value: float) -> None:
+        """Add a new value."""
+        if self._mean is None:
+            self._mean = value
+        else:
+            self._mean += self._alpha * (value - self._mean)
+
+    def get_value(self) -> Optional[float]:
+        """Current average."""
+        return self._mean
+
+    def reset(self) -> None:
+        """Forget all values."""
+        self._mean = None
+
+
+class EwmVariance(Ewma):
+    """Exponentially weighted moving variance (e.g. of returns, for EWMA volatility)."""
+
+    def __init__(self, alpha: float) -> None:
+        """Initialize."""
+        super().__init__(alpha)
+        self._variance: float = 0.0
+
+    def update(self, value: float) -> None:
+        """Add a new value."""
+        if self._mean is None:
+            self._mean = value
+            return
+        delta = value - self._mean
+        increment = self._alpha * delta
+        self._mean += increment
+        self._variance = (1.0 - self._alpha) * (self._variance + delta * increment)
+
+    def get_value(self) -> Optional[float]:
+        """Current variance."""
+        return self._variance if self._mean is not None else None
+
+    def reset(self) -> None:
+        """Forget all values."""
+        super().reset()
+        self._variance = 0.0
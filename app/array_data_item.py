@@ -0,0 +1,137 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+from typing import Any, Optional, TypeVar, Union
+
+from .data_item_base import DataItemBase
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+_ArrayDataItemType = TypeVar('_ArrayDataItemType', bound='ArrayDataItem')
+
+
+class ArrayDataItem(DataItemBase):
+    """
+    A data item whose value is a whole NumPy array, e.g. a yield curve or a covariance matrix.
+        1. The item keeps its own copy of the array. get_value() returns a read-only view of it,
+           so it can only be changed through set_value() or update(), which trigger the
+           dependencies once per change, not once per element.
+        2. Changes are detected with array equality. NaNs are equal to NaNs.
+        3. update() changes some elements in place. change_mask() tells which elements the last
+           change touched, so dependency callbacks can recompute only what they need.
+        4. The dtype is fixed by the first non-null value. The shape can change with set_value().
+    NumPy is needed to construct an ArrayDataItem.
+    """
+
+    def __init__(self: _ArrayDataItemType, value: Any = None, dtype: Any = None) -> None:
+        """Initialize."""
+        if numpy is None:
+            raise ImportError('ArrayDataItem::__init__(): NumPy is not installed')
+        super().__init__()
+        self._value: Optional[numpy.ndarray] = (
+            None if value is None else numpy.array(value, dtype=dtype)
+        )
+        # Elements changed by the last change. None if the whole array was replaced.
+        self._change_mask: Optional[numpy.ndarray] = None
+
+    def get_value(self: _ArrayDataItemType) -> Any:
+        """A read-only view of the array, or None."""
+        if self._value is None:
+            return None
+        view = self._value.view()
+        view.flags.writeable = False
+        return view
+
+    def get_string(self: _ArrayDataItemType) -> str:
+        """Get value as a string, on one line."""
+        if self._value is None:
+            return '~~NULL~~'
+        return numpy.array2string(self._value, separator=',').replace('\n', '')
+
+    def is_numeric(self: _ArrayDataItemType) -> bool:
+        """Is this a numeric array?"""
+        return self._value is not None and numpy.issubdtype(self._value.dtype, numpy.number)
+
+    def change_mask(self: _ArrayDataItemType) -> Optional[Any]:
+        """
+        Boolean array of the elements changed by the last change. None if the whole array was
+        replaced (e.g. it was null or its shape changed).
+        """
+        return self._change_mask
+
+    def _differences(self: _ArrayDataItemType, old: Any, new: Any) -> Any:
+        """Element-wise inequality, where NaNs are equal to NaNs."""
+        different = old != new
+        if numpy.issubdtype(old.dtype, numpy.inexact):
+            different &= ~(numpy.isnan(old) & numpy.isnan(new))
+        return different
+
+    def __eq__(self: _ArrayDataItemType, other: DataItemBase) -> bool:
+        """== operator."""
+        if self._value is None or other.get_value() is None:  # None != None
+            return False
+        return bool(numpy.array_equal(self._value, other.get_value(),
+                                      equal_nan=self._value.dtype.kind in 'fc'))
+
+    def _set_to_null_hook(self: _ArrayDataItemType) -> bool:
+        """Set to null."""
+        if self._value is not None:
+            self._value = None
+            self._change_mask = None
+            return True
+        return False
+
+    def _set_value_hook(self: _ArrayDataItemType, value: Union[DataItemBase, Any]) -> bool:
+        """Replace the whole array, if it is different."""
+        if isinstance(value, DataItemBase):
+            value = value.get_value()
+        if self._value is None:
+            self._value = numpy.array(value)
+            self._change_mask = None
+            return True
+        new_value = numpy.asarray(value, dtype=self._value.dtype)
+        if new_value.shape != self._value.shape:
+            self._value = numpy.array(new_value)
+            self._change_mask = None
+            return True
+        different = self._differences(self._value, new_value)
+        if not different.any():  # So dependencies do not trigger
+            return False
+        self._value = numpy.array(new_value)
+        self._change_mask = different
+        return True
+
+    def update(self: _ArrayDataItemType, index: Any, values: Any) -> None:
+        """
+        Change the elements at index (anything NumPy can index with) to values in place.
+        The dependencies are triggered once, and only if an element actually changed.
+        """
+        if self._value is None:
+            raise ValueError('ArrayDataItem::update(): You cannot update a null array')
+        if self._lock is not None:
+            with self._lock:
+                self._update(index, values)
+        else:
+            self._update(index, values)
+
+    def _update(self: _ArrayDataItemType, index: Any, values: Any) -> None:
+        """Change the elements and trigger the dependencies."""
+        old_values = self._value[index]
+        new_values = numpy.broadcast_to(numpy.asarray(values, dtype=self._value.dtype),
+                                        numpy.shape(old_values))
+        different = self._differences(numpy.asarray(old_values), new_values)
+        if not numpy.any(different):
+            return
+        mask = numpy.zeros(self._value.shape, dtype=bool)
+        mask[index] = different
+        self._value[index] = new_values
+        self._change_mask = mask
+        self._changed()
@@ -0,0 +1,6 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
@@ -0,0 +1,61 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+
+Compare SystemItem.clone() with constructing a new instance.
+    python -m app.benchmarks.clone_benchmark [instances] [columns]
+"""
+
+import sys
+
+from ..stop_watch import StopWatch
+from ..system_item import DependencyResult, SystemItem
+
+
+class WideSystem(SystemItem):
+    """A system with a chain of float columns and an action at the end."""
+
+    def __init__(self, columns: int) -> None:
+        """Initialize."""
+        super().__init__()
+        for col in range(columns):
+            self.add_float_column(f'column_{col}', float(col))
+        for col in range(columns - 1):
+            self.add_dependency(col, col + 1, self.next_column)
+        self.add_action(columns - 1, self.last_column_action)
+
+    def next_column(self, col: int, next_col: int) -> DependencyResult:
+        """Dependency along the chain."""
+        self.get(column=next_col).set_value(self.get(column=col).get_value() + 1.0)
+        return DependencyResult.SUCCESS
+
+    def last_column_action(self, col: int) -> DependencyResult:
+        """Action at the end of the chain."""
+        return DependencyResult.SUCCESS
+
+
+def main(instances: int = 1000, columns: int = 50) -> None:
+    """Run the benchmark."""
+    stop_watch = StopWatch()
+    stop_watch.start('construct')
+    for _ in range(instances):
+        WideSystem(columns)
+    stop_watch.stop()
+
+    prototype = WideSystem(columns)
+    stop_watch.start('clone')
+    for _ in range(instances):
+        prototype.clone()
+    stop_watch.stop()
+
+    construct_time = stop_watch.elapsed_time('construct')
+    clone_time = stop_watch.elapsed_time('clone')
+    print(f'{instances} instances of {columns} columns')
+    print(stop_watch.pretty_elapsed_time(), end='')
+    print(f'clone speedup: {construct_time / clone_time:.2f}x')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,83 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+
+Compare ways of letting many feeder threads update independent systems.
+    python -m app.benchmarks.contention_benchmark [feeders] [systems] [updates]
+        global:     One lock around every update of every system
+        per_system: Every system has its own lock (SystemItem.enable_locking())
+        writer:     Every system has a single writer thread (SystemWriter)
+"""
+
+import sys
+from threading import Lock, Thread
+from typing import Callable, List
+
+from ..concurrency import SystemWriter
+from ..stop_watch import StopWatch
+from .clone_benchmark import WideSystem
+
+
+def _run_feeders(feeders: int, updates: int, update: Callable[[int, int], None]) -> None:
+    """Run the feeder threads. Feeder f makes updates calls of update(f, i)."""
+    def feed(feeder: int) -> None:
+        for i in range(updates):
+            update(feeder, i)
+
+    threads = [Thread(target=feed, args=(feeder,)) for feeder in range(feeders)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def main(feeders: int = 8, systems: int = 8, updates: int = 2000, columns: int = 10) -> None:
+    """Run the benchmark."""
+    stop_watch = StopWatch()
+
+    instances: List[WideSystem] = [WideSystem(columns) for _ in range(systems)]
+    global_lock = Lock()
+
+    def global_update(feeder: int, i: int) -> None:
+        with global_lock:
+            instances[(feeder + i) % systems].get(column=0).set_value(float(i))
+
+    stop_watch.start('global')
+    _run_feeders(feeders, updates, global_update)
+    stop_watch.stop()
+
+    instances = [WideSystem(columns) for _ in range(systems)]
+    for instance in instances:
+        instance.enable_locking()
+
+    def per_system_update(feeder: int, i: int) -> None:
+        instances[(feeder + i) % systems].get(column=0).set_value(float(i))
+
+    stop_watch.start('per_system')
+    _run_feeders(feeders, updates, per_system_update)
+    stop_watch.stop()
+
+    writers = [SystemWriter(WideSystem(columns)) for _ in range(systems)]
+    for writer in writers:
+        writer.start()
+
+    def writer_update(feeder: int, i: int) -> None:
+        writers[(feeder + i) % systems].submit(0, float(i))
+
+    stop_watch.start('writer')
+    _run_feeders(feeders, updates, writer_update)
+    for writer in writers:
+        writer.flush()
+    stop_watch.stop()
+    for writer in writers:
+        writer.stop()
+
+    print(f'{feeders} feeders, {systems} systems of {columns} columns, '
+          f'{updates} updates per feeder')
+    print(stop_watch.pretty_elapsed_time(), end='')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
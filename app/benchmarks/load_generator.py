@@ -0,0 +1,256 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+
+Drive synthetic system graphs with synthetic tick streams and measure tick-to-action latency.
+    python -m app.benchmarks.load_generator --instruments 100 --columns 10 --shape chain \
+        --loop-size 3 --ticks 100000 --arrival bursty --repeat-fraction 0.2 --realtime
+Run with --help for all the options. Nothing external is needed.
+"""
+
+import argparse
+import math
+import random
+import sys
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, TypeVar
+
+from ..stop_watch import StopWatch
+from ..system_item import DependencyResult, SystemItem
+
+
+_SyntheticSystemType = TypeVar('_SyntheticSystemType', bound='SyntheticSystem')
+_LatencyRecorderType = TypeVar('_LatencyRecorderType', bound='LatencyRecorder')
+
+SHAPES: Sequence[str] = ('chain', 'fan')
+ARRIVALS: Sequence[str] = ('poisson', 'bursty')
+
+
+class LatencyRecorder(object):
+    """Tick-to-action latencies, in seconds, and their percentiles."""
+
+    def __init__(self: _LatencyRecorderType) -> None:
+        """Initialize."""
+        super().__init__()
+        self.latencies: List[float] = []
+        self.tick_time: Optional[float] = None  # perf_counter() time of the tick in flight
+
+    def record(self: _LatencyRecorderType) -> None:
+        """The action of the tick in flight fired."""
+        if self.tick_time is not None:
+            self.latencies.append(time.perf_counter() - self.tick_time)
+            self.tick_time = None  # Only the first action of a tick counts
+
+    def percentile(self: _LatencyRecorderType, percent: float) -> float:
+        """Nearest rank percentile of the latencies."""
+        if not self.latencies:
+            raise ValueError('LatencyRecorder::percentile(): No latencies were recorded')
+        ordered = sorted(self.latencies)
+        rank = max(math.ceil(percent / 100.0 * len(ordered)), 1)
+        return ordered[rank - 1]
+
+    def summary(self: _LatencyRecorderType) -> Dict[str, float]:
+        """Count, mean, percentiles and max of the latencies, in microseconds."""
+        if not self.latencies:
+            return {'count': 0}
+        result: Dict[str, float] = {
+            'count': len(self.latencies),
+            'mean': sum(self.latencies) / len(self.latencies) * 1e6,
+        }
+        for percent in (50.0, 90.0, 99.0, 99.9):
+            result[f'p{percent:g}'] = self.percentile(percent) * 1e6
+        result['max'] = max(self.latencies) * 1e6
+        return result
+
+
+class SyntheticSystem(SystemItem):
+    """
+    A system with a 'tick' column and a graph of float columns computed from it.
+        chain: tick -> c1 -> c2 -> ... -> cN
+        fan:   tick -> c1 ... c(N-1) -> cN
+    With a loop size L > 1, the L columns before cN also form a circle, which is gone around
+    circle_max times. The action on cN records the tick-to-action latency.
+    """
+
+    def __init__(
+        self: _SyntheticSystemType,
+        recorder: LatencyRecorder,
+        columns: int = 10,
+        shape: str = 'chain',
+        loop_size: int = 0,
+        circle_max: int = 1,
+        deferred_actions: bool = True,
+    ) -> None:
+        """Initialize."""
+        super().__init__()
+        if shape not in SHAPES:
+            raise ValueError(f'SyntheticSystem::__init__(): Unknown shape {shape}')
+        if columns < 2 or loop_size >= columns:
+            raise ValueError(
+                f'SyntheticSystem::__init__(): {columns} columns cannot have a loop of {loop_size}'
+            )
+        self._recorder: LatencyRecorder = recorder
+        self.add_float_column('tick', 0.0)
+        for col in range(1, columns + 1):
+            self.add_float_column(f'c{col}', 0.0)
+        last = columns  # Column index of cN
+        if shape == 'chain':
+            for col in range(last):
+                self.add_dependency(col, col + 1, self.derive)
+        else:
+            for col in range(1, last):
+                self.add_dependency(0, col, self.derive)
+                self.add_dependency(col, last, self.derive)
+        if loop_size > 1:
+            # The loop_size columns before cN form a circle
+            first = last - loop_size
+            if shape == 'fan':
+                for col in range(first, last - 1):
+                    self.add_dependency(col, col + 1, self.derive)
+            self.add_dependency(last - 1, first, self.derive)
+        self.set_dependency_circle_max(circle_max)
+        self.set_deferred_actions(deferred_actions)
+        self.add_action(last, self.on_signal)
+
+    def derive(self: _SyntheticSystemType, col: int, dependent_col: int) -> DependencyResult:
+        """Some arithmetic for every dependency."""
+        value = self.get(column=col).get_value()
+        self.get(column=dependent_col).set_value(value * 1.0001 + 1.0)
+        return DependencyResult.SUCCESS
+
+    def on_signal(self: _SyntheticSystemType, col: int) -> DependencyResult:
+        """The action at the end of the graph."""
+        self._recorder.record()
+        return DependencyResult.SUCCESS
+
+
+class Tick(NamedTuple):
+    """One synthetic tick."""
+
+    due: float  # Seconds since the start of the stream
+    instrument: int
+    price: float
+
+
+def tick_stream(
+    instruments: int,
+    ticks: int,
+    rate: float = 10000.0,
+    arrival: str = 'poisson',
+    burst_size: float = 10.0,
+    repeat_fraction: float = 0.0,
+    seed: Optional[int] = None,
+) -> Iterator[Tick]:
+    """
+    Generate ticks for random instruments, at rate ticks per second on average.
+        poisson: Exponential gaps between ticks
+        bursty: Bursts of burst_size ticks on average, with no gaps inside a burst and
+                exponential gaps between bursts
+    A repeat_fraction of the ticks repeat the last price of their instrument, so they do not
+    change anything. Otherwise, the prices are random walks.
+    """
+    if arrival not in ARRIVALS:
+        raise ValueError(f'tick_stream(): Unknown arrival {arrival}')
+    rng = random.Random(seed)
+    prices: List[float] = [100.0] * instruments
+    due: float = 0.0
+    burst_left: int = 0
+    for _ in range(ticks):
+        if arrival == 'poisson':
+            due += rng.expovariate(rate)
+        elif burst_left > 0:
+            burst_left -= 1
+        else:
+            due += rng.expovariate(rate / burst_size)
+            if burst_size > 1.0:  # Geometric burst size with the given mean
+                burst_left = int(math.log(1.0 - rng.random()) / math.log(1.0 - 1.0 / burst_size))
+        instrument = rng.randrange(instruments)
+        if rng.random() >= repeat_fraction:
+            prices[instrument] = round(prices[instrument] + rng.gauss(0.0, 0.05), 4)
+        yield Tick(due, instrument, prices[instrument])
+
+
+def drive(
+    systems: Sequence[SystemItem],
+    recorder: LatencyRecorder,
+    ticks: Iterator[Tick],
+    realtime: bool = False,
+) -> int:
+    """
+    Apply the ticks to the systems and return the number of ticks applied.
+    In realtime mode, ticks are applied at their due times and the latency is measured from the
+    due time, so falling behind shows up as latency. Otherwise, ticks are applied as fast as
+    possible and the latency is measured from when the tick is applied.
+    """
+    count: int = 0
+    start: float = time.perf_counter()
+    for tick in ticks:
+        if realtime:
+            due = start + tick.due
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            recorder.tick_time = due
+        else:
+            recorder.tick_time = time.perf_counter()
+        systems[tick.instrument].get(column=0).set_value(tick.price)
+        recorder.tick_time = None  # Ticks that change nothing have no latency
+        count += 1
+    return count
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, float]:
+    """Run the load generator and print the results."""
+    parser = argparse.ArgumentParser(description='Lynx synthetic load generator')
+    parser.add_argument('--instruments', type=int, default=100)
+    parser.add_argument('--columns', type=int, default=10, help='Derived columns per system')
+    parser.add_argument('--shape', choices=SHAPES, default='chain')
+    parser.add_argument('--loop-size', type=int, default=0, help='Columns in a circle, if > 1')
+    parser.add_argument('--circle-max', type=int, default=1)
+    parser.add_argument('--immediate-actions', action='store_true',
+                        help='Run actions as soon as their column changes, not once settled')
+    parser.add_argument('--ticks', type=int, default=100000)
+    parser.add_argument('--rate', type=float, default=10000.0, help='Ticks per second')
+    parser.add_argument('--arrival', choices=ARRIVALS, default='poisson')
+    parser.add_argument('--burst-size', type=float, default=10.0)
+    parser.add_argument('--repeat-fraction', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--realtime', action='store_true',
+                        help='Apply ticks at their due times, instead of as fast as possible')
+    args = parser.parse_args(argv)
+
+    stop_watch = StopWatch()
+    recorder = LatencyRecorder()
+    stop_watch.start('build')
+    systems = [
+        SyntheticSystem(recorder, args.columns, args.shape, args.loop_size, args.circle_max,
+                        not args.immediate_actions)
+        for _ in range(args.instruments)
+    ]
+    stop_watch.stop()
+
+    stop_watch.start('drive')
+    applied = drive(systems,
+                    recorder,
+                    tick_stream(args.instruments, args.ticks, args.rate, args.arrival,
+                                args.burst_size, args.repeat_fraction, args.seed),
+                    args.realtime)
+    stop_watch.stop()
+
+    summary = recorder.summary()
+    print(f'{args.instruments} instruments, {args.columns} columns, {args.shape} shape, '
+          f'loop of {args.loop_size}, {args.arrival} arrivals')
+    print(stop_watch.pretty_elapsed_time(), end='')
+    print(f'ticks applied: {applied}, '
+          f'ticks per second: {applied / stop_watch.elapsed_time("drive"):.0f}')
+    print('latency (us): ' + ', '.join(
+        f'{key}: {value:.1f}' if key != 'count' else f'{key}: {value}'
+        for key, value in summary.items()
+    ))
+    return summary
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
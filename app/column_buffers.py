@@ -0,0 +1,188 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+from datetime import datetime
+from typing import Any, NamedTuple, Optional, Union
+
+from .container_item import ContainerItem
+from .data_item_base import DataItemBase
+from .mmap_container_item import _TYPE_FORMATS, _MappedColumn, _encode_column
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class ColumnBuffers(NamedTuple):
+    """
+    The data of one column as Arrow compatible buffers.
+        validity: Bitmap of non-null rows, least significant bit first
+        values: Typed values. int64 for int, float64 for float, one byte per bool, int64
+                microseconds since the (naive) epoch for datetime and int64 offsets into blob
+                (one more than rows) for str. None for null-typed columns.
+        blob: The UTF-8 data of str columns. Otherwise None.
+    Every field supports the buffer protocol, so the buffers can be handed to NumPy, Arrow, etc.
+    without copying them.
+    """
+
+    column_type: type
+    length: int
+    null_count: int
+    validity: memoryview
+    values: Optional[memoryview]
+    blob: Optional[memoryview]
+
+
+def _null_count(validity: memoryview, length: int) -> int:
+    """Number of zero bits in the first length bits of the bitmap."""
+    valid_bits = int.from_bytes(validity, 'little') & ((1 << length) - 1)
+    return length - bin(valid_bits).count('1')  # int.bit_count() needs Python 3.10
+
+
+def export_column(container: ContainerItem, column: Union[int, str]) -> ColumnBuffers:
+    """
+    Export a column of the container as Arrow compatible buffers.
+    Columns that are already kept in buffers (mapped or imported columns) are exported without
+    copying anything. Regular columns are encoded in a single pass.
+    """
+    col_idx = container.column_index(column) if type(column) is str else column
+    if not container._column_exists(col_idx):
+        raise IndexError(f'export_column(): column {column} does not exist')
+    column_type = container._column_names_and_types[col_idx][1]
+    column_data = container._column_data[col_idx]
+    if isinstance(column_data, _MappedColumn):
+        validity = column_data.validity[:(column_data.rows + 7) // 8]
+        return ColumnBuffers(column_type,
+                             column_data.rows,
+                             _null_count(validity, column_data.rows),
+                             validity,
+                             column_data.values,
+                             column_data.blob)
+
+    if column_type not in _TYPE_FORMATS:
+        raise TypeError(f'export_column(): column {column} of type {column_type} cannot be '
+                        f'exported to buffers')
+    values = [item.get_value() for item in column_data]
+    if column_type is type(None):
+        values = [None] * len(values)
+    sections = _encode_column(column_type, values)
+    validity = memoryview(sections['validity'])
+    fmt = _TYPE_FORMATS[column_type][1]
+    return ColumnBuffers(column_type,
+                         len(values),
+                         _null_count(validity, len(values)),
+                         validity,
+                         memoryview(sections['values']).cast(fmt) if fmt else None,
+                         memoryview(sections['blob']) if 'blob' in sections else None)
+
+
+def import_column(
+    container: ContainerItem,
+    name: str,
+    column_type: type,
+    values: Any,
+    validity: Any = None,
+    blob: Any = None,
+) -> DataItemBase:
+    """
+    Add a column to the container that adopts existing buffers (see ColumnBuffers for their
+    layout) instead of copying them. values, validity and blob can be anything that supports the
+    buffer protocol, e.g. bytes, array.array, NumPy arrays or Arrow buffers. No validity means no
+    nulls.
+        1. Changes to the buffers are seen by the container and, if the buffers are writable,
+           set_value() writes through to them. Writing to the buffers directly does not bump
+           versions or trigger dependencies. Go through set_value() for that.
+        2. The column has a fixed number of rows.
+    Returns the data item of the first row.
+    """
+    if column_type not in _TYPE_FORMATS or column_type is type(None):
+        raise TypeError(f'import_column(): column {name} of type {column_type} cannot be '
+                        f'imported from buffers')
+    fmt = _TYPE_FORMATS[column_type][1]
+    values_view = memoryview(values).cast('B').cast(fmt)
+    rows = len(values_view) - 1 if column_type is str else len(values_view)
+    if rows < 1:
+        raise ValueError(f'import_column(): column {name} must have at least one row')
+    if validity is None:
+        validity_view = memoryview(bytearray([0xFF]) * ((rows + 7) // 8))
+    else:
+        validity_view = memoryview(validity).cast('B')
+        if len(validity_view) < (rows + 7) // 8:
+            raise ValueError(f'import_column(): validity of column {name} is too short')
+    blob_view: Optional[memoryview] = None
+    if column_type is str:
+        if blob is None:
+            raise ValueError(f'import_column(): str column {name} needs a blob')
+        blob_view = memoryview(blob).cast('B')
+
+    # Add the column the regular way, so subclasses (e.g. SystemItem) do their bookkeeping, then
+    # swap its data for the buffers.
+    template = container._add_column(name, None, column_type)
+    col_idx = template._my_column_in_container
+    column_data = _MappedColumn(column_type, rows, validity_view, values_view, blob_view)
+    column_data.template = template
+    container._column_data[col_idx] = column_data
+    container._columns_changed(col_idx)
+    return column_data[0]
+
+
+def to_numpy(buffers: ColumnBuffers) -> Any:
+    """
+    The column as a NumPy masked array. Numbers, booleans and datetimes share the memory of the
+    buffers. Strings are copied into an object array.
+    """
+    if numpy is None:
+        raise ImportError('to_numpy(): NumPy is not installed')
+    valid = numpy.unpackbits(
+        numpy.frombuffer(buffers.validity, dtype=numpy.uint8), count=buffers.length,
+        bitorder='little'
+    ).astype(bool)
+    if buffers.column_type is str:
+        offsets = buffers.values
+        blob = bytes(buffers.blob)
+        data = numpy.array([str(blob[offsets[row]:offsets[row + 1]], 'utf-8')
+                            for row in range(buffers.length)], dtype=object)
+    elif buffers.column_type is type(None):
+        data = numpy.full(buffers.length, None, dtype=object)
+    else:
+        dtype = {int: numpy.int64,
+                 float: numpy.float64,
+                 bool: numpy.bool_,
+                 datetime: 'datetime64[us]'}[buffers.column_type]
+        data = numpy.frombuffer(buffers.values, dtype=dtype, count=buffers.length)
+    return numpy.ma.MaskedArray(data, mask=~valid)
+
+
+def to_arrow(buffers: ColumnBuffers) -> Any:
+    """
+    The column as an Arrow array. The buffers are adopted without copying, except for booleans,
+    which Arrow keeps as a bitmap.
+    """
+    if pyarrow is None:
+        raise ImportError('to_arrow(): PyArrow is not installed')
+    if buffers.column_type is type(None):
+        return pyarrow.nulls(buffers.length)
+    validity = pyarrow.py_buffer(buffers.validity) if buffers.null_count else None
+    if buffers.column_type is bool:
+        return pyarrow.array([bool(v) for v in buffers.values[:buffers.length]],
+                             type=pyarrow.bool_(),
+                             mask=[not bool(buffers.validity[row >> 3] & (1 << (row & 7)))
+                                   for row in range(buffers.length)])
+    arrow_type = {int: pyarrow.int64(),
+                  float: pyarrow.float64(),
+                  datetime: pyarrow.timestamp('us'),
+                  str: pyarrow.large_string()}[buffers.column_type]
+    data = [validity, pyarrow.py_buffer(buffers.values)]
+    if buffers.column_type is str:
+        data.append(pyarrow.py_buffer(buffers.blob))
+    return pyarrow.Array.from_buffers(arrow_type, buffers.length, data, buffers.null_count)
@@ -0,0 +1,91 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+from queue import Queue
+from threading import Thread
+from typing import List, Optional, Tuple, TypeVar, Union
+
+from .data_item_base import AllowedBaseTypes
+
+
+_SystemWriterType = TypeVar('_SystemWriterType', bound='SystemWriter')
+
+_STOP = object()  # Tells the writer thread to exit
+
+
+class SystemWriter(object):
+    """
+    A single writer thread that owns a SystemItem. Any number of threads submit changes to it
+    and it applies them, one at a time, in the order they were submitted.
+        1. Since only the writer thread changes the system, no locking is needed. The systems
+           of different writers propagate in parallel, as far as the interpreter allows.
+        2. Readers in other threads should use the system snapshot (see
+           SystemItem.enable_snapshots()), which the writer enables. They never see the system
+           in the middle of a propagation.
+        3. Exceptions raised while applying a change are kept in errors(). The writer goes on.
+    """
+
+    def __init__(self: _SystemWriterType, system, max_queue_size: int = 0) -> None:
+        """Initialize."""
+        super().__init__()
+        self._system = system
+        # (column, value) or _STOP
+        self._queue: Queue = Queue(max_queue_size)
+        self._thread: Optional[Thread] = None
+        self._errors: List[Tuple[Union[int, str], Exception]] = []  # (column, exception)
+        if system._snapshot is None:
+            system.enable_snapshots()
+
+    def start(self: _SystemWriterType) -> None:
+        """Start the writer thread."""
+        if self._thread is not None:
+            raise RuntimeError('SystemWriter::start(): Writer is already started')
+        self._thread = Thread(target=self._run, name='SystemWriter', daemon=True)
+        self._thread.start()
+
+    def stop(self: _SystemWriterType) -> None:
+        """Apply the changes submitted so far and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def flush(self: _SystemWriterType) -> None:
+        """Wait until all the changes submitted so far are applied."""
+        self._queue.join()
+
+    def submit(self: _SystemWriterType, column: Union[int, str], value: AllowedBaseTypes) -> None:
+        """Submit a change of the column to the given value. None sets the column to null."""
+        self._queue.put((column, value))
+
+    def errors(self: _SystemWriterType) -> List[Tuple[Union[int, str], Exception]]:
+        """Exceptions raised while applying the changes, with their columns."""
+        return self._errors
+
+    def snapshot(self: _SystemWriterType):
+        """The system snapshot as of when it last settled."""
+        return self._system.snapshot()
+
+    def _run(self: _SystemWriterType) -> None:
+        """The writer thread."""
+        while True:
+            change = self._queue.get()
+            try:
+                if change is _STOP:
+                    return
+                column, value = change
+                try:
+                    data_item = self._system.get(column=column)
+                    if value is None:
+                        data_item.set_to_null()
+                    else:
+                        data_item.set_value(value)
+                except Exception as ex:
+                    self._errors.append((column, ex))
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,202 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+from typing import Any, List, NamedTuple, Optional, Set, Tuple, TypeVar
+
+from .array_data_item import ArrayDataItem
+from .container_item import ContainerItem
+from .data_item_base import DataItemBase
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+_DeltaPublisherType = TypeVar('_DeltaPublisherType', bound='DeltaPublisher')
+
+
+class DeltaOp(NamedTuple):
+    """
+    One change in a delta (see diff()).
+        set: Row row of column changed to value
+        append: The values were added to the end of column
+        truncate: column was cut down to value rows
+        add_column: column was added with the values as its rows
+        remove_column: column was removed
+    Containers in values are plain ContainerItem copies. Arrays are copies too.
+    """
+
+    kind: str
+    path: Tuple[Tuple[str, int], ...]  # (column name, row) of the nested containers, from the top
+    column: str
+    column_type: Optional[type]
+    row: Optional[int] = None
+    value: Any = None
+
+
+def _copy_container(container: ContainerItem) -> ContainerItem:
+    """A plain, detached copy of the columns of the container. Systems lose their dependencies."""
+    result = ContainerItem()
+    for col_idx, name_and_type in enumerate(container._column_names_and_types):
+        if name_and_type is None:
+            continue
+        name, column_type = name_and_type
+        column = container._column_data[col_idx]
+        first = _delta_value(column[0])
+        result._add_column(name,
+                           ArrayDataItem(first) if column_type is ArrayDataItem else first,
+                           column_type)
+        for data_item in column[1:]:
+            result.add_row(name, _delta_value(data_item))
+    return result
+
+
+def _delta_value(data_item: DataItemBase) -> Any:
+    """A copy of the value of the data item that does not share anything with it."""
+    if isinstance(data_item, ContainerItem):
+        return _copy_container(data_item)
+    if isinstance(data_item, ArrayDataItem):
+        value = data_item.get_value()
+        return None if value is None else numpy.array(value)
+    return data_item.get_value()
+
+
+def _copy_value(value: Any) -> Any:
+    """Copy the value of an op, so a delta can be applied more than once."""
+    return _copy_container(value) if isinstance(value, ContainerItem) else value
+
+
+def _same_type(old_type: type, new_type: type) -> bool:
+    """Can a column of the old type be changed into the new one cell by cell?"""
+    # A null column gets a type with its first non-null value (see apply_delta())
+    return old_type is new_type or old_type is type(None)  # noqa: E721
+
+
+def _diff(old: ContainerItem,
+          new: ContainerItem,
+          path: Tuple[Tuple[str, int], ...],
+          delta: List[DeltaOp]) -> None:
+    """Append the ops that turn old into new to delta."""
+    if old.structural_hash() == new.structural_hash():
+        return
+    # Columns that were removed, or removed and added again with another type
+    replaced: Set[str] = {
+        name for name, old_idx in old._names_dict.items()
+        if name not in new._names_dict or not _same_type(
+            old._column_names_and_types[old_idx][1],
+            new._column_names_and_types[new._names_dict[name]][1],
+        )
+    }
+    for name in old._names_dict:
+        if name in replaced:
+            delta.append(DeltaOp('remove_column', path, name, None))
+    for new_idx, name_and_type in enumerate(new._column_names_and_types):
+        if name_and_type is None:
+            continue
+        name, column_type = name_and_type
+        new_column = new._column_data[new_idx]
+        old_idx = old._names_dict.get(name)
+        if old_idx is None or name in replaced:
+            delta.append(DeltaOp('add_column', path, name, column_type,
+                                 value=[_delta_value(item) for item in new_column]))
+            continue
+        if old.column_hash(old_idx) == new.column_hash(new_idx):
+            continue
+        old_column = old._column_data[old_idx]
+        for row in range(min(len(old_column), len(new_column))):
+            old_item = old_column[row]
+            new_item = new_column[row]
+            if isinstance(old_item, ContainerItem) and isinstance(new_item, ContainerItem):
+                _diff(old_item, new_item, path + ((name, row), ), delta)
+            elif ContainerItem._item_digest(old_item) != ContainerItem._item_digest(new_item):
+                delta.append(DeltaOp('set', path, name, column_type, row,
+                                     _delta_value(new_item)))
+        if len(new_column) > len(old_column):
+            delta.append(DeltaOp('append', path, name, column_type,
+                                 value=[_delta_value(item)
+                                        for item in new_column[len(old_column):]]))
+        elif len(new_column) < len(old_column):
+            delta.append(DeltaOp('truncate', path, name, column_type, value=len(new_column)))
+
+
+def diff(old: ContainerItem, new: ContainerItem) -> List[DeltaOp]:
+    """
+    The ops that turn old into new. Only columns and nested containers whose structural hashes
+    differ are visited, so the cost is in proportion to what changed, not to the size of the
+    containers. Columns are matched by name. A column whose type changed is removed and added
+    again.
+    """
+    delta: List[DeltaOp] = []
+    _diff(old, new, (), delta)
+    return delta
+
+
+def apply_delta(container: ContainerItem, delta: List[DeltaOp]) -> None:
+    """
+    Apply the ops of a delta (see diff()) to the container. The changes go through set_value(),
+    add_row(), etc., so they trigger the dependencies and subscriptions of the container.
+    """
+    for op in delta:
+        target = container
+        for name, row in op.path:
+            target = target.get(row=row, column=name)
+        if op.kind == 'add_column':
+            first = _copy_value(op.value[0])
+            target._add_column(
+                op.column,
+                ArrayDataItem(first) if op.column_type is ArrayDataItem else first,
+                op.column_type,
+            )
+            for value in op.value[1:]:
+                target.add_row(op.column, _copy_value(value))
+        elif op.kind == 'remove_column':
+            target.remove_column(op.column)
+        elif op.kind == 'set':
+            col_idx = target.column_index(op.column)
+            if target._column_names_and_types[col_idx][1] is type(None):  # noqa: E721
+                # A null column that got a type
+                target._column_names_and_types[col_idx] = (op.column, op.column_type)
+                target._invalidate_hash(col_idx)
+            data_item = target.get(row=op.row, column=col_idx)
+            if op.value is None:
+                data_item.set_to_null()
+            else:
+                data_item.set_value(_copy_value(op.value))
+        elif op.kind == 'append':
+            for value in op.value:
+                target.add_row(op.column, _copy_value(value))
+        elif op.kind == 'truncate':
+            for row in reversed(range(op.value, target.number_of_rows(op.column))):
+                target.remove_row(op.column, row)
+        else:
+            raise ValueError(f'apply_delta(): Unknown op {op.kind}')
+
+
+class DeltaPublisher(object):
+    """
+    Publish the changes of a container as deltas, instead of full snapshots.
+    It keeps a copy of the container as last published, and brings the copy up to date with each
+    delta it publishes. So both diffing and keeping the copy cost in proportion to what changed.
+    Subscribers apply the deltas to their own copy (see apply_delta()).
+    """
+
+    def __init__(self: _DeltaPublisherType, container: ContainerItem) -> None:
+        """Initialize."""
+        super().__init__()
+        self._container: ContainerItem = container
+        self._published: ContainerItem = _copy_container(container)  # As last published
+
+    def published(self: _DeltaPublisherType) -> ContainerItem:
+        """A copy of the container as last published. It must not be changed."""
+        return self._published
+
+    def publish(self: _DeltaPublisherType) -> List[DeltaOp]:
+        """The changes since the last publish. Empty if there are none."""
+        delta = diff(self._published, self._container)
+        apply_delta(self._published, delta)
+        return delta
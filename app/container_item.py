@@ -7,10 +7,17 @@ Distributed under the BSD Software License (see file LICENSE)
 
 import copy
 from datetime import datetime
-from typing import Dict, List, Tuple, TypeVar, Union
+import hashlib
+import sys
+from threading import RLock
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar, Union
 
+from .aggregates import Aggregate
+from .array_data_item import ArrayDataItem
 from .data_item_base import AllowedBaseTypes, DataItemBase
 from .data_item import DataItem
+from .memory_usage import deep_sizeof
+from .subscriptions import Subscription
 
 
 _ContainerItemType = TypeVar('_ContainerItemType', bound='ContainerItem')
@@ -26,21 +33,34 @@ class ContainerItem(DataItemBase):
            shape.
         3. All rows in a given column of ContainerItem are of the same DataItem type. For example,
            all rows of a given column are all either a DatItem of integer type or float type, etc.
+        4. Column indices are stable. Removing a column leaves a tombstone (None) in its place,
+           so removal is O(1) and the indices of the other columns never change.
     """
 
     def __init__(self: _ContainerItemType) -> None:
         """Initialize."""
         super().__init__()
-        # Vector of column names and types
-        self._column_names_and_types: List[Tuple[str, type]] = []
-        self._column_data: List[List[DataItemBase]] = []  # Vector of vector of DataItems
+        # Vector of column names and types. None for removed columns.
+        self._column_names_and_types: List[Optional[Tuple[str, type]]] = []
+        # Vector of vector of DataItems. None for removed columns.
+        self._column_data: List[Optional[List[DataItemBase]]] = []
         self._names_dict: Dict[str, int] = {}  # Hash table of column names -> column index
+        self._aggregates: Dict[int, Aggregate] = {}  # Aggregate column index -> its aggregate
+        # Source column index -> the aggregate columns that follow it
+        self._aggregate_sources: Dict[int, List[int]] = {}
+        self._subscriptions: List[Subscription] = []  # Listeners to column changes
+        # Column index -> structural hash of the column. A missing column must be rehashed.
+        self._column_hashes: Dict[int, bytes] = {}
+        self._structural_hash: Optional[bytes] = None  # None means it must be recomputed
+        self._views: List[Any] = []  # Views kept up to date with this container (ContainerView)
 
     @classmethod
     def _string_format(cls, container: _ContainerItemType, offset: str = '') -> str:
         """Class method to format the container nicely."""
         result: str = ''
         for name_and_type in container._column_names_and_types:
+            if name_and_type is None:
+                continue
             result += f'{offset}{name_and_type[0]}: '
             data_idx: int = container._names_dict.get(name_and_type[0], -1)
             for data_item in container._column_data[data_idx]:
@@ -53,6 +73,32 @@ class ContainerItem(DataItemBase):
             result += '\n'
         return result
 
+    @classmethod
+    def _share_lock(cls, data_item: DataItemBase, lock: Optional[RLock]) -> None:
+        """Make the data item, and everything in it, change under the given lock."""
+        data_item._lock = lock
+        if isinstance(data_item, ContainerItem):
+            for column in data_item._column_data:
+                for row_item in column or ():
+                    ContainerItem._share_lock(row_item, lock)
+
+    @classmethod
+    def _item_digest(cls, data_item: DataItemBase) -> bytes:
+        """Bytes that identify the type and value of a data item, for hashing."""
+        if isinstance(data_item, ContainerItem):
+            return b'C' + data_item.structural_hash()
+        value = data_item.get_value()
+        if isinstance(data_item, ArrayDataItem):
+            if value is None:
+                return b'A'
+            if value.dtype.kind in 'fc':
+                value = value + 0  # So -0.0 hashes like 0.0
+                value[value != value] = float('nan')  # And all NaNs hash the same
+            return b'A' + f'{value.dtype.str}{value.shape}'.encode() + value.tobytes()
+        if type(value) is float:
+            value += 0.0  # So -0.0 hashes like 0.0
+        return f'{type(value).__name__}:{value!r}'.encode()
+
     def get_value(self: _ContainerItemType) -> AllowedBaseTypes:
         """get_value() for containers."""
         return ContainerItem._string_format(self)
@@ -68,8 +114,13 @@ class ContainerItem(DataItemBase):
                 'ContainerItem::__eq__(): Container item could only be compared '
                 'with another container item'
             )
-        return (self._column_data == other._column_data and
-                self._column_names_and_types == other._column_names_and_types)
+        if self.structural_hash() != other.structural_hash():
+            return False
+        # Tombstones do not matter, so containers with different histories can be equal
+        return ([column for column in self._column_data if column is not None] ==
+                [column for column in other._column_data if column is not None] and
+                [nt for nt in self._column_names_and_types if nt is not None] ==
+                [nt for nt in other._column_names_and_types if nt is not None])
 
     def _set_value_hook(
             self: _ContainerItemType, value: Union[DataItemBase, AllowedBaseTypes]
@@ -84,27 +135,116 @@ class ContainerItem(DataItemBase):
             return False
         # We don't want to copy the meta-data in DataItemBase
         self._column_names_and_types = copy.deepcopy(value._column_names_and_types)
-        self._column_data = copy.deepcopy(value._column_data)
+        # Locks cannot be copied. The copied data items change under our lock instead. And they
+        # report their changes to us, not to the container they were copied from.
+        memo = {id(value): self}
+        if value._lock is not None:
+            memo[id(value._lock)] = self._lock
+        self._column_data = copy.deepcopy(value._column_data, memo)
         self._names_dict = copy.deepcopy(value._names_dict)
+        # The copy has the same column indices, so the hashes hold for it too
+        self._column_hashes = dict(value._column_hashes)
+        self._structural_hash = value._structural_hash
+        for view in list(self._views):
+            view._source_columns_changed()
+        if self._lock is not None:
+            for column in self._column_data:
+                for data_item in column or ():
+                    ContainerItem._share_lock(data_item, self._lock)
         return True
 
     # Container item specific interface
 
+    def _column_exists(self: _ContainerItemType, column_num: Optional[int]) -> bool:
+        """Is there a column, that is not removed, at the given index?"""
+        return (column_num is not None and 0 <= column_num < len(self._column_data) and
+                self._column_data[column_num] is not None)
+
+    def structural_hash(self: _ContainerItemType) -> bytes:
+        """
+        A hash of the column names, types and values, nested containers included. Containers
+        with different hashes are not equal. The hashes of columns and nested containers are kept
+        until they change, so hashing a container that has not changed is O(1), and hashing one
+        that has only rehashes the changed columns.
+        Mapped columns (see MmapContainerItem and import_column()) are rehashed every time,
+        because their buffers can change without telling the container.
+        """
+        if self._structural_hash is not None:
+            return self._structural_hash
+        digest = hashlib.blake2b(digest_size=16)
+        cacheable: bool = True
+        for col_idx, column in enumerate(self._column_data):
+            if column is None:
+                continue
+            digest.update(self.column_hash(col_idx))
+            cacheable = cacheable and col_idx in self._column_hashes
+        result = digest.digest()
+        if cacheable:
+            self._structural_hash = result
+        return result
+
+    def column_hash(self: _ContainerItemType, column: Union[int, str]) -> bytes:
+        """The structural hash of one column (see structural_hash())."""
+        col_idx = self._names_dict.get(column) if type(column) is str else column
+        if not self._column_exists(col_idx):
+            raise IndexError(f'ContainerItem::column_hash(): column {column} does not exist')
+        column_hash = self._column_hashes.get(col_idx)
+        if column_hash is not None:
+            return column_hash
+        column_data = self._column_data[col_idx]
+        name, column_type = self._column_names_and_types[col_idx]
+        digest = hashlib.blake2b(f'{name}:{column_type.__name__}'.encode(), digest_size=16)
+        cacheable: bool = type(column_data) is list  # Mapped columns are not lists
+        for data_item in column_data:
+            item_digest = ContainerItem._item_digest(data_item)
+            digest.update(len(item_digest).to_bytes(8, 'little'))
+            digest.update(item_digest)
+            if isinstance(data_item, ContainerItem):
+                cacheable = cacheable and data_item._structural_hash is not None
+        column_hash = digest.digest()
+        if cacheable:
+            self._column_hashes[col_idx] = column_hash
+        return column_hash
+
+    def _touch(self: _ContainerItemType) -> None:
+        """
+        Something in the container changed. A new version tells pure dependencies that read the
+        container to run again.
+        """
+        self._version += 1
+        super()._touch()
+
+    def _row_changed(self: _ContainerItemType, row: int, column: int) -> None:
+        """The value of a cell has changed."""
+        self._invalidate_hash(column)
+        for view in list(self._views):
+            view._source_cell_changed(row, column)
+
+    def _invalidate_hash(self: _ContainerItemType, column: Optional[int]) -> None:
+        """The column has changed. Forget its hash, and the hashes above it."""
+        container: Optional[ContainerItem] = self
+        while container is not None:
+            container._column_hashes.pop(column, None)
+            container._structural_hash = None
+            touch = container._my_container_touch
+            column = container._my_column_in_container
+            container = touch.__self__ if touch is not None else None
+
     def number_of_columns(self: _ContainerItemType) -> int:
         """Get the number of columns."""
-        return len(self._column_names_and_types)
+        return len(self._names_dict)
 
     def number_of_rows(self: _ContainerItemType, column: Union[int, str]) -> int:
         """Get the number of rows for the given column"""
         col_index = self._names_dict.get(column, -1) if type(column) is str else column
-        if col_index < 0:
+        if not self._column_exists(col_index):
             raise IndexError(f'ContainerItem::number_of_rows(): column {column} does not exist')
         return len(self._column_data[col_index])
 
     def get(self: _ContainerItemType, row: int = 0, column: Union[int, str] = 0) -> DataItemBase:
         """Get data from container for the given row and column."""
         column_num = self._names_dict.get(column) if type(column) is str else column
-        if column_num is None or column_num < 0 or column_num >= len(self._column_data):
+        if not self._column_exists(column_num):
             raise IndexError(f'ContainerItem::get(): column {column} does not exist')
         if row < 0 or row >= len(self._column_data[column_num]):
             raise IndexError(f'ContainerItem::get(): row {row} does not exist for column {column}')
@@ -112,6 +252,8 @@ class ContainerItem(DataItemBase):
 
     def column_name(self: _ContainerItemType, column: int) -> str:
         """Return column name given index."""
+        if not self._column_exists(column):
+            raise IndexError(f'ContainerItem::column_name(): column {column} does not exist')
         return self._column_names_and_types[column][0]
 
     def column_index(self: _ContainerItemType, column: str) -> int:
@@ -137,24 +279,104 @@ class ContainerItem(DataItemBase):
         self._column_names_and_types.append((name, column_type))
         col_index = len(self._column_names_and_types) - 1
         self._names_dict[name] = col_index
-        data_item: Union[AllowedBaseTypes, DataItemBase] = value  # If this is a ContainerItem
+        # If this is a ContainerItem or ArrayDataItem
+        data_item: Union[AllowedBaseTypes, DataItemBase] = value
         if type(value) is datetime or value is None:
             data_item = DataItem(value)
-        elif not isinstance(value, ContainerItem):
+        elif not isinstance(value, DataItemBase):
             data_item = DataItem(column_type(value))
         data_item._my_column_in_container = col_index  # Sneaking a private member access!
+        data_item._my_row_in_container = 0  # Sneaking a private member access!
         data_item._my_container_touch = self._touch  # Sneaking a private member access!
+        data_item._item_change_callback = self._column_changed  # Sneaking a private member access!
+        if self._lock is not None:
+            ContainerItem._share_lock(data_item, self._lock)
         self._column_data.append([data_item])
+        self._columns_changed(col_index)
         return data_item
 
+    def _columns_changed(self: _ContainerItemType, column: int) -> None:
+        """A column was added or removed."""
+        self._invalidate_hash(column)
+        for view in list(self._views):
+            view._source_columns_changed()
+
+    def _column_changed(self: _ContainerItemType, row: int, column: int) -> None:
+        """A cell was changed. Without a dependency engine, that is the end of it."""
+        if self._subscriptions:
+            self._notify_subscribers((column, ), row)
+
+    def subscribe(
+        self: _ContainerItemType,
+        callback: Callable[[Any, Dict[str, AllowedBaseTypes]], None],
+        columns: Optional[Iterable[Union[int, str]]] = None,
+        change_filter: Optional[Callable[[str, AllowedBaseTypes], bool]] = None,
+        weak: bool = False,
+    ) -> Subscription:
+        """
+        Call callback(container, changes) when columns change. changes is column name -> final
+        value of the changed columns.
+            columns: Only these columns. None means all columns.
+            change_filter: Called with a column name and value. A false return drops the change.
+            weak: Do not keep the callback (or the object whose method it is) alive
+        The changes a system makes are delivered once, after the system settles. The changes of
+        other containers are delivered as they happen, one cell at a time, with the value of the
+        row that changed.
+        """
+        column_set = None
+        if columns is not None:
+            column_set = frozenset(
+                self.column_index(col) if type(col) is str else col for col in columns
+            )
+        subscription = Subscription(self, callback, column_set, change_filter, weak)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def _notify_subscribers(self: _ContainerItemType,
+                            columns: Iterable[int],
+                            row: int = 0) -> None:
+        """Deliver the final values of the changed columns in the row to the subscribers."""
+        changes: Dict[int, Tuple[str, AllowedBaseTypes]] = {
+            col: (self._column_names_and_types[col][0],
+                  self._column_data[col][row].get_value()
+                  if len(self._column_data[col]) > row else None)
+            for col in columns
+            if self._column_data[col] is not None
+        }
+        for subscription in list(self._subscriptions):
+            callback = subscription.callback()
+            if callback is None:  # A weak callback that is gone
+                subscription.unsubscribe()
+                continue
+            delivered: Dict[str, AllowedBaseTypes] = {
+                name: value
+                for col, (name, value) in changes.items()
+                if (subscription.columns is None or col in subscription.columns) and
+                (subscription.change_filter is None or subscription.change_filter(name, value))
+            }
+            if delivered:
+                callback(self, delivered)
+
     def remove_column(self: _ContainerItemType, column: Union[int, str]) -> None:
         """Remove the given column."""
         column_num = self._names_dict.get(column) if type(column) is str else column
-        if column_num is None or column_num < 0 or column_num >= len(self._column_data):
+        if not self._column_exists(column_num):
             raise IndexError(f'ContainerItem::remove_column(): column {column} does not exist')
-        del self._column_names_and_types[column_num]
-        del self._column_data[column_num]
-        self._names_dict = {nt[0]: idx for idx, nt in enumerate(self._column_names_and_types)}
+        for data_item in self._column_data[column_num]:  # Changes to it must not reach us
+            data_item._item_change_callback = None
+            data_item._my_container_touch = None
+            data_item._my_column_in_container = None
+            data_item._my_row_in_container = None
+        del self._names_dict[self._column_names_and_types[column_num][0]]
+        self._column_names_and_types[column_num] = None
+        self._column_data[column_num] = None
+        if column_num in self._aggregates:
+            del self._aggregates[column_num]
+            for aggregate_columns in self._aggregate_sources.values():
+                if column_num in aggregate_columns:
+                    aggregate_columns.remove(column_num)
+        self._aggregate_sources.pop(column_num, None)
+        self._columns_changed(column_num)
 
     def add_integer_column(
         self: _ContainerItemType, name: str, value: Union[int, None]
@@ -196,6 +418,58 @@ class ContainerItem(DataItemBase):
         """Add a container column."""
         return self._add_column(name, value, ContainerItem)
 
+    def add_array_column(self: _ContainerItemType, name: str, value: Any) -> DataItemBase:
+        """Add a column of NumPy arrays (see ArrayDataItem). The value is copied."""
+        return self._add_column(name, ArrayDataItem(value), ArrayDataItem)
+
+    def add_aggregate_column(
+        self: _ContainerItemType,
+        name: str,
+        source_column: Union[int, str],
+        aggregate: Aggregate,
+    ) -> DataItemBase:
+        """
+        Add a float column that holds an aggregate (e.g. RollingMean, Ewma, RollingMax) of the
+        source column. Every row added to the source column updates the aggregate in O(1)
+        amortized time. The rows the source column already has are not aggregated.
+        """
+        source_index = (
+            self.column_index(source_column) if type(source_column) is str else source_column
+        )
+        if not self._column_exists(source_index):
+            raise IndexError(
+                f'ContainerItem::add_aggregate_column(): column {source_column} does not exist'
+            )
+        data_item = self.add_float_column(name, aggregate.get_value())
+        aggregate_index = self.column_index(name)
+        self._aggregates[aggregate_index] = aggregate
+        self._follow_aggregate_source(source_index, aggregate_index)
+        return data_item
+
+    def _follow_aggregate_source(
+        self: _ContainerItemType, source_column: int, aggregate_column: int
+    ) -> None:
+        """Arrange for the aggregate column to be updated when rows are added to the source."""
+        self._aggregate_sources.setdefault(source_column, []).append(aggregate_column)
+
+    def _update_aggregate(
+        self: _ContainerItemType, source_column: int, aggregate_column: int
+    ) -> bool:
+        """Feed the last value of the source column to the aggregate. Was the value changed?"""
+        value = self._column_data[source_column][-1].get_value()
+        if value is None:
+            return False
+        aggregate = self._aggregates[aggregate_column]
+        aggregate.update(value)
+        aggregate_item = self._column_data[aggregate_column][0]
+        old_value = aggregate_item.get_value()
+        new_value = aggregate.get_value()
+        if new_value is None:
+            aggregate_item.set_to_null()
+        else:
+            aggregate_item.set_value(new_value)
+        return new_value != old_value
+
     def add_row(
         self: _ContainerItemType,
         column: Union[str, int],
@@ -203,9 +477,13 @@ class ContainerItem(DataItemBase):
     ) -> DataItemBase:
         """Add a row to the given column."""
         data_index = self._names_dict.get(column) if type(column) is str else column
-        if data_index is None or data_index < 0 or data_index >= len(self._column_data):
+        if not self._column_exists(data_index):
             raise RuntimeError(f'ContainerItem::add_row(): column {str(column)} does not exist')
 
+        if (self._column_names_and_types[data_index][1] is ArrayDataItem and
+                not isinstance(value, ArrayDataItem)):
+            value = ArrayDataItem(value)
+
         # Special handling for null columns: if a column was originally added as null, allow it to
         # change type. After that this column could only have rows of null or this type.
         if (self._column_names_and_types[data_index][1] is type(None) and
@@ -219,14 +497,23 @@ class ContainerItem(DataItemBase):
                 f'value {str(value)}'
             )
 
-        data_item = DataItem(value) if not isinstance(value, ContainerItem) else value
+        data_item = DataItem(value) if not isinstance(value, DataItemBase) else value
+        data_item._my_column_in_container = data_index  # Sneaking a private member access!
+        data_item._my_row_in_container = len(self._column_data[data_index])
+        data_item._my_container_touch = self._touch  # Sneaking a private member access!
+        data_item._item_change_callback = self._column_changed  # Sneaking a private member access!
+        if self._lock is not None:
+            ContainerItem._share_lock(data_item, self._lock)
         self._column_data[data_index].append(data_item)
+        self._row_changed(data_item._my_row_in_container, data_index)
+        for aggregate_column in self._aggregate_sources.get(data_index, ()):
+            self._update_aggregate(data_index, aggregate_column)
         return data_item
 
     def remove_row(self: _ContainerItemType, column: Union[str, int], row_index: int) -> None:
         """Remove the row for the given column."""
         column_num = self._names_dict.get(column) if type(column) is str else column
-        if column_num is None or column_num < 0 or column_num >= len(self._column_data):
+        if not self._column_exists(column_num):
             raise IndexError(f'ContainerItem::remove_row(): column {column} does not exist')
         row_len = len(self._column_data[column_num])
         if row_len <= row_index:
@@ -235,5 +522,60 @@ class ContainerItem(DataItemBase):
         if row_len == 1:
             self.remove_column(column_num)
         else:
-            del self._column_data[column_num][row_index]
+            column_data = self._column_data[column_num]
+            data_item = column_data[row_index]
+            data_item._my_container_touch = None  # Changes to it must not reach us
+            data_item._item_change_callback = None
+            data_item._my_column_in_container = None
+            data_item._my_row_in_container = None
+            del column_data[row_index]
+            for row in range(row_index, len(column_data)):
+                column_data[row]._my_row_in_container = row
+            self._invalidate_hash(column_num)
+            for view in list(self._views):
+                view._source_rows_changed(row_index)
+
+    def memory_usage(self: _ContainerItemType) -> Dict[str, Any]:
+        """
+        Deep memory usage in bytes, broken down as:
+            total: Everything below
+            columns: Column name -> {'values': bytes,
+                                     'nested': row -> breakdown of nested containers}
+            dependencies: Dependency metadata (only for system items)
+            other: The object itself, column names and types, aggregates, etc.
+        Shared objects are counted once, where they are first found. Memory shared with other
+        processes (e.g. mapped files) is not counted.
+        """
+        return self._memory_usage(set())
+
+    def _memory_usage(self: _ContainerItemType, seen: Set[int]) -> Dict[str, Any]:
+        """memory_usage() that does not count the objects in seen."""
+        seen.add(id(self))
+        columns: Dict[str, Dict[str, Any]] = {}
+        for col_idx, name_and_type in enumerate(self._column_names_and_types):
+            if name_and_type is None:
+                continue
+            column = self._column_data[col_idx]
+            seen.add(id(column))
+            values = sys.getsizeof(column)
+            nested: Dict[int, Dict[str, Any]] = {}
+            for row, data_item in enumerate(column):
+                if isinstance(data_item, ContainerItem):
+                    nested[row] = data_item._memory_usage(seen)
+                    values += nested[row]['total']
+                else:
+                    values += deep_sizeof(data_item, seen)
+            columns[name_and_type[0]] = {'values': values, 'nested': nested} if nested else {
+                'values': values
+            }
+        result: Dict[str, Any] = {'columns': columns}
+        result.update(self._metadata_memory_usage(seen))
+        seen.discard(id(self))
+        result['other'] = deep_sizeof(self, seen)
+        result['total'] = (sum(column['values'] for column in columns.values()) +
+                           sum(size for key, size in result.items() if key != 'columns'))
+        return result
 
+    def _metadata_memory_usage(self: _ContainerItemType, seen: Set[int]) -> Dict[str, int]:
+        """Memory usage of metadata that derived classes break out of 'other'."""
+        return {}
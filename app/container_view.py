@@ -0,0 +1,279 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar, Union
+
+from .array_data_item import ArrayDataItem
+from .container_delta import _copy_container
+from .container_item import ContainerItem
+from .data_item import DataItem
+from .data_item_base import AllowedBaseTypes, DataItemBase
+
+
+_ContainerViewType = TypeVar('_ContainerViewType', bound='ContainerView')
+# Called with column name -> value of a source row. A true return keeps the row in the view.
+_RowPredicate = Callable[[Dict[str, AllowedBaseTypes]], bool]
+
+
+class ContainerView(ContainerItem):
+    """
+    A materialized view of the rows of a source container that match a predicate, projected on
+    some of its columns. Row r of the source is the r'th row of each of its columns.
+        1. The view is kept up to date from the change notifications of the source. A changed
+           cell costs O(log(rows)) plus the predicate. Adding, removing or shifting view rows
+           costs what it costs in a list. Adding or removing source columns rebuilds the view.
+        2. The view is a container. It can be read like one, subscribed to, viewed again or put
+           in a column of a system item, whose dependencies on that column then run when the
+           view changes.
+        3. The view cannot be changed directly (that raises TypeError). Changes to mapped columns
+           of the source (see import_column()) are not seen.
+    The predicate is called with column name -> value of a source row. Cells that a row does
+    not have are None. No predicate keeps every row. No columns keeps every column.
+    """
+
+    def __init__(
+        self: _ContainerViewType,
+        source: ContainerItem,
+        columns: Optional[Iterable[Union[int, str]]] = None,
+        predicate: Optional[_RowPredicate] = None,
+    ) -> None:
+        """Initialize."""
+        super().__init__()
+        self._source: ContainerItem = source
+        self._predicate: Optional[_RowPredicate] = predicate
+        # Names of the source columns in the view. None means all of them.
+        self._projection: Optional[List[str]] = None
+        if columns is not None:
+            self._projection = [
+                source.column_name(col) if type(col) is int else source.column_name(
+                    source.column_index(col)
+                )
+                for col in columns
+            ]
+        self._source_columns: List[int] = []  # View column -> source column
+        self._view_columns: Dict[int, int] = {}  # Source column -> view column
+        self._source_rows: List[int] = []  # View row -> source row, in order
+        self._source_row_count: int = 0  # Rows of the source, when it was last seen
+        self._rebuild()
+        source._views.append(self)
+
+    def source(self: _ContainerViewType) -> ContainerItem:
+        """The container this is a view of."""
+        return self._source
+
+    def source_row(self: _ContainerViewType, row: int) -> int:
+        """The source row of the given row of the view."""
+        return self._source_rows[row]
+
+    def detach(self: _ContainerViewType) -> None:
+        """Stop following the source. The view keeps its rows as they are."""
+        if self in self._source._views:
+            self._source._views.remove(self)
+
+    def _count_source_rows(self: _ContainerViewType) -> int:
+        """Number of rows of the longest source column."""
+        return max((len(column) for column in self._source._column_data if column is not None),
+                   default=0)
+
+    def _matches(self: _ContainerViewType, row: int) -> bool:
+        """Does the source row belong in the view?"""
+        if row >= self._source_row_count:
+            return False
+        if self._predicate is None:
+            return True
+        source = self._source
+        return bool(self._predicate({
+            name_and_type[0]: (source._column_data[col][row].get_value()
+                               if row < len(source._column_data[col]) else None)
+            for col, name_and_type in enumerate(source._column_names_and_types)
+            if name_and_type is not None
+        }))
+
+    def _source_item(self: _ContainerViewType,
+                     view_column: int,
+                     row: int) -> Optional[DataItemBase]:
+        """The source data item of the view column in the source row, if there is one."""
+        column = self._source._column_data[self._source_columns[view_column]]
+        return column[row] if row < len(column) else None
+
+    def _new_item(self: _ContainerViewType, view_column: int, row: int) -> DataItemBase:
+        """A view data item with a copy of the source value."""
+        source_item = self._source_item(view_column, row)
+        if isinstance(source_item, ContainerItem):
+            return _copy_container(source_item)
+        if self._column_names_and_types[view_column][1] is ArrayDataItem:
+            return ArrayDataItem(None if source_item is None else source_item.get_value())
+        return DataItem(None if source_item is None else source_item.get_value())
+
+    def _update_item(self: _ContainerViewType, view_column: int, view_row: int) -> bool:
+        """Copy the source value to the view data item. Was it changed?"""
+        data_item = self._column_data[view_column][view_row]
+        source_item = self._source_item(view_column, self._source_rows[view_row])
+        if isinstance(source_item, ContainerItem) != data_item.is_container():
+            # E.g. a container where the source had no row before. It needs a new data item.
+            data_item._my_container_touch = None
+            data_item = self._new_item(view_column, self._source_rows[view_row])
+            self._adopt(data_item, view_column, view_row)
+            self._column_data[view_column][view_row] = data_item
+            data_item._changed()
+            return True
+        version = data_item._version
+        if isinstance(source_item, ContainerItem):
+            data_item.set_value(source_item)
+        elif source_item is None or source_item.get_value() is None:
+            if not data_item.is_container():
+                data_item.set_to_null()
+        else:
+            data_item.set_value(source_item.get_value())
+        return data_item._version != version
+
+    def _adopt(self: _ContainerViewType, data_item: DataItemBase, column: int, row: int) -> None:
+        """Make the data item report its changes to the view."""
+        data_item._my_column_in_container = column  # Sneaking a private member access!
+        data_item._my_row_in_container = row  # Sneaking a private member access!
+        data_item._my_container_touch = self._touch  # Sneaking a private member access!
+        data_item._item_change_callback = self._column_changed  # Sneaking a private member access!
+        if self._lock is not None:
+            ContainerItem._share_lock(data_item, self._lock)
+
+    def _renumber(self: _ContainerViewType, from_row: int) -> None:
+        """Tell the data items of the shifted rows their new row."""
+        for column in self._column_data:
+            for row in range(from_row, len(column)):
+                column[row]._my_row_in_container = row
+
+    def _refresh_row(self: _ContainerViewType, row: int) -> Optional[int]:
+        """
+        Bring a source row up to date in the view. Returns the first view row that was added or
+        removed, if any. Changed values report their own changes.
+        """
+        view_row = bisect_left(self._source_rows, row)
+        included = view_row < len(self._source_rows) and self._source_rows[view_row] == row
+        matches = self._matches(row)
+        if included and matches:
+            for view_column in range(len(self._source_columns)):
+                self._update_item(view_column, view_row)
+            return None
+        if matches:
+            self._source_rows.insert(view_row, row)
+            for view_column, column in enumerate(self._column_data):
+                data_item = self._new_item(view_column, row)
+                self._adopt(data_item, view_column, view_row)
+                column.insert(view_row, data_item)
+        elif included:
+            del self._source_rows[view_row]
+            for column in self._column_data:
+                data_item = column.pop(view_row)
+                data_item._my_container_touch = None  # Changes to it must not reach us
+                data_item._my_column_in_container = None
+                data_item._my_row_in_container = None
+        else:
+            return None
+        self._renumber(view_row)
+        return view_row
+
+    def _rows_changed(self: _ContainerViewType, view_row: Optional[int]) -> None:
+        """Rows were added to or removed from the view, starting with the given row."""
+        if view_row is None:
+            return
+        for column in range(len(self._column_data)):
+            self._invalidate_hash(column)
+        for view in list(self._views):
+            view._source_rows_changed(view_row)
+        if self._subscriptions:
+            self._notify_subscribers(range(len(self._column_data)))
+        self._touch()
+
+    def _rebuild(self: _ContainerViewType) -> None:
+        """Build the view from scratch."""
+        source = self._source
+        self._source_columns = [
+            col for col, name_and_type in enumerate(source._column_names_and_types)
+            if name_and_type is not None
+        ] if self._projection is None else [
+            source._names_dict[name] for name in self._projection if name in source._names_dict
+        ]
+        self._view_columns = {col: idx for idx, col in enumerate(self._source_columns)}
+        self._column_names_and_types = [source._column_names_and_types[col]
+                                        for col in self._source_columns]
+        self._names_dict = {name_and_type[0]: idx
+                            for idx, name_and_type in enumerate(self._column_names_and_types)}
+        self._column_data = [[] for _ in self._source_columns]
+        self._source_row_count = self._count_source_rows()
+        self._source_rows = [row for row in range(self._source_row_count) if self._matches(row)]
+        for view_column, column in enumerate(self._column_data):
+            for view_row, row in enumerate(self._source_rows):
+                data_item = self._new_item(view_column, row)
+                self._adopt(data_item, view_column, view_row)
+                column.append(data_item)
+        self._column_hashes = {}
+        self._invalidate_hash(None)
+
+    def _sync_column_types(self: _ContainerViewType) -> None:
+        """Null source columns get a type with their first non-null row."""
+        for view_column, col in enumerate(self._source_columns):
+            self._column_names_and_types[view_column] = self._source._column_names_and_types[col]
+
+    # Notifications from the source
+
+    def _source_cell_changed(self: _ContainerViewType, row: int, column: int) -> None:
+        """A cell of the source was changed or added."""
+        if (self._predicate is None and column not in self._view_columns and
+                row < self._source_row_count):
+            return  # It cannot change the view
+        self._sync_column_types()
+        self._source_row_count = max(self._source_row_count, row + 1)
+        self._rows_changed(self._refresh_row(row))
+
+    def _source_rows_changed(self: _ContainerViewType, row: int) -> None:
+        """The source rows from the given row on may have changed (e.g. a row was removed)."""
+        old_row_count = self._source_row_count
+        self._source_row_count = self._count_source_rows()
+        first_changed: Optional[int] = None
+        for source_row in range(row, max(old_row_count, self._source_row_count)):
+            view_row = self._refresh_row(source_row)
+            if first_changed is None:
+                first_changed = view_row
+        self._rows_changed(first_changed)
+
+    def _source_columns_changed(self: _ContainerViewType) -> None:
+        """Columns were added to, removed from or replaced in the source."""
+        self._rebuild()
+        for view in list(self._views):
+            view._source_columns_changed()
+        if self._subscriptions:
+            self._notify_subscribers(range(len(self._column_data)))
+        self._touch()
+
+    # The view cannot be changed directly
+
+    def _set_value_hook(self: _ContainerViewType,
+                        value: Union[DataItemBase, AllowedBaseTypes]) -> bool:
+        """Views cannot be assigned."""
+        raise TypeError('ContainerView::set_value(): Views cannot be changed directly')
+
+    def _add_column(self: _ContainerViewType,
+                    name: str,
+                    value: Union[AllowedBaseTypes, DataItemBase],
+                    column_type: type) -> DataItemBase:
+        """Views cannot be changed directly."""
+        raise TypeError('ContainerView::_add_column(): Views cannot be changed directly')
+
+    def remove_column(self: _ContainerViewType, column: Union[int, str]) -> None:
+        """Views cannot be changed directly."""
+        raise TypeError('ContainerView::remove_column(): Views cannot be changed directly')
+
+    def add_row(self: _ContainerViewType,
+                column: Union[str, int],
+                value: Union[AllowedBaseTypes, ContainerItem]) -> DataItemBase:
+        """Views cannot be changed directly."""
+        raise TypeError('ContainerView::add_row(): Views cannot be changed directly')
+
+    def remove_row(self: _ContainerViewType, column: Union[str, int], row_index: int) -> None:
+        """Views cannot be changed directly."""
+        raise TypeError('ContainerView::remove_row(): Views cannot be changed directly')
@@ -6,7 +6,8 @@ Distributed under the BSD Software License (see file LICENSE)
 """
 
 from datetime import datetime
-from typing import Callable, TypeVar, Union
+from threading import RLock
+from typing import Callable, Optional, TypeVar, Union
 
 
 AllowedBaseTypes = Union[int, float, str, bool, datetime, None]
@@ -37,11 +38,20 @@ class DataItemBase(object):
         # be triggered only on containers with one row. If we decide to have dependencies on many
         # rows (e.g. like Excel), we need to also store the row index here
         self._my_column_in_container: int = None
+        # The row index, in case this object is inside a container. It tells the container (and
+        # its views) which row changed.
+        self._my_row_in_container: int = None
         # This is the _touch() method of the container, in case this data item is inside
         # another container
         self._my_container_touch: _TouchMethod = None
         # Current count of circles made around a circular dependency
         self._dependency_circle_count: int = 0
+        # Incremented every time the value changes, so dependencies can tell if their inputs
+        # have changed since they last ran
+        self._version: int = 0
+        # If set, changes to this data item are made under this lock. All the data items of a
+        # system share the system lock (see SystemItem.enable_locking())
+        self._lock: Optional[RLock] = None
 
     def get_value(self: _DataItemBaseType) -> AllowedBaseTypes:
         """Abstract get value."""
@@ -74,7 +84,7 @@ class DataItemBase(object):
     def _touch(self: _DataItemBaseType) -> None:
         """Trigger dependency."""
         if self._item_change_callback is not None:
-            self._item_change_callback(0, self._my_column_in_container)
+            self._item_change_callback(self._my_row_in_container, self._my_column_in_container)
 
     def __str__(self: _DataItemBaseType) -> str:
         """String representation."""
@@ -119,15 +129,39 @@ class DataItemBase(object):
 
     def set_to_null(self: _DataItemBaseType) -> None:
         """This is the only way to set an existing non-null DataItem to null"""
+        if self._lock is not None:
+            with self._lock:
+                self._set_to_null()
+        else:
+            self._set_to_null()
+
+    def _set_to_null(self: _DataItemBaseType) -> None:
+        """Set to null and trigger the dependencies."""
         if self._set_to_null_hook():  # A true return means something was changed
-            self._touch()  # Trigger the dependencies, if they are set up.
-            if self._my_container_touch is not None:
-                self._my_container_touch()
+            self._changed()
 
     def set_value(self: _DataItemBaseType,
                   value: Union[_DataItemBaseType, AllowedBaseTypes]) -> None:
         """Set value method."""
+        if self._lock is not None:
+            with self._lock:
+                self._set_value(value)
+        else:
+            self._set_value(value)
+
+    def _set_value(self: _DataItemBaseType,
+                   value: Union[_DataItemBaseType, AllowedBaseTypes]) -> None:
+        """Set the value and trigger the dependencies."""
         if self._set_value_hook(value):  # A true return means something was changed
-            self._touch()  # Trigger the dependencies, if they are set up.
-            if self._my_container_touch is not None:
-                self._my_container_touch()
+            self._changed()
+
+    def _changed(self: _DataItemBaseType) -> None:
+        """The value was changed. Trigger the dependencies."""
+        self._version += 1
+        if self._my_container_touch is not None:
+            # Tell the container which cell changed. Sneaking a private member access!
+            self._my_container_touch.__self__._row_changed(self._my_row_in_container,
+                                                           self._my_column_in_container)
+        self._touch()  # Trigger the dependencies, if they are set up.
+        if self._my_container_touch is not None:
+            self._my_container_touch()
@@ -0,0 +1,235 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+import json
+from typing import Any, Dict, List, Set, TypeVar
+
+
+_GraphAnalysisType = TypeVar('_GraphAnalysisType', bound='GraphAnalysis')
+
+
+def _dot_string(text: str) -> str:
+    """Quote the text as a DOT string."""
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+class GraphAnalysis(object):
+    """
+    Static analysis of the dependency graph of a SystemItem, once it is wired.
+        1. The graph nodes are columns and the edges are dependencies (independent -> dependent).
+        2. Strongly connected components (SCC) are the circular dependencies. The components are
+           kept in topological order, so upstream components come first.
+        3. Costs are estimated from the callback timings recorded by the system, if any (see
+           SystemItem.set_callback_timing()).
+    The analysis is a snapshot. It must be redone if the system is rewired.
+    """
+
+    def __init__(self: _GraphAnalysisType, system) -> None:
+        """Initialize."""
+        super().__init__()
+        self._column_names: Dict[int, str] = {
+            col_idx: name_and_type[0]
+            for col_idx, name_and_type in enumerate(system._column_names_and_types)
+            if name_and_type is not None
+        }
+        self._circle_max: int = system._dependency_circle_max
+        # Column -> dependent columns
+        self._edges: Dict[int, List[int]] = {col: [] for col in self._column_names}
+        # Column -> names of actions
+        self._actions: Dict[int, List[str]] = {col: [] for col in self._column_names}
+        # Column -> mean time of its dependency and action callbacks, in seconds
+        self._callback_costs: Dict[int, float] = {col: 0.0 for col in self._column_names}
+        for col_idx, dep_list in enumerate(system._dependency_vector):
+            for dep in dep_list or ():
+                if dep.callback is None:
+                    continue
+                if dep.dependent_column is None:
+                    self._actions[col_idx].append(dep.callback.__name__)
+                elif dep.dependent_column not in self._edges[col_idx]:
+                    self._edges[col_idx].append(dep.dependent_column)
+                if dep.calls > 0:
+                    self._callback_costs[col_idx] += dep.total_time / dep.calls
+
+        self._components: List[List[int]] = self._strongly_connected_components()
+        self._component_of: Dict[int, int] = {
+            col: comp_idx for comp_idx, comp in enumerate(self._components) for col in comp
+        }
+        # Component -> downstream components
+        self._component_edges: List[Set[int]] = [set() for _ in self._components]
+        for col, dependents in self._edges.items():
+            for dependent in dependents:
+                if self._component_of[col] != self._component_of[dependent]:
+                    self._component_edges[self._component_of[col]].add(
+                        self._component_of[dependent]
+                    )
+
+    def _strongly_connected_components(self: _GraphAnalysisType) -> List[List[int]]:
+        """Iterative Tarjan. Returns the components in topological order."""
+        index_of: Dict[int, int] = {}
+        low_link: Dict[int, int] = {}
+        on_stack: Set[int] = set()
+        stack: List[int] = []
+        components: List[List[int]] = []
+        for root in self._edges:
+            if root in index_of:
+                continue
+            work = [(root, 0)]
+            while work:
+                node, edge_idx = work.pop()
+                if edge_idx == 0:
+                    index_of[node] = low_link[node] = len(index_of)
+                    stack.append(node)
+                    on_stack.add(node)
+                recurse = False
+                dependents = self._edges[node]
+                while edge_idx < len(dependents):
+                    dependent = dependents[edge_idx]
+                    edge_idx += 1
+                    if dependent not in index_of:
+                        work.append((node, edge_idx))
+                        work.append((dependent, 0))
+                        recurse = True
+                        break
+                    if dependent in on_stack:
+                        low_link[node] = min(low_link[node], index_of[dependent])
+                if recurse:
+                    continue
+                if low_link[node] == index_of[node]:
+                    component: List[int] = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(sorted(component))
+                if work:
+                    parent = work[-1][0]
+                    low_link[parent] = min(low_link[parent], low_link[node])
+        # Tarjan finds the components in reverse topological order
+        components.reverse()
+        return components
+
+    def _is_circular(self: _GraphAnalysisType, comp_idx: int) -> bool:
+        """Is the component a circular dependency?"""
+        component = self._components[comp_idx]
+        return len(component) > 1 or component[0] in self._edges[component[0]]
+
+    def _component_weight(self: _GraphAnalysisType, comp_idx: int) -> int:
+        """Number of dependency hops the engine makes inside a component."""
+        if self._is_circular(comp_idx):
+            return len(self._components[comp_idx]) * self._circle_max
+        return 0
+
+    def _reachable_components(self: _GraphAnalysisType, column: int) -> Set[int]:
+        """The components downstream of the column, including its own."""
+        seen: Set[int] = {self._component_of[column]}
+        work: List[int] = [self._component_of[column]]
+        while work:
+            for downstream in self._component_edges[work.pop()]:
+                if downstream not in seen:
+                    seen.add(downstream)
+                    work.append(downstream)
+        return seen
+
+    def components(self: _GraphAnalysisType) -> List[List[str]]:
+        """The strongly connected components, by column name, in topological order."""
+        return [[self._column_names[col] for col in comp] for comp in self._components]
+
+    def cycles(self: _GraphAnalysisType) -> List[List[str]]:
+        """The circular dependencies, by column name."""
+        return [
+            [self._column_names[col] for col in comp]
+            for comp_idx, comp in enumerate(self._components)
+            if self._is_circular(comp_idx)
+        ]
+
+    def topological_order(self: _GraphAnalysisType) -> List[str]:
+        """Column names in an order that is consistent with the dependencies between components."""
+        return [self._column_names[col] for comp in self._components for col in comp]
+
+    def fan_out(self: _GraphAnalysisType, column: int) -> int:
+        """Number of other columns that may change when the column changes."""
+        reachable = sum(len(self._components[comp]) for comp in self._reachable_components(column))
+        # A column is only its own dependent if it is in a circle
+        return reachable - 1
+
+    def critical_path_depth(self: _GraphAnalysisType, column: int) -> int:
+        """
+        The longest chain of dependency hops that a change of the column can set off. Going
+        around a circle counts as many hops as the circle has columns, times the circle max.
+        """
+        depth: Dict[int, int] = {}
+        # Components downstream come later in topological order, so walk them backwards
+        reachable = self._reachable_components(column)
+        for comp_idx in sorted(reachable, reverse=True):
+            downstream = [depth[d] + 1 for d in self._component_edges[comp_idx]]
+            depth[comp_idx] = self._component_weight(comp_idx) + max(downstream, default=0)
+        return depth[self._component_of[column]]
+
+    def estimated_cost(self: _GraphAnalysisType, column: int) -> float:
+        """
+        Estimated time, in seconds, that it takes to propagate a change of the column, based on
+        the recorded callback timings. Callbacks in a circle are counted circle max times.
+        """
+        cost: float = 0.0
+        for comp_idx in self._reachable_components(column):
+            repeat = self._circle_max if self._is_circular(comp_idx) else 1
+            for col in self._components[comp_idx]:
+                cost += self._callback_costs[col] * repeat
+        return cost
+
+    def report(self: _GraphAnalysisType) -> Dict[str, Dict[str, Any]]:
+        """Fan-out, critical path depth and estimated cost of every independent column."""
+        return {
+            self._column_names[col]: {
+                'fan_out': self.fan_out(col),
+                'critical_path_depth': self.critical_path_depth(col),
+                'estimated_cost': self.estimated_cost(col),
+            }
+            for col in self._edges
+            if self._edges[col] or self._actions[col]
+        }
+
+    def to_json(self: _GraphAnalysisType) -> str:
+        """The graph and its analysis as JSON."""
+        return json.dumps({
+            'columns': [self._column_names[col] for col in self._edges],
+            'dependencies': [
+                [self._column_names[col], self._column_names[dependent]]
+                for col, dependents in self._edges.items()
+                for dependent in dependents
+            ],
+            'actions': {
+                self._column_names[col]: names for col, names in self._actions.items() if names
+            },
+            'components': self.components(),
+            'report': self.report(),
+        })
+
+    def to_dot(self: _GraphAnalysisType) -> str:
+        """
+        The graph in Graphviz DOT format. Circular dependencies are drawn as clusters.
+        Nodes are keyed by column index (and position, for actions). Names are only labels.
+        """
+        result: str = 'digraph dependencies {\n'
+        for col, name in self._column_names.items():
+            result += f'    c{col} [label={_dot_string(name)}];\n'
+        for comp_idx, comp in enumerate(self._components):
+            if self._is_circular(comp_idx):
+                result += f'    subgraph cluster_{comp_idx} {{\n        style=dashed;\n'
+                for col in comp:
+                    result += f'        c{col};\n'
+                result += '    }\n'
+        for col, dependents in self._edges.items():
+            for dependent in dependents:
+                result += f'    c{col} -> c{dependent};\n'
+            for position, action in enumerate(self._actions[col]):
+                result += f'    a{col}_{position} [label={_dot_string(action)}, shape=box];\n'
+                result += f'    c{col} -> a{col}_{position};\n'
+        result += '}\n'
+        return result
@@ -0,0 +1,238 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+from datetime import datetime
+import struct
+import time
+from typing import BinaryIO, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, TypeVar
+
+from .array_data_item import ArrayDataItem
+from .data_item_base import AllowedBaseTypes, DataItemBase
+from .mmap_container_item import _datetime_to_micros, _micros_to_datetime
+
+
+_SystemJournalType = TypeVar('_SystemJournalType', bound='SystemJournal')
+_JournalReplayerType = TypeVar('_JournalReplayerType', bound='JournalReplayer')
+
+# Journal layout:
+#     magic (8 bytes) | record | record | ...
+# Every record is a fixed header followed by a variable length payload:
+#     op (uint8) | timestamp in ns (uint64) | system id (uint32) | column (uint32) | payload length
+_MAGIC: bytes = b'LYNXJNL1'
+_RECORD_HEADER = struct.Struct('<BQIII')
+
+OP_SYSTEM: int = 0  # Payload is the UTF-8 key of a newly attached system
+OP_SET_VALUE: int = 1  # Payload is the encoded value
+OP_SET_TO_NULL: int = 2  # No payload
+OP_CHECKPOINT: int = 3  # Payload is the encoded value (or nothing for null) to verify against
+
+_VALUE_TAG = struct.Struct('<B')
+_VALUE_FORMATS: Dict[int, struct.Struct] = {
+    1: struct.Struct('<q'),  # int
+    2: struct.Struct('<d'),  # float
+    3: struct.Struct('<?'),  # bool
+    4: struct.Struct('<q'),  # datetime as microseconds since the epoch
+}
+_STR_TAG: int = 5
+_TYPE_TAGS: Dict[type, int] = {int: 1, float: 2, bool: 3, datetime: 4, str: _STR_TAG}
+
+
+def _encode_value(value: AllowedBaseTypes) -> bytes:
+    """Encode a scalar value with its type tag."""
+    if value is None:
+        return b''
+    tag = _TYPE_TAGS.get(type(value))
+    if tag is None:
+        raise TypeError(f'SystemJournal: values of type {type(value).__name__} cannot be '
+                        f'journaled')
+    if tag == _STR_TAG:
+        return _VALUE_TAG.pack(tag) + value.encode('utf-8')
+    return _VALUE_TAG.pack(tag) + _VALUE_FORMATS[tag].pack(
+        _datetime_to_micros(value) if tag == 4 else value
+    )
+
+
+def _is_journaled(data_item: DataItemBase) -> bool:
+    """Is the value of the data item journaled? Containers and arrays are not."""
+    return not data_item.is_container() and not isinstance(data_item, ArrayDataItem)
+
+
+def _decode_value(payload: bytes) -> AllowedBaseTypes:
+    """Decode a value encoded by _encode_value()."""
+    if not payload:
+        return None
+    tag = payload[0]
+    if tag == _STR_TAG:
+        return str(payload[1:], 'utf-8')
+    value = _VALUE_FORMATS[tag].unpack_from(payload, 1)[0]
+    return _micros_to_datetime(value) if tag == 4 else value
+
+
+class JournalRecord(NamedTuple):
+    """One decoded journal record."""
+
+    op: int
+    timestamp: int  # Nanoseconds since the epoch
+    system_id: int
+    column: int
+    value: AllowedBaseTypes  # The system key for OP_SYSTEM records
+
+
+class SystemJournal(object):
+    """
+    An append-only binary journal of the external changes made to SystemItems.
+    Only changes made from outside the dependency engine are recorded. Everything else is
+    recomputed by the dependencies when the journal is replayed. Changes to container and array
+    columns are not recorded.
+    This object is not multi-threaded safe.
+    """
+
+    def __init__(self: _SystemJournalType, path: str) -> None:
+        """Initialize."""
+        super().__init__()
+        self._file: BinaryIO = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(_MAGIC)
+        self._next_system_id: int = 0
+
+    def _write(self: _SystemJournalType,
+               op: int,
+               system_id: int,
+               column: int,
+               payload: bytes = b'') -> None:
+        """Append one record."""
+        timestamp = int(time.time() * 1e9)  # time.time_ns() needs Python 3.7
+        self._file.write(
+            _RECORD_HEADER.pack(op, timestamp, system_id, column, len(payload)) + payload
+        )
+
+    def attach(self: _SystemJournalType, system, key: str) -> None:
+        """
+        Start journaling the given system. The key identifies the system when the journal is
+        replayed, so it must be unique in the journal.
+        """
+        if system._journal is not None:
+            raise RuntimeError(f'SystemJournal::attach(): system {key} is already journaled')
+        system_id = self._next_system_id
+        self._next_system_id += 1
+        self._write(OP_SYSTEM, system_id, 0, key.encode('utf-8'))
+        system._journal = self
+        system._journal_id = system_id
+
+    def record(self: _SystemJournalType,
+               system_id: int,
+               column: int,
+               value: AllowedBaseTypes) -> None:
+        """Record an external change of a column to the given value."""
+        if value is None:
+            self._write(OP_SET_TO_NULL, system_id, column)
+        else:
+            self._write(OP_SET_VALUE, system_id, column, _encode_value(value))
+
+    def checkpoint(self: _SystemJournalType, system) -> None:
+        """Record the current values of all scalar columns, so a replay can verify them."""
+        for col_idx, column_data in enumerate(system._column_data):
+            if column_data is not None and _is_journaled(column_data[0]):
+                self._write(OP_CHECKPOINT,
+                            system._journal_id,
+                            col_idx,
+                            _encode_value(column_data[0].get_value()))
+
+    def flush(self: _SystemJournalType) -> None:
+        """Flush the buffered records to the file."""
+        self._file.flush()
+
+    def close(self: _SystemJournalType) -> None:
+        """Close the journal file."""
+        self._file.close()
+
+
+class JournalReplayer(object):
+    """
+    Replay a journal through fresh (or restored) SystemItem instances.
+    Checkpoint records are verified against the replayed values and any mismatches are kept in
+    mismatches().
+    """
+
+    def __init__(self: _JournalReplayerType, path: str) -> None:
+        """Initialize."""
+        super().__init__()
+        self._path: str = path
+        # (system key, column name, journaled value, replayed value)
+        self._mismatches: List[Tuple[str, str, AllowedBaseTypes, AllowedBaseTypes]] = []
+
+    def records(self: _JournalReplayerType) -> Iterator[JournalRecord]:
+        """Iterate over all records in the journal."""
+        with open(self._path, 'rb') as file:
+            if file.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f'JournalReplayer::records(): {self._path} is not a journal')
+            while True:
+                header = file.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:  # A torn last record is ignored
+                    return
+                op, timestamp, system_id, column, payload_len = _RECORD_HEADER.unpack(header)
+                payload = file.read(payload_len)
+                if len(payload) < payload_len:
+                    return
+                value = str(payload, 'utf-8') if op == OP_SYSTEM else _decode_value(payload)
+                yield JournalRecord(op, timestamp, system_id, column, value)
+
+    def mismatches(self: _JournalReplayerType
+                   ) -> List[Tuple[str, str, AllowedBaseTypes, AllowedBaseTypes]]:
+        """Checkpoint mismatches found by the last replay."""
+        return self._mismatches
+
+    def replay(
+        self: _JournalReplayerType,
+        factory: Callable[[str], object],
+        speed: Optional[float] = None,
+        systems: Optional[Dict[str, object]] = None,
+        after: int = 0,
+    ) -> Dict[str, object]:
+        """
+        Replay the journal and return the systems by key.
+            factory: Called with a system key to construct a fresh system
+            speed: None replays as fast as possible. Otherwise, it is a multiple of the recorded
+                   speed (e.g. 1.0 is the recorded speed, 2.0 is twice as fast).
+            systems: Already restored systems (e.g. from a snapshot) by key. The factory is only
+                     called for keys that are not here.
+            after: Only replay changes recorded after this timestamp (ns). Together with systems,
+                   this replays the tail of a journal on top of a snapshot.
+        """
+        systems = {} if systems is None else systems
+        by_id: Dict[int, object] = {}
+        keys: Dict[int, str] = {}
+        self._mismatches = []
+        first_timestamp: Optional[int] = None
+        start: float = time.perf_counter()
+        for record in self.records():
+            if record.op == OP_SYSTEM:
+                if record.value not in systems:
+                    systems[record.value] = factory(record.value)
+                by_id[record.system_id] = systems[record.value]
+                keys[record.system_id] = record.value
+                continue
+            if record.timestamp <= after:
+                continue
+            if speed is not None:
+                if first_timestamp is None:
+                    first_timestamp = record.timestamp
+                due = (record.timestamp - first_timestamp) / 1e9 / speed
+                delay = due - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            data_item = by_id[record.system_id].get(column=record.column)
+            if record.op == OP_SET_VALUE:
+                data_item.set_value(record.value)
+            elif record.op == OP_SET_TO_NULL:
+                data_item.set_to_null()
+            elif record.op == OP_CHECKPOINT and data_item.get_value() != record.value:
+                self._mismatches.append((keys[record.system_id],
+                                         by_id[record.system_id].column_name(record.column),
+                                         record.value,
+                                         data_item.get_value()))
+        return systems
@@ -0,0 +1,124 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+from collections import deque
+import sys
+from threading import Event, Thread
+from types import BuiltinFunctionType, FunctionType, MethodType, ModuleType
+from typing import Any, Callable, Dict, List, Optional, Set, TypeVar
+
+from .timer_wheel import TimerWheel
+
+_MemorySamplerType = TypeVar('_MemorySamplerType', bound='MemorySampler')
+
+# Objects of these types are counted, but what they refer to is not. Bound methods would lead
+# back to the item that owns them (e.g. _my_container_touch), and a timer wheel to every system
+# with timers on it.
+_OPAQUE_TYPES = (type, ModuleType, FunctionType, BuiltinFunctionType, MethodType, memoryview,
+                 TimerWheel)
+
+
+def deep_sizeof(obj: Any, seen: Set[int]) -> int:
+    """
+    Size in bytes of the object and everything it refers to, except for the objects in seen.
+    Every object counted is added to seen, so shared objects are counted only once.
+    """
+    size: int = 0
+    work: List[Any] = [obj]
+    while work:
+        current = work.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        if isinstance(current, _OPAQUE_TYPES):
+            continue
+        if isinstance(current, dict):
+            work.extend(current.keys())
+            work.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset, deque)):
+            work.extend(current)
+        else:
+            if hasattr(current, '__dict__'):
+                work.append(current.__dict__)
+            for slot in getattr(type(current), '__slots__', ()):
+                if hasattr(current, slot):
+                    work.append(getattr(current, slot))
+    return size
+
+
+def flatten_memory_usage(usage: Dict[str, Any], prefix: str = '') -> Dict[str, int]:
+    """
+    Flatten a memory usage breakdown (see ContainerItem.memory_usage()) into metric name -> bytes.
+    Nested containers are flattened under their column and row.
+    """
+    result: Dict[str, int] = {}
+    for key, value in usage.items():
+        if key == 'columns':
+            for name, column in value.items():
+                result[f'{prefix}columns.{name}'] = column['values']
+                for row, nested in column.get('nested', {}).items():
+                    result.update(flatten_memory_usage(nested, f'{prefix}columns.{name}.{row}.'))
+        else:
+            result[f'{prefix}{key}'] = value
+    return result
+
+
+class MemorySampler(object):
+    """
+    Sample the memory usage of containers and systems periodically in a background thread and
+    export it as flat metrics (see flatten_memory_usage()), prefixed by the key of each item.
+    Items that are locked (see SystemItem.enable_locking()) are sampled under their lock.
+    """
+
+    def __init__(
+        self: _MemorySamplerType,
+        items: Dict[str, Any],
+        exporter: Callable[[Dict[str, int]], None],
+        interval: float = 60.0,
+    ) -> None:
+        """Initialize."""
+        super().__init__()
+        self._items: Dict[str, Any] = items  # Key -> container or system item
+        self._exporter: Callable[[Dict[str, int]], None] = exporter
+        self._interval: float = interval  # Seconds between samples
+        self._stopped: Event = Event()
+        self._thread: Optional[Thread] = None
+
+    def sample(self: _MemorySamplerType) -> Dict[str, int]:
+        """Take one sample of all items, export and return it."""
+        metrics: Dict[str, int] = {}
+        for key, item in list(self._items.items()):
+            if item._lock is not None:
+                with item._lock:
+                    usage = item.memory_usage()
+            else:
+                usage = item.memory_usage()
+            metrics.update(flatten_memory_usage(usage, f'{key}.'))
+        self._exporter(metrics)
+        return metrics
+
+    def start(self: _MemorySamplerType) -> None:
+        """Start sampling in the background."""
+        if self._thread is not None:
+            raise RuntimeError('MemorySampler::start(): Sampler is already started')
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, name='MemorySampler', daemon=True)
+        self._thread.start()
+
+    def stop(self: _MemorySamplerType) -> None:
+        """Stop sampling."""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self: _MemorySamplerType) -> None:
+        """The sampler thread."""
+        while not self._stopped.wait(self._interval):
+            self.sample()
@@ -0,0 +1,401 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+import copy
+from datetime import datetime, timedelta
+import json
+import mmap
+import struct
+from typing import Any, Dict, Iterator, List, Optional, Tuple, TypeVar, Union
+
+from .container_item import ContainerItem
+from .data_item import DataItem
+from .data_item_base import AllowedBaseTypes, DataItemBase
+
+
+_MmapContainerItemType = TypeVar('_MmapContainerItemType', bound='MmapContainerItem')
+
+# File layout:
+#     magic (8 bytes) | header length (uint64) | JSON header | padding | column sections ...
+# Every column section starts on an 8 byte boundary, so the typed memoryview casts are aligned.
+_MAGIC: bytes = b'LYNXMM01'
+_PREAMBLE = struct.Struct('<8sQ')
+_ALIGNMENT: int = 8
+_EPOCH: datetime = datetime(1970, 1, 1)
+
+# Column type -> (type name in the header, struct/memoryview format of the values section)
+_TYPE_FORMATS: Dict[type, Tuple[str, str]] = {
+    int: ('int', 'q'),
+    float: ('float', 'd'),
+    bool: ('bool', '?'),
+    datetime: ('datetime', 'q'),  # Microseconds since the (naive) epoch
+    str: ('str', 'q'),  # Offsets into the UTF-8 blob that follows
+    type(None): ('null', ''),
+}
+_NAME_TO_TYPE: Dict[str, type] = {name_fmt[0]: tp for tp, name_fmt in _TYPE_FORMATS.items()}
+
+
+def _padding(length: int) -> int:
+    """Number of bytes needed to get to the next aligned offset."""
+    return (-length) % _ALIGNMENT
+
+
+def _datetime_to_micros(value: datetime) -> int:
+    """Convert a datetime to microseconds since the epoch."""
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+def _micros_to_datetime(value: int) -> datetime:
+    """Convert microseconds since the epoch back to a datetime."""
+    return _EPOCH + timedelta(microseconds=value)
+
+
+def _encode_column(column_type: type, values: List[AllowedBaseTypes]) -> Dict[str, bytes]:
+    """Encode the values of one column into its validity/values/blob sections."""
+    validity = bytearray((len(values) + 7) // 8)  # Arrow style, least significant bit first
+    for row, value in enumerate(values):
+        if value is not None:
+            validity[row >> 3] |= 1 << (row & 7)
+    sections: Dict[str, bytes] = {'validity': bytes(validity)}
+    fmt = _TYPE_FORMATS[column_type][1]
+    if column_type is str:
+        offsets: List[int] = [0]
+        blob = bytearray()
+        for value in values:
+            if value is not None:
+                blob += value.encode('utf-8')
+            offsets.append(len(blob))
+        sections['values'] = struct.pack(f'<{len(offsets)}{fmt}', *offsets)
+        sections['blob'] = bytes(blob)
+    elif column_type is datetime:
+        raw = [0 if v is None else _datetime_to_micros(v) for v in values]
+        sections['values'] = struct.pack(f'<{len(raw)}{fmt}', *raw)
+    elif fmt:
+        raw = [column_type() if v is None else v for v in values]
+        sections['values'] = struct.pack(f'<{len(raw)}{fmt}', *raw)
+    return sections
+
+
+def write_mmap_container(container: ContainerItem, path: str) -> None:
+    """
+    Write a flat container to a file that can later be mapped by MmapContainerItem.
+    Nested containers are not supported, since the file holds fixed typed columns.
+    """
+    header_columns: List[Dict[str, Any]] = []
+    payloads: List[Dict[str, bytes]] = []
+    for col_idx in range(len(container._column_data)):
+        if container._column_data[col_idx] is None:  # The file does not keep tombstones
+            continue
+        name, column_type = container._column_names_and_types[col_idx]
+        if column_type not in _TYPE_FORMATS:
+            raise TypeError(f'write_mmap_container(): column {name} of type {column_type} '
+                            f'cannot be stored in a mapped file')
+        values = [item.get_value() for item in container._column_data[col_idx]]
+        if column_type is type(None):
+            # A null column that never got a value. Its type is still up for grabs.
+            values = [None] * len(values)
+        header_columns.append(
+            {'name': name, 'type': _TYPE_FORMATS[column_type][0], 'rows': len(values)}
+        )
+        payloads.append(_encode_column(column_type, values))
+
+    # Offsets depend on the header length, which depends on the offsets. So iterate until the
+    # header size is stable.
+    header_bytes: bytes = b''
+    header_stable: bool = False
+    while not header_stable:
+        offset = _PREAMBLE.size + len(header_bytes)
+        offset += _padding(offset)
+        for column, payload in zip(header_columns, payloads):
+            for section in ('validity', 'values', 'blob'):
+                if section in payload:
+                    column[section] = [offset, len(payload[section])]
+                    offset += len(payload[section])
+                    offset += _padding(offset)
+        new_header = json.dumps({'columns': header_columns}).encode('utf-8')
+        header_stable = len(new_header) == len(header_bytes)
+        header_bytes = new_header
+
+    with open(path, 'wb') as file:
+        file.write(_PREAMBLE.pack(_MAGIC, len(header_bytes)))
+        file.write(header_bytes)
+        written = _PREAMBLE.size + len(header_bytes)
+        for payload in payloads:
+            for section in ('validity', 'values', 'blob'):
+                if section in payload:
+                    file.write(b'\0' * _padding(written))
+                    written += _padding(written)
+                    file.write(payload[section])
+                    written += len(payload[section])
+
+
+class _MappedColumn(object):
+    """
+    A column whose values live in a mapped buffer.
+    It behaves like the list of DataItems that ContainerItem normally keeps per column, so the
+    ContainerItem interface works unchanged on top of it.
+    """
+
+    def __init__(
+        self,
+        column_type: type,
+        rows: int,
+        validity: memoryview,
+        values: Optional[memoryview],
+        blob: Optional[memoryview],
+    ) -> None:
+        """Initialize."""
+        super().__init__()
+        self.column_type: type = column_type
+        self.rows: int = rows
+        self.validity: memoryview = validity
+        self.values: Optional[memoryview] = values
+        self.blob: Optional[memoryview] = blob
+        # A data item set up by the container (see ContainerItem._add_column()). The row views
+        # copy its links to the container, so their changes reach it.
+        self.template: Optional[DataItemBase] = None
+        # The row views, made on first access. They are kept, so their versions, dependency
+        # circle counts and locks last as long as the column.
+        self._items: List[Optional[_MappedDataItem]] = [None] * rows
+
+    def _item(self, row: int) -> DataItemBase:
+        """The DataItem view of the given row, linked to the container like the template."""
+        data_item = self._items[row]
+        if data_item is not None:
+            return data_item
+        data_item = _MappedDataItem(self, row)
+        self._items[row] = data_item
+        template = self.template
+        if template is not None:
+            # Sneaking a private member access!
+            data_item._my_column_in_container = template._my_column_in_container
+            data_item._my_row_in_container = row
+            data_item._my_container_touch = template._my_container_touch
+            data_item._item_change_callback = template._item_change_callback
+            data_item._lock = template._lock
+        return data_item
+
+    def is_valid(self, row: int) -> bool:
+        """Is the value at the given row non-null?"""
+        return bool(self.validity[row >> 3] & (1 << (row & 7)))
+
+    def read(self, row: int) -> AllowedBaseTypes:
+        """Read the value at the given row."""
+        if not self.is_valid(row):
+            return None
+        if self.column_type is str:
+            return str(self.blob[self.values[row]:self.values[row + 1]], 'utf-8')
+        if self.column_type is datetime:
+            return _micros_to_datetime(self.values[row])
+        return self.values[row]
+
+    def write(self, row: int, value: AllowedBaseTypes) -> None:
+        """Write the value at the given row. Only possible for copy-on-write mappings."""
+        if value is None:
+            self.validity[row >> 3] &= ~(1 << (row & 7)) & 0xFF
+            return
+        if self.column_type is str or self.column_type is type(None):
+            raise TypeError(f'_MappedColumn::write(): cannot write {type(value).__name__} '
+                            f'values in place into a mapped {self.column_type.__name__} column')
+        if self.column_type is datetime:
+            self.values[row] = _datetime_to_micros(value)
+        else:
+            self.values[row] = value
+        self.validity[row >> 3] |= 1 << (row & 7)
+
+    def release(self) -> None:
+        """Release the memoryviews, so the underlying map can be closed."""
+        for view in (self.validity, self.values, self.blob):
+            if view is not None:
+                view.release()
+
+    def append(self, data_item: DataItemBase) -> None:
+        """Columns in buffers have a fixed number of rows."""
+        raise NotImplementedError(
+            '_MappedColumn::append(): You cannot add rows to a column kept in buffers'
+        )
+
+    def __delitem__(self, row: int) -> None:
+        """Columns in buffers have a fixed number of rows."""
+        raise NotImplementedError(
+            '_MappedColumn::__delitem__(): You cannot remove rows from a column kept in buffers'
+        )
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> List[DataItemBase]:
+        """A copy is a regular column of DataItems."""
+        return [copy.deepcopy(data_item, memo) for data_item in self]
+
+    def __len__(self) -> int:
+        """Number of rows."""
+        return self.rows
+
+    def __getitem__(self, row: int) -> DataItemBase:
+        """A DataItem view of the given row."""
+        if row < 0:
+            row += self.rows
+        if row < 0 or row >= self.rows:
+            raise IndexError(f'_MappedColumn::__getitem__(): row {row} does not exist')
+        return self._item(row)
+
+    def __iter__(self) -> Iterator[DataItemBase]:
+        """Iterate over DataItem views of all rows."""
+        return (self._item(row) for row in range(self.rows))
+
+    def __eq__(self, other: Any) -> bool:
+        """Compare row by row with DataItem semantics."""
+        try:
+            if len(self) != len(other):
+                return False
+        except TypeError:
+            return False
+        return all(lhs == rhs for lhs, rhs in zip(self, other))
+
+
+class _MappedDataItem(DataItem):
+    """A DataItem whose value is read from, and written to, a mapped column."""
+
+    def __init__(self, column: _MappedColumn, row: int) -> None:
+        """Initialize."""
+        DataItemBase.__init__(self)
+        self._column: _MappedColumn = column
+        self._row: int = row
+
+    @property
+    def _value(self) -> AllowedBaseTypes:
+        """The value lives in the map."""
+        return self._column.read(self._row)
+
+    @_value.setter
+    def _value(self, value: AllowedBaseTypes) -> None:
+        """Write through to the map."""
+        self._column.write(self._row, value)
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> DataItem:
+        """
+        A copy is a regular DataItem, with the same value and links, that no longer reads the map.
+        Locks cannot be copied, so the copy is not locked.
+        """
+        new_item = object.__new__(DataItem)
+        new_item.__dict__.update(self.__dict__)
+        del new_item.__dict__['_column']
+        del new_item.__dict__['_row']
+        new_item._value = self._value
+        new_item._lock = None
+        memo[id(self)] = new_item
+        return new_item
+
+
+class MmapContainerItem(ContainerItem):
+    """
+    A container item whose columns are mapped from a file written by write_mmap_container().
+        1. Opening is near-instant, since only the header is parsed. Values are read lazily from
+           the mapped pages, so all processes mapping the same file share the same physical memory.
+        2. By default the map is read-only. With copy_on_write=True, values can be changed
+           in place, but the changes are private to this process and never reach the file.
+        3. Strings and null-typed columns cannot be changed in place.
+        4. The structure (columns and rows) is fixed.
+    """
+
+    def __init__(self: _MmapContainerItemType, path: str, copy_on_write: bool = False) -> None:
+        """Initialize."""
+        super().__init__()
+        self._path: str = path
+        with open(path, 'rb') as file:
+            self._mmap: mmap.mmap = mmap.mmap(
+                file.fileno(), 0, access=mmap.ACCESS_COPY if copy_on_write else mmap.ACCESS_READ
+            )
+        self._buffer: memoryview = memoryview(self._mmap)
+        magic, header_len = _PREAMBLE.unpack_from(self._buffer, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError(f'MmapContainerItem::__init__(): {path} is not a mapped container')
+        header = json.loads(
+            str(self._buffer[_PREAMBLE.size:_PREAMBLE.size + header_len], 'utf-8')
+        )
+        for column in header['columns']:
+            column_type = _NAME_TO_TYPE[column['type']]
+            fmt = _TYPE_FORMATS[column_type][1]
+            self._column_names_and_types.append((column['name'], column_type))
+            self._names_dict[column['name']] = len(self._column_names_and_types) - 1
+            self._column_data.append(_MappedColumn(
+                column_type,
+                column['rows'],
+                self._section(column, 'validity', 'B'),
+                self._section(column, 'values', fmt),
+                self._section(column, 'blob', 'B'),
+            ))
+
+    def _section(self: _MmapContainerItemType,
+                 column: Dict[str, Any],
+                 section: str,
+                 fmt: str) -> Optional[memoryview]:
+        """A typed memoryview over one section of the map. No data is copied."""
+        if section not in column or not fmt:
+            return None
+        offset, length = column[section]
+        return self._buffer[offset:offset + length].cast(fmt)
+
+    def close(self: _MmapContainerItemType) -> None:
+        """Unmap the file. The container cannot be used afterwards."""
+        for column in self._column_data:
+            column.release()
+        self._column_data = []
+        self._column_names_and_types = []
+        self._names_dict = {}
+        self._buffer.release()
+        self._mmap.close()
+
+    def to_container(self: _MmapContainerItemType) -> ContainerItem:
+        """Copy the mapped data into a regular, mutable container."""
+        result = ContainerItem()
+        for col_idx, name_and_type in enumerate(self._column_names_and_types):
+            column = self._column_data[col_idx]
+            result._add_column(name_and_type[0], column.read(0), name_and_type[1])
+            for row in range(1, len(column)):
+                result.add_row(col_idx, column.read(row))
+        return result
+
+    def _add_column(
+        self: _MmapContainerItemType,
+        name: str,
+        value: Union[AllowedBaseTypes, DataItemBase],
+        column_type: type,
+    ) -> DataItemBase:
+        """Private method to add a new column."""
+        raise NotImplementedError(
+            'MmapContainerItem::_add_column(): You cannot add columns to a mapped container'
+        )
+
+    def remove_column(self: _MmapContainerItemType, column: Union[int, str]) -> None:
+        """Remove the given column."""
+        raise NotImplementedError(
+            'MmapContainerItem::remove_column(): You cannot remove columns from a mapped container'
+        )
+
+    def add_row(
+        self: _MmapContainerItemType,
+        column: Union[str, int],
+        value: Union[AllowedBaseTypes, ContainerItem],
+    ) -> DataItemBase:
+        """Add a row to the given column."""
+        raise NotImplementedError(
+            'MmapContainerItem::add_row(): You cannot add rows to a mapped container'
+        )
+
+    def remove_row(self: _MmapContainerItemType, column: Union[str, int], row_index: int) -> None:
+        """Remove the row for the given column."""
+        raise NotImplementedError(
+            'MmapContainerItem::remove_row(): You cannot remove rows from a mapped container'
+        )
+
+    def _set_value_hook(
+            self: _MmapContainerItemType, value: Union[DataItemBase, AllowedBaseTypes]
+    ) -> bool:
+        """A mapped container cannot be reassigned."""
+        raise NotImplementedError(
+            'MmapContainerItem::_set_value_hook(): You cannot assign to a mapped container'
+        )
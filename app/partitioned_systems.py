@@ -0,0 +1,526 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+from collections import deque
+import multiprocessing
+from multiprocessing.connection import Connection, wait
+import os
+from queue import Queue
+from threading import Condition, Lock, RLock, Thread
+import time
+from typing import Any, Deque, Dict, Iterable, List, NamedTuple, Optional, Tuple, TypeVar, Union
+
+from .benchmarks.load_generator import LatencyRecorder
+from .container_item import ContainerItem
+from .data_item_base import AllowedBaseTypes
+from .system_item import SystemItem
+from .timer_wheel import Timer, TimerWheel
+
+
+_PartitionedSystemsType = TypeVar('_PartitionedSystemsType', bound='PartitionedSystems')
+
+
+class Link(NamedTuple):
+    """When the source column of the source system changes, set the target column to its value."""
+
+    source: str
+    source_column: Union[int, str]
+    target: str
+    target_column: Union[int, str]
+
+
+class _UnionFind(object):
+    """Disjoint sets of system keys."""
+
+    def __init__(self, keys: Iterable[str]) -> None:
+        """Initialize."""
+        super().__init__()
+        self._parent: Dict[str, str] = {key: key for key in keys}
+
+    def find(self, key: str) -> str:
+        """The representative of the set of the key."""
+        root = key
+        while self._parent[root] != root:
+            root = self._parent[root]
+        while self._parent[key] != root:  # Path compression
+            self._parent[key], key = root, self._parent[key]
+        return root
+
+    def union(self, key1: str, key2: str) -> None:
+        """Merge the sets of the keys."""
+        self._parent[self.find(key1)] = self.find(key2)
+
+    def sets(self) -> List[List[str]]:
+        """The sets, in the order of their first key."""
+        result: Dict[str, List[str]] = {}
+        for key in self._parent:
+            result.setdefault(self.find(key), []).append(key)
+        return list(result.values())
+
+
+def _nested_systems(system: SystemItem) -> List[SystemItem]:
+    """The system and the systems nested in its columns, at any depth."""
+    result: List[SystemItem] = []
+    work: List[ContainerItem] = [system]
+    while work:
+        container = work.pop()
+        if isinstance(container, SystemItem):
+            result.append(container)
+        for column in container._column_data:
+            for data_item in column or ():
+                if isinstance(data_item, ContainerItem):
+                    work.append(data_item)
+    return result
+
+
+def _referenced_objects(system: SystemItem) -> List[Any]:
+    """The objects the callbacks of the system are bound to, and its lock."""
+    result: List[Any] = []
+    for dep_list in system._dependency_vector:
+        for dep in dep_list or ():
+            result.append(getattr(dep.callback, '__self__', None))
+    for subscription in system._subscriptions:
+        result.append(getattr(subscription.callback(), '__self__', None))
+    for timer in system._timers:
+        result.append(getattr(timer.callback, '__self__', None))
+    result.append(system._lock)
+    return [obj for obj in result if obj is not None and obj is not system]
+
+
+def partition_systems(
+    systems: Dict[str, SystemItem],
+    workers: int,
+    links: Iterable[Link] = (),
+    partitions: Optional[Dict[str, int]] = None,
+) -> Dict[str, int]:
+    """
+    Assign the systems to workers 0 to workers - 1. Returns system key -> worker.
+        1. Systems that change each other directly (i.e. nested systems, callbacks bound to
+           other systems and shared locks) must be in the same worker.
+        2. Systems joined by links are kept in the same worker too, unless partitions says
+           otherwise. Links are the only connections that can cross workers.
+        3. The resulting components are spread over the workers by their number of columns,
+           biggest first, each to the least loaded worker.
+    partitions is a manual override of system key -> worker, for some or all of the systems.
+    """
+    if workers < 1:
+        raise ValueError('partition_systems(): There must be at least one worker')
+    partitions = dict(partitions or {})
+    owners: Dict[int, str] = {}  # id(system, nested systems and locks) -> key
+    direct = _UnionFind(systems)
+    for key, system in systems.items():
+        for nested in _nested_systems(system):
+            if id(nested) in owners:
+                direct.union(key, owners[id(nested)])
+            owners[id(nested)] = key
+    for key, system in systems.items():
+        for nested in _nested_systems(system):
+            for obj in _referenced_objects(nested):
+                if id(obj) in owners:
+                    direct.union(key, owners[id(obj)])
+                else:
+                    owners[id(obj)] = key  # E.g. a lock, which others may share
+
+    linked = _UnionFind(systems)
+    units = direct.sets()
+    for unit in units:
+        for key in unit[1:]:
+            linked.union(unit[0], key)
+        pinned = {partitions[key] for key in unit if key in partitions}
+        if len(pinned) > 1:
+            raise ValueError(f'partition_systems(): Systems {unit} change each other directly, '
+                             f'so they cannot be in different workers')
+        if any(not 0 <= worker < workers for worker in pinned):
+            raise ValueError(f'partition_systems(): Systems {unit} are assigned to a worker '
+                             f'that does not exist')
+    for link in links:
+        if link.source not in systems or link.target not in systems:
+            raise KeyError(f'partition_systems(): Link {link} is between unknown systems')
+        linked.union(link.source, link.target)
+
+    weights: Dict[str, int] = {
+        key: sum(nested.number_of_columns() for nested in _nested_systems(system))
+        for key, system in systems.items()
+    }
+    loads: List[int] = [0] * workers
+    result: Dict[str, int] = {}
+    components = sorted(linked.sets(), key=lambda keys: -sum(weights[key] for key in keys))
+    for component in components:
+        members = set(component)
+        component_units = [unit for unit in units if unit[0] in members]
+        pinned = [partitions[key] for key in component if key in partitions]
+        # Unpinned units go where the component is pinned, to keep their links local
+        default_worker = pinned[0] if pinned else loads.index(min(loads))
+        for unit in component_units:
+            worker = next((partitions[key] for key in unit if key in partitions), default_worker)
+            for key in unit:
+                result[key] = worker
+                loads[worker] += weights[key]
+    return result
+
+
+def _worker_timer_wheels(systems: Dict[str, SystemItem]) -> Dict[Timer, Tuple[str, int]]:
+    """
+    Take over, in a worker, the wheels of the timers of the given systems. Timers of other
+    systems on those wheels are cancelled, since other processes run them. Returns timer ->
+    (system key, column) of the timers of the systems.
+    """
+    timers: Dict[Timer, Tuple[str, int]] = {}
+    for key, system in systems.items():
+        for nested in _nested_systems(system):
+            for timer, column in nested._timers.items():
+                timers[timer] = (key, column)
+    owners = {id(timer.owner) for timer in timers}
+    for wheel in {id(timer._wheel): timer._wheel for timer in timers if timer._wheel}.values():
+        # The wheel thread of the parent is not forked, and it may have held the lock
+        wheel._lock = RLock()  # Sneaking a private member access!
+        wheel._thread = None
+        for slot in wheel._slots:
+            for timer in list(slot):
+                if id(timer.owner) not in owners:
+                    timer.cancel()
+    return timers
+
+
+def _worker_main(connection: Connection,
+                 systems: Dict[str, SystemItem],
+                 links: List[Link]) -> None:
+    """The worker process. It owns the given systems and advances the wheels of their timers."""
+    outgoing: List[Tuple[str, Union[int, str], AllowedBaseTypes]] = []  # Links to other workers
+    timers = _worker_timer_wheels(systems)
+    wheels: List[TimerWheel] = list({id(timer._wheel): timer._wheel
+                                     for timer in timers if timer._wheel}.values())
+    tick: Optional[float] = min((wheel._tick for wheel in wheels), default=None)
+    reported_errors: Dict[int, int] = {id(wheel): len(wheel.errors()) for wheel in wheels}
+
+    def set_column(key: str, column: Union[int, str], value: AllowedBaseTypes) -> None:
+        data_item = systems[key].get(column=column)
+        if value is None:
+            data_item.set_to_null()
+        else:
+            data_item.set_value(value)
+
+    def follow(link: Link) -> None:
+        def on_change(container: SystemItem, changes: Dict[str, AllowedBaseTypes]) -> None:
+            value = next(iter(changes.values()))
+            if link.target in systems:
+                set_column(link.target, link.target_column, value)
+            else:
+                outgoing.append((link.target, link.target_column, value))
+        systems[link.source].subscribe(on_change, columns=(link.source_column, ))
+
+    for link in links:
+        if link.source in systems:
+            follow(link)
+
+    def send_outgoing() -> None:
+        for target, target_column, value in outgoing:
+            connection.send(('set', target, target_column, value))
+        outgoing.clear()
+
+    def advance_timers() -> None:
+        for wheel in wheels:
+            wheel.advance()
+            errors = wheel.errors()
+            for timer, ex in errors[reported_errors[id(wheel)]:]:
+                key, column = timers.get(timer, ('', -1))
+                connection.send(('error', key, column, repr(ex)))
+            reported_errors[id(wheel)] = len(errors)
+        send_outgoing()  # Changes made by the timers
+
+    while True:
+        # Without timers, wait for messages. With timers, wake up every tick to advance them.
+        if tick is not None and not connection.poll(tick):
+            advance_timers()
+            continue
+        message = connection.recv()
+        kind = message[0]
+        if kind == 'stop':
+            break
+        if kind == 'set':
+            _, key, column, value = message
+            try:
+                set_column(key, column, value)
+            except Exception as ex:
+                connection.send(('error', key, column, repr(ex)))
+            send_outgoing()
+            connection.send(('ack', ))
+        elif kind == 'snapshot':
+            _, key, request = message
+            system = systems[key]
+            connection.send(('snapshot', request, {
+                name_and_type[0]: system._snapshot_value(col_idx)
+                for col_idx, name_and_type in enumerate(system._column_names_and_types)
+                if name_and_type is not None
+            }))
+        if tick is not None:
+            advance_timers()  # A busy worker does not starve its timers
+    connection.close()
+
+
+class PartitionedSystems(object):
+    """
+    Run a set of interconnected systems across a pool of worker processes, so one logical model
+    can use all the cores of a host.
+        1. The systems are partitioned (see partition_systems()), automatically or with a manual
+           override, and each worker owns the systems of its partition.
+        2. Changes are submitted by system key. Links (see Link) carry changes between systems.
+           Links inside a worker are applied directly. Links that cross workers travel over
+           pipes, through the coordinator (i.e. this object).
+        3. wait_quiescent() waits until every change, and every change it caused in other
+           workers, has been applied.
+        4. stats() gives the latency from submitting a change to a worker until the worker has
+           applied it, per worker.
+        5. Workers advance the timer wheels of their systems' timers (see SystemItem.add_timer()).
+           wait_quiescent() does not wait for timers to fire.
+        6. If a worker dies, the changes it had not applied yet, and those submitted to it later,
+           are reported in errors(). Snapshots of its systems raise RuntimeError.
+    Once started, the systems in this process are not updated anymore. Use snapshot() to read
+    the systems in the workers. On platforms that cannot fork, the systems must be picklable.
+    """
+
+    def __init__(
+        self: _PartitionedSystemsType,
+        systems: Dict[str, SystemItem],
+        workers: Optional[int] = None,
+        links: Iterable[Link] = (),
+        partitions: Optional[Dict[str, int]] = None,
+    ) -> None:
+        """Initialize."""
+        super().__init__()
+        self._systems: Dict[str, SystemItem] = systems
+        self._links: List[Link] = list(links)
+        self._workers: int = workers if workers is not None else os.cpu_count() or 1
+        # System key -> worker
+        self._partitions: Dict[str, int] = partition_systems(systems,
+                                                             self._workers,
+                                                             self._links,
+                                                             partitions)
+        self._processes: List[multiprocessing.Process] = []
+        self._connections: List[Connection] = []
+        # Per worker, messages waiting to be sent. Nobody blocks on a full pipe, so the router
+        # and the workers cannot wait on each other.
+        self._outboxes: List[Queue] = []
+        self._senders: List[Thread] = []
+        self._send_locks: List[Lock] = []
+        # Per worker, (send time, key, column) of the changes not yet applied
+        self._send_times: List[Deque[Tuple[float, str, Union[int, str]]]] = []
+        self._dead: List[bool] = []  # Per worker, has the worker died?
+        self._recorders: List[LatencyRecorder] = []
+        self._outstanding: int = 0  # Changes sent, but not yet applied
+        self._quiescent: Condition = Condition()
+        # Snapshot request -> its reply, or None until it arrives
+        self._replies: Dict[int, Optional[Dict[str, AllowedBaseTypes]]] = {}
+        self._next_request: int = 0
+        self._errors: List[Tuple[str, Union[int, str], str]] = []  # (key, column, exception)
+        self._router: Optional[Thread] = None
+        self._stopping: bool = False
+
+    def partitions(self: _PartitionedSystemsType) -> Dict[str, int]:
+        """System key -> worker."""
+        return self._partitions
+
+    def start(self: _PartitionedSystemsType) -> None:
+        """Start the worker processes."""
+        if self._router is not None:
+            raise RuntimeError('PartitionedSystems::start(): Workers are already started')
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        self._stopping = False
+        for worker in range(self._workers):
+            parent_end, child_end = context.Pipe()
+            systems = {key: system for key, system in self._systems.items()
+                       if self._partitions[key] == worker}
+            process = context.Process(target=_worker_main,
+                                      args=(child_end, systems, self._links),
+                                      name=f'PartitionedSystems-{worker}',
+                                      daemon=True)
+            process.start()
+            child_end.close()
+            self._processes.append(process)
+            self._connections.append(parent_end)
+            self._outboxes.append(Queue())
+            self._send_locks.append(Lock())
+            self._send_times.append(deque())
+            self._dead.append(False)
+            self._recorders.append(LatencyRecorder())
+        # The threads are started after the workers, so they are not forked with them running
+        for worker in range(self._workers):
+            self._senders.append(Thread(target=self._deliver, args=(worker, ),
+                                        name=f'PartitionedSystems-sender-{worker}', daemon=True))
+            self._senders[-1].start()
+        self._router = Thread(target=self._route, name='PartitionedSystems', daemon=True)
+        self._router.start()
+
+    def stop(self: _PartitionedSystemsType, timeout: Optional[float] = 10.0) -> None:
+        """
+        Stop the worker processes. The workers apply the changes submitted so far before they
+        stop, but changes they cause through links to other workers are dropped. Workers that have
+        not stopped after timeout seconds are terminated.
+        """
+        if self._router is None:
+            return
+        self._stopping = True
+        for outbox in self._outboxes:
+            outbox.put(('stop', ))
+        # The router goes on reading the workers until they are gone, so they never block on a
+        # full pipe.
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self._router.join()
+        self._router = None
+        for sender in self._senders:
+            sender.join()
+        for connection in self._connections:
+            connection.close()
+        self._processes = []
+        self._connections = []
+        self._outboxes = []
+        self._senders = []
+        self._send_locks = []
+        self._send_times = []
+        self._dead = []
+        self._recorders = []
+        with self._quiescent:
+            self._replies = {}
+            self._outstanding = 0
+            self._quiescent.notify_all()
+
+    def submit(self: _PartitionedSystemsType,
+               key: str,
+               column: Union[int, str],
+               value: AllowedBaseTypes) -> None:
+        """Submit a change of the column of the system to the given value. None sets null."""
+        if self._router is None:
+            raise RuntimeError('PartitionedSystems::submit(): Workers are not started')
+        self._send_change(key, column, value)
+
+    def _send_change(self: _PartitionedSystemsType,
+                     key: str,
+                     column: Union[int, str],
+                     value: AllowedBaseTypes) -> None:
+        """Send a change to the worker that owns the system."""
+        worker = self._partitions[key]
+        with self._send_locks[worker]:  # So the send times are in the order of the messages
+            if self._dead[worker]:
+                self._errors.append((key, column, f'Worker {worker} is dead'))
+                return
+            with self._quiescent:
+                self._outstanding += 1
+            self._send_times[worker].append((time.perf_counter(), key, column))
+            self._outboxes[worker].put(('set', key, column, value))
+
+    def _worker_died(self: _PartitionedSystemsType, worker: int, ex: Exception) -> None:
+        """Give up on the changes the worker has not applied and wake up whoever waits for it."""
+        with self._send_locks[worker]:
+            if self._dead[worker]:
+                return
+            self._dead[worker] = True
+            lost = list(self._send_times[worker])
+            self._send_times[worker].clear()
+            for _, key, column in lost:
+                self._errors.append((key, column, f'Worker {worker} died: {ex!r}'))
+            with self._quiescent:
+                self._outstanding -= len(lost)
+                self._quiescent.notify_all()
+
+    def wait_quiescent(self: _PartitionedSystemsType, timeout: Optional[float] = None) -> bool:
+        """Wait until all the changes submitted so far, and those they caused, are applied."""
+        with self._quiescent:
+            return self._quiescent.wait_for(lambda: self._outstanding == 0, timeout)
+
+    def snapshot(self: _PartitionedSystemsType,
+                 key: str,
+                 timeout: Optional[float] = None) -> Dict[str, AllowedBaseTypes]:
+        """
+        Column name -> value of the system in its worker, after the changes submitted to that
+        worker so far. Containers are given as strings.
+        """
+        if self._router is None:
+            raise RuntimeError('PartitionedSystems::snapshot(): Workers are not started')
+        worker = self._partitions[key]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._quiescent:
+            request = self._next_request
+            self._next_request += 1
+            self._replies[request] = None
+        self._outboxes[worker].put(('snapshot', key, request))
+        with self._quiescent:
+            try:
+                while self._replies[request] is None:
+                    if self._dead[worker]:
+                        raise RuntimeError(f'PartitionedSystems::snapshot(): The worker of {key} '
+                                           f'is dead')
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f'PartitionedSystems::snapshot(): No reply for {key}')
+                    self._quiescent.wait(remaining)
+                return self._replies[request]
+            finally:
+                del self._replies[request]  # A late reply is dropped
+
+    def stats(self: _PartitionedSystemsType) -> Dict[int, Dict[str, float]]:
+        """Worker -> count, mean, percentiles and max of its latencies, in microseconds."""
+        return {worker: recorder.summary() for worker, recorder in enumerate(self._recorders)}
+
+    def errors(self: _PartitionedSystemsType) -> List[Tuple[str, Union[int, str], str]]:
+        """
+        Exceptions raised in the workers while applying changes, with their system and column.
+        """
+        return self._errors
+
+    def _deliver(self: _PartitionedSystemsType, worker: int) -> None:
+        """The sender thread of a worker."""
+        while True:
+            message = self._outboxes[worker].get()
+            try:
+                self._connections[worker].send(message)
+            except OSError as ex:  # E.g. BrokenPipeError, if the worker died
+                self._worker_died(worker, ex)
+                return
+            if message[0] == 'stop':
+                return
+
+    def _route(self: _PartitionedSystemsType) -> None:
+        """The router thread. It handles the messages of the workers."""
+        workers: Dict[Connection, int] = {
+            connection: worker for worker, connection in enumerate(self._connections)
+        }
+        while workers:
+            for connection in wait(list(workers), timeout=0.05):
+                worker = workers[connection]
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError) as ex:
+                    del workers[connection]
+                    if not self._stopping:
+                        self._worker_died(worker, ex)
+                    continue
+                kind = message[0]
+                if kind == 'set':  # A link to another worker. It is counted before its cause.
+                    if not self._stopping:  # The other worker may have stopped already
+                        self._send_change(message[1], message[2], message[3])
+                elif kind == 'ack':
+                    with self._send_locks[worker]:
+                        if not self._send_times[worker]:  # The worker is considered dead
+                            continue
+                        sent = self._send_times[worker].popleft()[0]
+                    self._recorders[worker].latencies.append(time.perf_counter() - sent)
+                    with self._quiescent:
+                        self._outstanding -= 1
+                        if self._outstanding == 0:
+                            self._quiescent.notify_all()
+                elif kind == 'error':
+                    self._errors.append((message[1], message[2], message[3]))
+                elif kind == 'snapshot':
+                    with self._quiescent:
+                        if message[1] in self._replies:  # Nobody waits for it anymore otherwise
+                            self._replies[message[1]] = message[2]
+                            self._quiescent.notify_all()
@@ -0,0 +1,201 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+from datetime import datetime
+import json
+import os
+import struct
+from typing import Any, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+from .data_item_base import AllowedBaseTypes
+from .mmap_container_item import _datetime_to_micros, _micros_to_datetime
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Before Python 3.8
+    shared_memory = None
+
+_SharedSystemStateType = TypeVar('_SharedSystemStateType', bound='SharedSystemState')
+_SharedSystemReaderType = TypeVar('_SharedSystemReaderType', bound='SharedSystemReader')
+
+# Block layout:
+#     magic (8 bytes) | sequence (uint64) | layout length (uint64) | JSON layout | padding | slots
+# Each slot is 16 bytes: a type tag (1 byte), 7 bytes of padding and the 8 byte value.
+# The sequence is a seqlock. It is odd while the writer is in the middle of a publish.
+_MAGIC: bytes = b'LYNXSHM1'
+_PREAMBLE = struct.Struct('<8sQQ')
+_SEQUENCE = struct.Struct('<Q')
+_SEQUENCE_OFFSET: int = 8
+_SLOT_SIZE: int = 16
+_SLOT_FORMATS: Dict[int, struct.Struct] = {
+    1: struct.Struct('<B7xq'),  # int
+    2: struct.Struct('<B7xd'),  # float
+    3: struct.Struct('<B7x?7x'),  # bool
+    4: struct.Struct('<B7xq'),  # datetime as microseconds since the epoch
+}
+_NULL_SLOT: bytes = bytes(_SLOT_SIZE)  # Tag 0 is null
+_TYPE_TAGS: Dict[type, int] = {int: 1, float: 2, bool: 3, datetime: 4}
+# Column types that can ever be shared. Null columns may get a value of any of the above.
+_SHAREABLE_TYPES: Tuple[type, ...] = (int, float, bool, datetime, type(None))
+
+
+def _encode_slot(value: AllowedBaseTypes) -> bytes:
+    """
+    Encode a scalar value into a slot. Values that cannot be shared (e.g. a string set on a null
+    column) are shared as null.
+    """
+    tag = _TYPE_TAGS.get(type(value))
+    if tag is None:
+        return _NULL_SLOT
+    return _SLOT_FORMATS[tag].pack(tag, _datetime_to_micros(value) if tag == 4 else value)
+
+
+def _decode_slot(buffer: bytes, offset: int) -> AllowedBaseTypes:
+    """Decode the slot at the given offset."""
+    tag = buffer[offset]
+    if tag == 0:
+        return None
+    value = _SLOT_FORMATS[tag].unpack_from(buffer, offset)[1]
+    return _micros_to_datetime(value) if tag == 4 else value
+
+
+def _check_shared_memory(caller: str) -> None:
+    """Shared memory blocks need Python 3.8 or later."""
+    if shared_memory is None:
+        raise NotImplementedError(f'{caller}: Shared memory needs Python 3.8 or later')
+
+
+def _attach_untracked(name: str) -> Any:
+    """
+    Attach to an existing block without registering it with the resource tracker. The attaching
+    process does not own the block, and the tracker would otherwise destroy it when the process
+    exits.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Before Python 3.13 there is no way to ask for this
+        from multiprocessing import resource_tracker
+
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix':  # Only POSIX blocks are registered
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class SharedSystemState(object):
+    """
+    The writer side of a shared memory block that mirrors the scalar columns of a SystemItem.
+    Integer, float, boolean, datetime and null columns are shared. Other columns (e.g. strings or
+    containers) are not. The set of shared columns is fixed when the block is created. A shared
+    column that gets a value of another type (e.g. a null column set to a string) reads as null.
+    This object is not multi-threaded safe. There must be only one writer per block.
+    """
+
+    def __init__(self: _SharedSystemStateType, system, name: Optional[str] = None) -> None:
+        """Initialize."""
+        _check_shared_memory('SharedSystemState::__init__()')
+        super().__init__()
+        # System column index -> slot index
+        self._slots: Dict[int, int] = {}
+        names: List[str] = []
+        for col_idx, name_and_type in enumerate(system._column_names_and_types):
+            if name_and_type is not None and name_and_type[1] in _SHAREABLE_TYPES:
+                self._slots[col_idx] = len(names)
+                names.append(name_and_type[0])
+        layout = json.dumps({'columns': names}).encode('utf-8')
+        self._slots_offset: int = _PREAMBLE.size + len(layout)
+        self._slots_offset += (-self._slots_offset) % _SLOT_SIZE
+        self._shm = shared_memory.SharedMemory(
+            name=name, create=True, size=self._slots_offset + len(names) * _SLOT_SIZE
+        )
+        self._sequence: int = 0
+        _PREAMBLE.pack_into(self._shm.buf, 0, _MAGIC, self._sequence, len(layout))
+        self._shm.buf[_PREAMBLE.size:_PREAMBLE.size + len(layout)] = layout
+        self.publish(system, self._slots.keys())
+
+    @property
+    def name(self: _SharedSystemStateType) -> str:
+        """Name of the shared memory block. Readers attach by this name."""
+        return self._shm.name
+
+    def publish(self: _SharedSystemStateType, system, columns: Iterable[int]) -> None:
+        """Publish the current values of the given columns as one consistent update."""
+        encoded: List[Tuple[int, bytes]] = []
+        for col_idx in columns:
+            slot = self._slots.get(col_idx)
+            if slot is not None:
+                value = system._column_data[col_idx][0].get_value()
+                encoded.append((self._slots_offset + slot * _SLOT_SIZE, _encode_slot(value)))
+        if not encoded:
+            return
+        buf = self._shm.buf
+        self._sequence += 1  # Odd: a write is in progress
+        _SEQUENCE.pack_into(buf, _SEQUENCE_OFFSET, self._sequence)
+        for offset, slot_bytes in encoded:
+            buf[offset:offset + _SLOT_SIZE] = slot_bytes
+        self._sequence += 1  # Even: the block is consistent again
+        _SEQUENCE.pack_into(buf, _SEQUENCE_OFFSET, self._sequence)
+
+    def close(self: _SharedSystemStateType) -> None:
+        """Close and destroy the shared memory block."""
+        self._shm.close()
+        self._shm.unlink()
+
+
+class SharedSystemReader(object):
+    """
+    The reader side of a shared memory block published by SharedSystemState.
+    Readers never lock. A snapshot is retried until it is not torn by a concurrent publish.
+    """
+
+    def __init__(self: _SharedSystemReaderType, name: str) -> None:
+        """Initialize."""
+        _check_shared_memory('SharedSystemReader::__init__()')
+        super().__init__()
+        self._shm = _attach_untracked(name)
+        magic, _, layout_len = _PREAMBLE.unpack_from(self._shm.buf, 0)
+        if magic != _MAGIC:
+            self._shm.close()
+            raise ValueError(f'SharedSystemReader::__init__(): {name} is not a shared system')
+        layout = json.loads(
+            str(self._shm.buf[_PREAMBLE.size:_PREAMBLE.size + layout_len], 'utf-8')
+        )
+        self._column_names: List[str] = layout['columns']
+        self._slots_offset: int = _PREAMBLE.size + layout_len
+        self._slots_offset += (-self._slots_offset) % _SLOT_SIZE
+        self._slots_end: int = self._slots_offset + len(self._column_names) * _SLOT_SIZE
+
+    def column_names(self: _SharedSystemReaderType) -> List[str]:
+        """Names of the shared columns."""
+        return list(self._column_names)
+
+    def version(self: _SharedSystemReaderType) -> int:
+        """Number of completed publishes so far."""
+        return _SEQUENCE.unpack_from(self._shm.buf, _SEQUENCE_OFFSET)[0] // 2
+
+    def snapshot(self: _SharedSystemReaderType,
+                 max_retries: int = 1000) -> Dict[str, AllowedBaseTypes]:
+        """A consistent snapshot of all shared columns."""
+        buf = self._shm.buf
+        for _ in range(max_retries):
+            before = _SEQUENCE.unpack_from(buf, _SEQUENCE_OFFSET)[0]
+            if before & 1:
+                continue
+            slots = bytes(buf[self._slots_offset:self._slots_end])
+            if _SEQUENCE.unpack_from(buf, _SEQUENCE_OFFSET)[0] == before:
+                return {
+                    name: _decode_slot(slots, idx * _SLOT_SIZE)
+                    for idx, name in enumerate(self._column_names)
+                }
+        raise RuntimeError(
+            f'SharedSystemReader::snapshot(): could not get a consistent snapshot after '
+            f'{max_retries} retries'
+        )
+
+    def close(self: _SharedSystemReaderType) -> None:
+        """Detach from the shared memory block."""
+        self._shm.close()
@@ -0,0 +1,66 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+from types import MethodType
+from typing import Any, Callable, Dict, FrozenSet, Optional, TypeVar
+import weakref
+
+from .data_item_base import AllowedBaseTypes
+
+
+_SubscriptionType = TypeVar('_SubscriptionType', bound='Subscription')
+# Called with the container and column name -> final value of the changed columns
+_ChangeCallback = Callable[[Any, Dict[str, AllowedBaseTypes]], None]
+# Called with a column name and its final value. A false return drops the change.
+_ChangeFilter = Callable[[str, AllowedBaseTypes], bool]
+
+
+class Subscription(object):
+    """
+    A subscription to the column changes of a container or system item (see
+    ContainerItem.subscribe()).
+    A weak subscription does not keep its callback alive. It ends by itself once the callback
+    (or the object whose method it is) is garbage collected.
+    """
+
+    def __init__(
+        self: _SubscriptionType,
+        container,
+        callback: _ChangeCallback,
+        columns: Optional[FrozenSet[int]] = None,
+        change_filter: Optional[_ChangeFilter] = None,
+        weak: bool = False,
+    ) -> None:
+        """Initialize."""
+        super().__init__()
+        self._container = container
+        self._callback: Optional[_ChangeCallback] = None if weak else callback
+        self._weak_callback: Optional[weakref.ref] = None
+        if weak:
+            self._weak_callback = (
+                weakref.WeakMethod(callback) if isinstance(callback, MethodType)
+                else weakref.ref(callback)
+            )
+        self.columns: Optional[FrozenSet[int]] = columns  # None means all columns
+        self.change_filter: Optional[_ChangeFilter] = change_filter
+
+    def callback(self: _SubscriptionType) -> Optional[_ChangeCallback]:
+        """The callback, or None if it was weak and is gone."""
+        if self._weak_callback is not None:
+            return self._weak_callback()
+        return self._callback
+
+    def is_active(self: _SubscriptionType) -> bool:
+        """Is the subscription still delivering changes?"""
+        return self._container is not None and self.callback() is not None
+
+    def unsubscribe(self: _SubscriptionType) -> None:
+        """Stop delivering changes."""
+        if self._container is not None:
+            if self in self._container._subscriptions:
+                self._container._subscriptions.remove(self)
+            self._container = None
@@ -5,11 +5,24 @@ Copyright (C) 2019-2020 Hossein Moein
 Distributed under the BSD Software License (see file LICENSE)
 """
 
+from collections import OrderedDict, deque
+import copy
+from datetime import datetime
 from enum import Enum
-from typing import Callable, List, TypeVar, Union
+from threading import RLock
+from time import monotonic, perf_counter
+from types import MethodType
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple, TypeVar, Union
 
+from .array_data_item import ArrayDataItem
 from .container_item import ContainerItem
+from .data_item import DataItem
 from .data_item_base import AllowedBaseTypes, DataItemBase
+from .graph_analysis import GraphAnalysis
+from .journal import SystemJournal, _is_journaled
+from .memory_usage import deep_sizeof
+from .shared_system_state import SharedSystemState
+from .timer_wheel import Timer, TimerWheel, shared_timer_wheel
 
 
 class DependencyResult(Enum):
@@ -37,6 +50,21 @@ class _DependencyItem(object):
         self.dependent_column: int = None
         # The callback for dependency or action
         self.callback: Union[_DataChangeActionCallback, _DataChangeDependencyCallback] = None
+        # For pure dependencies, the columns the callback reads. None means not pure.
+        self.input_columns: Optional[Tuple[int, ...]] = None
+        # For pure dependencies, row -> versions of the input columns when the callback last
+        # ran. It is shared by all dependencies with the same callback, dependent and inputs.
+        self.memo: 'OrderedDict[int, Tuple[int, ...]]' = None
+        # Max number of rows kept in memo
+        self.memo_size: int = 0
+        # Number of timed calls and their total time in seconds, if callback timing is on
+        self.calls: int = 0
+        self.total_time: float = 0.0
+        # For deferred actions, higher priority actions run first
+        self.priority: int = 0
+        # For throttled actions, max number of calls per second and the times of recent calls
+        self.max_per_second: Optional[int] = None
+        self.fire_times: Deque[float] = None
 
 
 class SystemItem(ContainerItem):
@@ -47,23 +75,54 @@ class SystemItem(ContainerItem):
         2. An action specifies a reaction to a just-changed independent column.
     A system item allows many dependencies and many actions per column. Circular dependencies
     are allowed and handled properly, by going around the circle the set number of times.
+    The change a dependency callback makes to its dependent column propagates only if the
+    callback returns SUCCESS. NO_CHANGE prunes the propagation and FAILURE also records an error.
     Currently, system item allows only one row in the container
     """
 
     def __init__(self: _SystemItemType) -> None:
         """Initialize."""
         super().__init__()
-        # The vector of dependencies/actions per column
-        self._dependency_vector: List[List[_DependencyItem]] = []
+        # The vector of dependencies/actions per column. None for removed columns.
+        self._dependency_vector: List[Optional[List[_DependencyItem]]] = []
         self._dependency_on: bool = True  # Is dependency engine on?
         # Max number of times to go around a circular dependency before stopping
         self._dependency_circle_max: int = 1
+        # How deep we are in nested _dependency_engine() calls. Zero means the system has settled
+        self._propagation_depth: int = 0
+        # Columns changed since the system last settled
+        self._changed_columns: Set[int] = set()
+        # If set, scalar column values are mirrored in shared memory whenever the system settles
+        self._shared_state: Optional[SharedSystemState] = None
+        # If set, external changes to this system are recorded in the journal under this id
+        self._journal: Optional[SystemJournal] = None
+        self._journal_id: int = None
+        # Dependent column -> has it changed, while its dependency callback is running
+        self._held_columns: Dict[int, bool] = {}
+        # Column -> smallest change that propagates, for columns with a materiality threshold
+        self._change_thresholds: Dict[int, float] = {}
+        # Column -> value when it last propagated, for columns with a materiality threshold
+        self._last_propagated_values: Dict[int, float] = {}
+        # (independent column, dependent column or None for actions, callback name) of the
+        # callbacks that returned FAILURE
+        self._dependency_errors: List[Tuple[int, Optional[int], str]] = []
+        self._callback_timing: bool = False  # Are callbacks being timed?
+        # Are actions run once, after the system settles, instead of as soon as columns change?
+        self._deferred_actions: bool = False
+        # Actions waiting for the system to settle (or for their throttle) -> independent column
+        self._pending_actions: 'OrderedDict[_DependencyItem, int]' = OrderedDict()
+        # If set, column name -> value as of when the system last settled. It is replaced, never
+        # changed, so readers in other threads can use it without locking.
+        self._snapshot: Optional[Dict[str, AllowedBaseTypes]] = None
+        self._timers: Dict[Timer, int] = {}  # Timer -> the column it recomputes
 
     @classmethod
     def _string_format(cls, system: _SystemItemType, offset: str = '') -> str:
         """Class method to format the system nicely."""
         result: str = ''
         for name_and_type in system._column_names_and_types:
+            if name_and_type is None:
+                continue
             result += f'{offset}{name_and_type[0]}: '
             data_idx: int = system._names_dict.get(name_and_type[0], -1)
             for data_item in system._column_data[data_idx]:
@@ -94,25 +153,167 @@ class SystemItem(ContainerItem):
 
     def _dependency_engine(self: _SystemItemType, row: int, independent_column: int) -> None:
         """The dependency loop where things happen."""
+        if self._propagation_depth == 0 and self._journal is not None:
+            # This change came from outside the engine
+            data_item = self._column_data[independent_column][0]
+            if _is_journaled(data_item):
+                self._journal.record(self._journal_id, independent_column, data_item.get_value())
+        self._propagation_depth += 1
+        self._changed_columns.add(independent_column)
+        try:
+            self._propagate(row, independent_column)
+        finally:
+            self._propagation_depth -= 1
+        if self._propagation_depth == 0:
+            self._propagation_complete()
+
+    def _propagate(self: _SystemItemType, row: int, independent_column: int) -> None:
+        """Run the dependencies and actions of the given column."""
         if self._dependency_on:
+            if independent_column in self._held_columns:
+                # A dependency callback is setting this column. Whether the change propagates
+                # depends on what the callback returns.
+                self._held_columns[independent_column] = True
+                return
+            threshold = self._change_thresholds.get(independent_column)
+            if threshold is not None and not self._is_material_change(independent_column,
+                                                                      threshold):
+                return
             for dep in self._dependency_vector[independent_column]:
                 if dep.callback is None:  # Unfortunate side-affect of how _add_column works
                     break
                 if dep.dependent_column is None:  # This is an action
-                    dep.callback(independent_column)
+                    if self._deferred_actions or dep.max_per_second is not None:
+                        # Run once, with the final values, when the system settles
+                        self._pending_actions[dep] = independent_column
+                    else:
+                        self._run_action(dep, independent_column)
                 # This is a dependency, so we execute only if we are within the set
                 # number around the circle.
                 elif (self.get(column=dep.dependent_column)._dependency_circle_count <
                       self._dependency_circle_max):
+                    versions: Optional[Tuple[int, ...]] = None
+                    if dep.input_columns is not None:
+                        versions = self._input_versions(dep, row)
+                        if dep.memo.get(row) == versions:
+                            continue  # The inputs have not changed since the last run
                     # Increase the number of times we passed this item
                     self.get(column=independent_column)._dependency_circle_count += 1
-                    dep.callback(independent_column, dep.dependent_column)
-                    # Decrease the number of times we passed this item
-                    self.get(column=independent_column)._dependency_circle_count -= 1
+                    # Hold the propagation of the dependent column until the callback returns
+                    held_before = self._held_columns.get(dep.dependent_column)
+                    self._held_columns[dep.dependent_column] = False
+                    try:
+                        try:
+                            start = perf_counter() if self._callback_timing else 0.0
+                            result = dep.callback(independent_column, dep.dependent_column)
+                            if versions is not None and result is not DependencyResult.FAILURE:
+                                self._remember_versions(dep, row, versions)
+                            if self._callback_timing:
+                                dep.calls += 1
+                                dep.total_time += perf_counter() - start
+                            changed = self._held_columns[dep.dependent_column]
+                        finally:
+                            # Even if the callback raised, later changes must propagate again
+                            if held_before is None:
+                                del self._held_columns[dep.dependent_column]
+                            else:
+                                self._held_columns[dep.dependent_column] = held_before
+                        if result is DependencyResult.FAILURE:
+                            # Nothing downstream of a failed calculation is run
+                            self._dependency_errors.append(
+                                (independent_column, dep.dependent_column, dep.callback.__name__)
+                            )
+                        elif changed and result is not DependencyResult.NO_CHANGE:
+                            self._dependency_engine(row, dep.dependent_column)
+                    finally:
+                        # Decrease the number of times we passed this item
+                        self.get(column=independent_column)._dependency_circle_count -= 1
             else:  # we did not break, so there was a dependency
                 # In case this system item itself is part of another system item dependency
                 self._touch()
 
+    def _is_material_change(self: _SystemItemType, column: int, threshold: float) -> bool:
+        """
+        Has the column moved by at least the threshold since it last propagated? If so, it is
+        remembered as the last propagated value.
+        """
+        value = self._column_data[column][0].get_value()
+        last_value = self._last_propagated_values.get(column)
+        if value is not None and last_value is not None and abs(value - last_value) < threshold:
+            return False
+        self._last_propagated_values[column] = value
+        return True
+
+    def _input_versions(self: _SystemItemType,
+                        dep: _DependencyItem,
+                        row: int) -> Tuple[int, ...]:
+        """The current versions of the inputs of the pure dependency in the row."""
+        return tuple(self._column_data[col][row]._version for col in dep.input_columns)
+
+    def _remember_versions(self: _SystemItemType,
+                           dep: _DependencyItem,
+                           row: int,
+                           versions: Tuple[int, ...]) -> None:
+        """The pure dependency ran successfully for the row with inputs of the given versions."""
+        dep.memo[row] = versions
+        dep.memo.move_to_end(row)
+        if len(dep.memo) > dep.memo_size:
+            dep.memo.popitem(last=False)
+
+    def _run_action(self: _SystemItemType, dep: _DependencyItem, independent_column: int) -> None:
+        """Run an action callback."""
+        start = perf_counter() if self._callback_timing else 0.0
+        result = dep.callback(independent_column)
+        if self._callback_timing:
+            dep.calls += 1
+            dep.total_time += perf_counter() - start
+        if result is DependencyResult.FAILURE:
+            self._dependency_errors.append((independent_column, None, dep.callback.__name__))
+
+    def _run_pending_actions(self: _SystemItemType) -> bool:
+        """
+        Run the pending actions by priority. Throttled actions stay pending. The actions run
+        inside the propagation, so their changes are not journaled (replay runs them again).
+        Returns whether any action ran.
+        """
+        pending = sorted(self._pending_actions.items(), key=lambda item: -item[0].priority)
+        self._pending_actions = OrderedDict()
+        now = monotonic()
+        ran: bool = False
+        self._propagation_depth += 1
+        try:
+            for dep, independent_column in pending:
+                if dep.max_per_second is not None:
+                    while dep.fire_times and now - dep.fire_times[0] >= 1.0:
+                        dep.fire_times.popleft()
+                    if len(dep.fire_times) >= dep.max_per_second:
+                        # Try again later. It will see the latest values by then.
+                        self._pending_actions[dep] = independent_column
+                        continue
+                    dep.fire_times.append(now)
+                ran = True
+                self._run_action(dep, independent_column)
+        finally:
+            self._propagation_depth -= 1
+        return ran
+
+    def _propagation_complete(self: _SystemItemType) -> None:
+        """Called once the system has settled after an external change."""
+        # Actions may change columns, which may trigger more actions
+        while self._pending_actions and self._run_pending_actions():
+            pass
+        changed_columns = self._changed_columns
+        self._changed_columns = set()
+        if self._shared_state is not None:
+            self._shared_state.publish(self, changed_columns)
+        if self._snapshot is not None:
+            snapshot = dict(self._snapshot)
+            for col_idx in changed_columns:
+                snapshot[self._column_names_and_types[col_idx][0]] = self._snapshot_value(col_idx)
+            self._snapshot = snapshot
+        if self._subscriptions:
+            self._notify_subscribers(sorted(changed_columns))
+
     def __eq__(self: _SystemItemType, other: _SystemItemType) -> bool:
         """Equal operator for system item."""
         if not isinstance(other, SystemItem):
@@ -126,6 +327,125 @@ class SystemItem(ContainerItem):
             return parent_result
         return self._dependency_vector == other._dependency_vector
 
+    def _metadata_memory_usage(self: _SystemItemType, seen: Set[int]) -> Dict[str, int]:
+        """Break the dependencies, actions and their memos out of 'other'."""
+        return {'dependencies': deep_sizeof(self._dependency_vector, seen)}
+
+    def clone(self: _SystemItemType) -> _SystemItemType:
+        """
+        A new independent system with the same columns, values, dependencies and settings, made
+        in one pass without running the constructor (i.e. the user setup and wiring code).
+            1. Callbacks bound to this system are rebound to the clone. Callbacks bound to other
+               objects are shared with the clone.
+            2. Other attributes are deep copied. References to this system and its columns are
+               replaced with the clone and its columns.
+            3. Shared state, journal, locking, subscriptions, views, timers, pending actions and
+               recorded errors are not carried over.
+        """
+        new: _SystemItemType = object.__new__(type(self))
+        memo: Dict[int, Any] = {id(self): new}
+        state = self.__dict__.copy()
+        lock = state.pop('_lock')
+        if lock is not None:
+            memo[id(lock)] = None  # Locks cannot be copied. The clone is not locked.
+        new._lock = None
+
+        # DataItemBase. The clone is not inside any container.
+        new._item_change_callback = None
+        new._my_column_in_container = None
+        new._my_row_in_container = None
+        new._my_container_touch = None
+        new._dependency_circle_count = 0
+        new._version = state.pop('_version')
+        for name in ('_item_change_callback', '_my_column_in_container', '_my_row_in_container',
+                     '_my_container_touch', '_dependency_circle_count'):
+            del state[name]
+
+        # ContainerItem
+        new._column_names_and_types = list(state.pop('_column_names_and_types'))
+        new._names_dict = dict(state.pop('_names_dict'))
+        new._column_data = []
+        engine = new._dependency_engine
+        touch = new._touch
+        for column in state.pop('_column_data'):
+            if column is None:
+                new._column_data.append(None)
+                continue
+            new_column: List[DataItemBase] = []
+            for item in column:
+                if type(item) is DataItem:  # The common case is a lot cheaper than deepcopy
+                    new_item = object.__new__(DataItem)
+                    new_item.__dict__.update(item.__dict__)
+                    new_item._lock = None
+                elif isinstance(item, SystemItem):
+                    new_item = item.clone()
+                    new_item._my_column_in_container = item._my_column_in_container
+                    new_item._my_row_in_container = item._my_row_in_container
+                else:
+                    new_item = copy.deepcopy(item, memo)
+                if item._item_change_callback is not None:
+                    new_item._item_change_callback = engine
+                if item._my_container_touch is not None:
+                    new_item._my_container_touch = touch
+                memo[id(item)] = new_item
+                new_column.append(new_item)
+            new._column_data.append(new_column)
+        new._aggregates = copy.deepcopy(state.pop('_aggregates'), memo)
+        new._aggregate_sources = {
+            src: list(aggs) for src, aggs in state.pop('_aggregate_sources').items()
+        }
+        new._subscriptions = []
+        del state['_subscriptions']
+        new._views = []
+        del state['_views']
+        new._column_hashes = dict(state.pop('_column_hashes'))  # The clone has the same values
+        new._structural_hash = state.pop('_structural_hash')
+
+        # SystemItem
+        new._dependency_vector = []
+        for dep_list in state.pop('_dependency_vector'):
+            if dep_list is None:
+                new._dependency_vector.append(None)
+                continue
+            new_dep_list: List[_DependencyItem] = []
+            for dep in dep_list:
+                new_dep = object.__new__(_DependencyItem)
+                new_dep.__dict__.update(dep.__dict__)
+                if getattr(dep.callback, '__self__', None) is self:
+                    new_dep.callback = MethodType(dep.callback.__func__, new)
+                if dep.memo is not None:  # Memos shared between dependencies stay shared
+                    if id(dep.memo) not in memo:
+                        memo[id(dep.memo)] = OrderedDict(dep.memo)
+                    new_dep.memo = memo[id(dep.memo)]
+                if dep.fire_times is not None:
+                    new_dep.fire_times = deque(dep.fire_times)
+                new_dep_list.append(new_dep)
+            new._dependency_vector.append(new_dep_list)
+        new._dependency_on = state.pop('_dependency_on')
+        new._dependency_circle_max = state.pop('_dependency_circle_max')
+        new._propagation_depth = 0
+        new._changed_columns = set()
+        new._shared_state = None
+        new._journal = None
+        new._journal_id = None
+        new._held_columns = {}
+        new._change_thresholds = dict(state.pop('_change_thresholds'))
+        new._last_propagated_values = dict(state.pop('_last_propagated_values'))
+        new._dependency_errors = []
+        new._callback_timing = state.pop('_callback_timing')
+        new._deferred_actions = state.pop('_deferred_actions')
+        new._pending_actions = OrderedDict()
+        new._timers = {}
+        for name in ('_propagation_depth', '_changed_columns', '_shared_state', '_journal',
+                     '_journal_id', '_held_columns', '_dependency_errors', '_pending_actions',
+                     '_timers'):
+            del state[name]
+
+        # Whatever the derived class has
+        for name, value in state.items():
+            setattr(new, name, copy.deepcopy(value, memo))
+        return new
+
     def _add_column(
         self: _SystemItemType,
         name: str,
@@ -141,7 +461,39 @@ class SystemItem(ContainerItem):
         return new_column
 
     def remove_column(self: _SystemItemType, column: Union[int, str]) -> None:
-        raise NotImplementedError('SystemItem::remove_column(): Currently this is not implemented')
+        """
+        Remove the given column, together with its dependencies and actions, the dependencies
+        that change it and the pure dependencies that read it. The indices of the other columns
+        do not change.
+        """
+        if self._propagation_depth > 0:
+            raise RuntimeError(
+                'SystemItem::remove_column(): You cannot remove columns while propagating'
+            )
+        col_idx = self._names_dict.get(column, -1) if type(column) is str else column
+        if not self._column_exists(col_idx):
+            raise IndexError(f'SystemItem::remove_column(): column {column} does not exist')
+        name = self._column_names_and_types[col_idx][0]
+        super().remove_column(col_idx)
+        self._dependency_vector[col_idx] = None
+        for dep_list in self._dependency_vector:
+            if dep_list is None:
+                continue
+            kept = [
+                dep for dep in dep_list
+                if dep.dependent_column != col_idx and
+                (dep.input_columns is None or col_idx not in dep.input_columns)
+            ]
+            if len(kept) < len(dep_list):
+                # Keep the placeholder that columns without dependencies have
+                dep_list[:] = kept if kept else [_DependencyItem()]
+        self._change_thresholds.pop(col_idx, None)
+        self._last_propagated_values.pop(col_idx, None)
+        for dep in [dep for dep, col in self._pending_actions.items() if col == col_idx]:
+            del self._pending_actions[dep]
+        self.cancel_timers(col_idx)
+        if self._snapshot is not None:
+            self._snapshot = {k: v for k, v in self._snapshot.items() if k != name}
 
     def add_row(
         self: _SystemItemType,
@@ -172,6 +524,9 @@ class SystemItem(ContainerItem):
             if type(dependent_column) is str
             else dependent_column
         )
+        if not self._column_exists(indep_col_idx) or not self._column_exists(dep_col_idx):
+            raise IndexError(f'SystemItem::add_dependency(): column {independent_column} or '
+                             f'{dependent_column} does not exist')
         dep_item = _DependencyItem()
         dep_item.dependent_column = dep_col_idx
         dep_item.callback = callback
@@ -182,19 +537,92 @@ class SystemItem(ContainerItem):
         else:  # append another dependency for the independent column
             self._dependency_vector[indep_col_idx].append(dep_item)
 
+    def add_pure_dependency(
+        self: _SystemItemType,
+        independent_column: Union[int, str],
+        dependent_column: Union[int, str],
+        callback: _DataChangeDependencyCallback,
+        input_columns: Optional[List[Union[int, str]]] = None,
+        memo_size: int = 128,
+    ) -> None:
+        """
+        Add a dependency callback that is a pure function of the given input columns (by default
+        just the independent column). The engine skips the callback if none of the input columns
+        have changed since it last ran for the same row. The last input versions are remembered
+        for at most memo_size rows.
+        """
+        self.add_dependency(independent_column, dependent_column, callback)
+        indep_col_idx = (
+            self.column_index(independent_column)
+            if type(independent_column) is str
+            else independent_column
+        )
+        dep_item = self._dependency_vector[indep_col_idx][-1]
+        dep_item.input_columns = tuple(
+            self.column_index(col) if type(col) is str else col
+            for col in (input_columns if input_columns is not None else [indep_col_idx])
+        )
+        dep_item.memo_size = memo_size
+        dep_item.memo = OrderedDict()
+        # Share the memo with the same pure dependency triggered by other columns (e.g. in a
+        # diamond), so whichever runs first saves the others from running.
+        for dep_list in self._dependency_vector:
+            for other in dep_list or ():
+                if (other is not dep_item and
+                        other.memo is not None and
+                        other.callback == callback and
+                        other.dependent_column == dep_item.dependent_column and
+                        other.input_columns == dep_item.input_columns):
+                    dep_item.memo = other.memo
+                    dep_item.memo_size = other.memo_size
+                    return
+
+    def _follow_aggregate_source(
+        self: _SystemItemType, source_column: int, aggregate_column: int
+    ) -> None:
+        """
+        Aggregate columns of a system item follow changes of the source column through a
+        dependency. So they can be the independent column of other dependencies and actions, like
+        any other column.
+        """
+        self.add_dependency(source_column, aggregate_column, self._aggregate_dependency)
+
+    def _aggregate_dependency(self: _SystemItemType,
+                              source_column: int,
+                              aggregate_column: int) -> DependencyResult:
+        """Dependency callback of aggregate columns."""
+        if self._update_aggregate(source_column, aggregate_column):
+            return DependencyResult.SUCCESS
+        return DependencyResult.NO_CHANGE
+
     def add_action(
         self: _SystemItemType,
         independent_column: Union[int, str],
         callback: _DataChangeActionCallback,
+        priority: int = 0,
+        max_per_second: Optional[int] = None,
     ) -> None:
-        """Add an action callback for the given columns"""
+        """
+        Add an action callback for the given columns.
+        The priority orders deferred actions (see set_deferred_actions()). If max_per_second is
+        given, the action is always deferred and runs at most that many times per second. Calls
+        over the limit wait for flush_pending_actions() or the next time the system settles.
+        """
         indep_col_idx = (
             self.column_index(independent_column)
             if type(independent_column) is str
             else independent_column
         )
+        if not self._column_exists(indep_col_idx):
+            raise IndexError(
+                f'SystemItem::add_action(): column {independent_column} does not exist'
+            )
         dep_item = _DependencyItem()
         dep_item.callback = callback
+        dep_item.priority = priority
+        if max_per_second is not None:
+            dep_item.max_per_second = max_per_second
+            dep_item.fire_times = deque()
 
         # Is this the first action being added for this column?
         if self._dependency_vector[indep_col_idx][0].callback is None:
@@ -202,6 +630,77 @@ class SystemItem(ContainerItem):
         else:  # append another action for the independent column
             self._dependency_vector[indep_col_idx].append(dep_item)
 
+    def add_timer(
+        self: _SystemItemType,
+        column: Union[int, str],
+        callback: _DataChangeActionCallback,
+        interval: Optional[float] = None,
+        at: Optional[datetime] = None,
+        wheel: Optional[TimerWheel] = None,
+    ) -> Timer:
+        """
+        Call callback(column) to recompute the column on time, instead of on data, either every
+        interval seconds or once at the given datetime. The change it makes propagates like any
+        other change.
+            1. The timers of a system that are due together run in one propagation, so the system
+               settles (i.e. runs deferred actions, notifies subscribers, etc.) once for all.
+            2. Timers run on the given wheel or the shared one (see shared_timer_wheel()). If the
+               wheel runs in its own thread, enable locking (see enable_locking()).
+            3. Changes made by timers come from the clock, not from outside. So, they are not
+               recorded in the journal.
+        Returns the timer, which can be cancelled.
+        """
+        col_idx = self.column_index(column) if type(column) is str else column
+        if not self._column_exists(col_idx):
+            raise IndexError(f'SystemItem::add_timer(): column {column} does not exist')
+        if (interval is None) == (at is None):
+            raise ValueError(
+                'SystemItem::add_timer(): Exactly one of interval and at must be given'
+            )
+        if wheel is None:
+            wheel = shared_timer_wheel()
+        if interval is not None:
+            timer = wheel.schedule(callback, interval, interval, self)
+        else:
+            timer = wheel.schedule(callback, (at - datetime.now(at.tzinfo)).total_seconds(),
+                                   None, self)
+        self._timers[timer] = col_idx
+        return timer
+
+    def cancel_timers(self: _SystemItemType, column: Union[int, str, None] = None) -> None:
+        """Cancel the timers of the given column. None cancels all the timers of the system."""
+        col_idx = self.column_index(column) if type(column) is str else column
+        for timer, timer_column in list(self._timers.items()):
+            if col_idx is None or timer_column == col_idx:
+                timer.cancel()
+                del self._timers[timer]
+
+    def _fire_timers(self: _SystemItemType, timers: List[Timer]) -> None:
+        """Run the due timers of this system in one propagation. Called by the timer wheel."""
+        if self._lock is not None:
+            with self._lock:
+                self._run_timers(timers)
+        else:
+            self._run_timers(timers)
+
+    def _run_timers(self: _SystemItemType, timers: List[Timer]) -> None:
+        """Run the timer callbacks and settle once."""
+        self._propagation_depth += 1
+        try:
+            for timer in timers:
+                column = self._timers.get(timer)
+                if column is None:  # It was cancelled
+                    continue
+                if timer.interval is None:  # It fires only once
+                    del self._timers[timer]
+                result = timer.callback(column)
+                if result is DependencyResult.FAILURE:
+                    self._dependency_errors.append((column, None, timer.callback.__name__))
+        finally:
+            self._propagation_depth -= 1
+        if self._propagation_depth == 0 and (self._changed_columns or self._pending_actions):
+            self._propagation_complete()
+
     def is_dependency_on(self: _SystemItemType) -> bool:
         """Is the dependency engine on?"""
         return self._dependency_on
@@ -221,3 +720,128 @@ class SystemItem(ContainerItem):
         if max_count - self._dependency_circle_max > 40:
             setrecursionlimit(getrecursionlimit() * 2)
         self._dependency_circle_max = max_count
+
+    def set_change_threshold(self: _SystemItemType,
+                             column: Union[int, str],
+                             threshold: Optional[float]) -> None:
+        """
+        Set the smallest change of a numeric column that triggers its dependencies and actions.
+        Smaller changes are still stored, but they do not propagate. None removes the threshold.
+        """
+        col_idx = self.column_index(column) if type(column) is str else column
+        if threshold is None:
+            self._change_thresholds.pop(col_idx, None)
+            self._last_propagated_values.pop(col_idx, None)
+        else:
+            self._change_thresholds[col_idx] = threshold
+            self._last_propagated_values[col_idx] = self._column_data[col_idx][0].get_value()
+
+    def get_dependency_errors(self: _SystemItemType) -> List[Tuple[int, Optional[int], str]]:
+        """
+        The (independent column, dependent column, callback name) of every dependency that
+        returned FAILURE. The dependent column is None for actions.
+        """
+        return self._dependency_errors
+
+    def clear_dependency_errors(self: _SystemItemType) -> None:
+        """Forget the recorded dependency failures."""
+        self._dependency_errors = []
+
+    def enable_locking(self: _SystemItemType, lock: Optional[RLock] = None) -> None:
+        """
+        Make every change to this system, including the propagation it sets off, happen under a
+        reentrant lock. So threads can update the system concurrently. Pass the same lock to
+        systems that change each other (i.e. a connected component of systems).
+        """
+        ContainerItem._share_lock(self, lock if lock is not None else RLock())
+
+    def disable_locking(self: _SystemItemType) -> None:
+        """Stop locking. Only one thread at a time may change the system after this."""
+        ContainerItem._share_lock(self, None)
+
+    def _snapshot_value(self: _SystemItemType, col_idx: int) -> AllowedBaseTypes:
+        """Value of the column as it goes into a snapshot."""
+        data_item = self._column_data[col_idx][0]
+        if data_item.is_container():
+            return data_item.get_string()
+        if isinstance(data_item, ArrayDataItem):  # Arrays can be updated in place
+            return copy.copy(data_item.get_value())
+        return data_item.get_value()
+
+    def enable_snapshots(self: _SystemItemType) -> None:
+        """
+        Keep an immutable snapshot of the column values, replaced every time the system settles.
+        Readers in other threads get it from snapshot() without locking and never see the
+        system in the middle of a propagation.
+        """
+        self._snapshot = {
+            name_and_type[0]: self._snapshot_value(col_idx)
+            for col_idx, name_and_type in enumerate(self._column_names_and_types)
+            if name_and_type is not None
+        }
+
+    def disable_snapshots(self: _SystemItemType) -> None:
+        """Stop keeping snapshots."""
+        self._snapshot = None
+
+    def snapshot(self: _SystemItemType) -> Dict[str, AllowedBaseTypes]:
+        """
+        Column name -> value as of when the system last settled. Containers are given as strings.
+        The returned dictionary must not be changed.
+        """
+        if self._snapshot is None:
+            raise RuntimeError('SystemItem::snapshot(): Snapshots are not enabled')
+        return self._snapshot
+
+    def set_deferred_actions(self: _SystemItemType, on: bool) -> None:
+        """
+        If on, actions are not run as soon as their columns change. Instead, each triggered
+        action runs once, by priority, after the system has settled and with the final values.
+        """
+        self._deferred_actions = on
+
+    def flush_pending_actions(self: _SystemItemType) -> None:
+        """Run the pending actions whose throttle allows it."""
+        if self._lock is not None:
+            with self._lock:
+                if self._pending_actions and self._propagation_depth == 0:
+                    self._propagation_complete()
+        elif self._pending_actions and self._propagation_depth == 0:
+            self._propagation_complete()
+
+    def set_callback_timing(self: _SystemItemType, on: bool) -> None:
+        """Turn timing of the dependency and action callbacks on or off."""
+        self._callback_timing = on
+
+    def analyze_graph(self: _SystemItemType) -> GraphAnalysis:
+        """
+        Analyze the dependency graph: circular dependencies, topological order, fan-out and
+        critical path depth per column and, if callbacks have been timed, the cost of a change.
+        """
+        return GraphAnalysis(self)
+
+    def share_state(self: _SystemItemType, name: Optional[str] = None) -> str:
+        """
+        Mirror the scalar column values in a shared memory block, so other processes can take
+        consistent snapshots of them with SharedSystemReader. The block is updated once every
+        time the system settles. Returns the name of the block.
+        """
+        if self._shared_state is not None:
+            raise RuntimeError('SystemItem::share_state(): State is already shared')
+        self._shared_state = SharedSystemState(self, name)
+        return self._shared_state.name
+
+    def stop_sharing_state(self: _SystemItemType) -> None:
+        """Stop mirroring the state and destroy the shared memory block."""
+        if self._shared_state is not None:
+            self._shared_state.close()
+            self._shared_state = None
+
+    def attach_journal(self: _SystemItemType, journal: SystemJournal, key: str) -> None:
+        """Record every external change to this system in the journal under the given key."""
+        journal.attach(self, key)
+
+    def detach_journal(self: _SystemItemType) -> None:
+        """Stop recording changes in the journal."""
+        self._journal = None
+        self._journal_id = None
@@ -0,0 +1,122 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+import statistics
+import unittest
+
+from ..aggregates import (
+    EwmVariance, Ewma, RollingMax, RollingMean, RollingMin, RollingSum, RollingVariance
+)
+from ..container_item import ContainerItem
+from ..system_item import DependencyResult, SystemItem
+
+
+class Instrument(SystemItem):
+    """An instrument with rolling statistics of its price."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        super().__init__()
+        self.add_float_column('price', None)
+        self.add_aggregate_column('avg_price', 'price', RollingMean(window=3))
+        self.add_aggregate_column('high', 'price', RollingMax(window=3))
+        self.add_float_column('signal', 0.0)
+        self.add_dependency('avg_price', 'signal', self.to_signal)
+
+    def to_signal(self, avg_col: int, signal_col: int) -> DependencyResult:
+        """Price over its rolling average."""
+        price = self.get(column='price').get_value()
+        self.get(column=signal_col).set_value(price / self.get(column=avg_col).get_value())
+        return DependencyResult.SUCCESS
+
+
+class FakeClock(object):
+    """A clock the test controls."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        """Current time."""
+        return self.now
+
+
+class TestAggregates(unittest.TestCase):
+    """Test the aggregates and aggregate columns."""
+
+    def test_rolling_aggregates(self):
+        """Test the rolling aggregates against rescanning the window."""
+        values = [5.0, 3.0, 8.0, 8.0, 1.0, 4.0, 9.0, 2.0, 2.0, 7.0]
+        sums, means = RollingSum(window=4), RollingMean(window=4)
+        variances = RollingVariance(window=4)
+        mins, maxes = RollingMin(window=4), RollingMax(window=4)
+        for idx, value in enumerate(values):
+            for aggregate in (sums, means, variances, mins, maxes):
+                aggregate.update(value)
+            window = values[max(idx - 3, 0):idx + 1]
+            self.assertAlmostEqual(sums.get_value(), sum(window))
+            self.assertAlmostEqual(means.get_value(), statistics.mean(window))
+            self.assertEqual(mins.get_value(), min(window))
+            self.assertEqual(maxes.get_value(), max(window))
+            if len(window) > 1:
+                self.assertAlmostEqual(variances.get_value(), statistics.variance(window))
+            else:
+                self.assertIsNone(variances.get_value())
+        self.assertEqual(means.count(), 4)
+        means.reset()
+        self.assertIsNone(means.get_value())
+
+        with self.assertRaises(ValueError):
+            RollingSum()
+        with self.assertRaises(ValueError):
+            Ewma(0.0)
+
+    def test_time_window(self):
+        """Test windows measured in seconds."""
+        clock = FakeClock()
+        maxes = RollingMax(window_seconds=10.0, clock=clock)
+        means = RollingMean(window_seconds=10.0, clock=clock)
+        for now, value in ((0.0, 9.0), (4.0, 3.0), (8.0, 5.0), (12.0, 4.0), (20.0, 1.0)):
+            clock.now = now
+            maxes.update(value)
+            means.update(value)
+        # Only the values at 12 and 20 are in the window
+        self.assertEqual(maxes.get_value(), 4.0)
+        self.assertEqual(means.get_value(), 2.5)
+
+    def test_ewm(self):
+        """Test the exponentially weighted aggregates."""
+        ewma = Ewma(0.5)
+        ewm_variance = EwmVariance(0.5)
+        for value in (10.0, 12.0, 11.0):
+            ewma.update(value)
+            ewm_variance.update(value)
+        self.assertEqual(ewma.get_value(), 11.0)
+        self.assertAlmostEqual(ewm_variance.get_value(), 0.5)
+
+    def test_aggregate_columns(self):
+        """Test aggregate columns in containers and systems."""
+        history = ContainerItem()
+        history.add_float_column('price', 10.0)
+        history.add_aggregate_column('low', 'price', RollingMin(window=2))
+        self.assertIsNone(history.get(column='low').get_value())
+        for price in (12.0, 11.0, 13.0, None):
+            history.add_row('price', price)
+        self.assertEqual(history.get(column='low').get_value(), 11.0)
+
+        instrument = Instrument()
+        for price in (100.0, 103.0, 97.0, 100.0):
+            instrument.get(column='price').set_value(price)
+        self.assertAlmostEqual(instrument.get(column='avg_price').get_value(), 100.0)
+        self.assertEqual(instrument.get(column='high').get_value(), 103.0)
+        # The average did not change with the last price, so the signal was not recomputed
+        self.assertAlmostEqual(instrument.get(column='signal').get_value(), 0.97)
+        instrument.get(column='price').set_value(106.0)
+        self.assertAlmostEqual(instrument.get(column='avg_price').get_value(), 101.0)
+        self.assertEqual(instrument.get(column='high').get_value(), 106.0)
+        self.assertAlmostEqual(instrument.get(column='signal').get_value(), 106.0 / 101.0)
@@ -0,0 +1,151 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+import os
+import tempfile
+import unittest
+
+from ..array_data_item import ArrayDataItem, numpy
+from ..container_item import ContainerItem
+from ..journal import JournalReplayer, SystemJournal
+from ..system_item import DependencyResult, SystemItem
+
+
+class YieldCurve(SystemItem):
+    """Discount factors computed from a zero curve, a whole curve at a time."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        super().__init__()
+        tenors = numpy.array([0.25, 0.5, 1.0, 2.0, 5.0, 10.0])
+        zero_rates = numpy.array([0.01, 0.012, 0.015, 0.018, 0.022, 0.025])
+        self.add_array_column('tenors', tenors)
+        self.add_array_column('zero_rates', zero_rates)
+        self.add_array_column('discount_factors', numpy.exp(-zero_rates * tenors))
+        self.add_integer_column('recalculated', 0)
+        self.add_dependency('zero_rates', 'discount_factors', self.to_discount_factors)
+        self.add_dependency('discount_factors', 'recalculated', self.count_recalculated)
+
+    def to_discount_factors(self, col: int, df_col: int) -> DependencyResult:
+        """Recompute only the discount factors whose rates changed."""
+        rates = self.get(column=col)
+        tenors = self.get(column='tenors').get_value()
+        discount_factors = self.get(column=df_col)
+        mask = rates.change_mask()
+        if mask is None:
+            discount_factors.set_value(numpy.exp(-rates.get_value() * tenors))
+        else:
+            discount_factors.update(mask, numpy.exp(-rates.get_value()[mask] * tenors[mask]))
+        return DependencyResult.SUCCESS
+
+    def count_recalculated(self, col: int, count_col: int) -> DependencyResult:
+        """Count the changes of the discount factors."""
+        count = self.get(column=count_col)
+        count.set_value(count.get_value() + 1)
+        return DependencyResult.SUCCESS
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestArrayDataItem(unittest.TestCase):
+    """Test array valued data items."""
+
+    def test_array_data_item(self):
+        """Test change detection and partial updates."""
+        source = numpy.array([1.0, numpy.nan, 3.0])
+        item = ArrayDataItem(source)
+        source[0] = 10.0  # The item has its own copy
+        self.assertEqual(item.get_value()[0], 1.0)
+        with self.assertRaises(ValueError):
+            item.get_value()[0] = 5.0
+        self.assertEqual(item.get_string(), '[ 1.,nan, 3.]')
+        self.assertTrue(item.is_numeric())
+
+        changes = []
+        item._item_change_callback = lambda row, col: changes.append(item.change_mask())
+        item.set_value([1.0, numpy.nan, 3.0])  # NaNs are equal, so nothing changed
+        item.update(0, 1.0)
+        self.assertEqual(changes, [])
+        item.set_value([1.0, 2.0, 3.0])
+        self.assertEqual(changes[-1].tolist(), [False, True, False])
+        item.update(slice(1, 3), [2.0, 4.0])
+        self.assertEqual(changes[-1].tolist(), [False, False, True])
+        self.assertEqual(item.get_value().tolist(), [1.0, 2.0, 4.0])
+        item.set_value(numpy.zeros(4))  # A new shape replaces the whole array
+        self.assertIsNone(changes[-1])
+        self.assertEqual(len(changes), 3)
+        self.assertEqual(item._version, 3)
+
+        self.assertEqual(item, ArrayDataItem(numpy.zeros(4)))
+        self.assertNotEqual(item, ArrayDataItem(numpy.ones(4)))
+        item.set_to_null()
+        self.assertEqual(item.get_string(), '~~NULL~~')
+        with self.assertRaises(ValueError):
+            item.update(0, 1.0)
+
+        container = ContainerItem()
+        container.add_array_column('curve', [[1, 2], [3, 4]])
+        container.add_row('curve', [[5, 6], [7, 8]])
+        self.assertEqual(container.get(row=1, column='curve').get_value()[1, 0], 7)
+        self.assertEqual(container.get_string(), 'curve: [[1,2], [3,4]],[[5,6], [7,8]],\n')
+
+    def test_vectorized_dependencies(self):
+        """Test a system passing whole curves to its dependencies."""
+        curve = YieldCurve()
+        curve.enable_snapshots()
+        rates = curve.get(column='zero_rates')
+        discount_factors = curve.get(column='discount_factors')
+        self.assertAlmostEqual(discount_factors.get_value()[5], numpy.exp(-0.25))
+
+        before = discount_factors.get_value().copy()
+        rates.update([1, 4], [0.013, 0.021])
+        self.assertEqual(curve.get(column='recalculated').get_value(), 1)
+        self.assertEqual(discount_factors.change_mask().tolist(),
+                         [False, True, False, False, True, False])
+        self.assertAlmostEqual(discount_factors.get_value()[4], numpy.exp(-0.105))
+        self.assertEqual(discount_factors.get_value()[0], before[0])
+        snapshot = curve.snapshot()
+
+        # A change that changes nothing does not propagate
+        rates.set_value(rates.get_value().copy())
+        self.assertEqual(curve.get(column='recalculated').get_value(), 1)
+        rates.set_value(rates.get_value() + 0.001)
+        self.assertEqual(curve.get(column='recalculated').get_value(), 2)
+        self.assertIsNot(curve.snapshot(), snapshot)
+        # Snapshots do not see later in place updates
+        self.assertAlmostEqual(snapshot['discount_factors'][4], numpy.exp(-0.105))
+
+        twin = curve.clone()
+        twin.get(column='zero_rates').update(0, 0.0)
+        self.assertEqual(twin.get(column='discount_factors').get_value()[0], 1.0)
+        self.assertNotEqual(discount_factors.get_value()[0], 1.0)
+
+    def test_journaled_system(self):
+        """Array columns are not journaled, but the system still propagates."""
+        curve = YieldCurve()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'curve.jnl')
+            journal = SystemJournal(path)
+            curve.attach_journal(journal, 'curve')
+            curve.get(column='zero_rates').update(0, 0.0)
+            curve.get(column='recalculated').set_value(10)
+            journal.checkpoint(curve)
+            journal.close()
+            self.assertEqual(curve.get(column='discount_factors').get_value()[0], 1.0)
+            records = list(JournalReplayer(path).records())
+            self.assertEqual([record.value for record in records[1:]], [10, 10])
+
+
+@unittest.skipIf(numpy is not None, 'NumPy is installed')
+class TestArrayDataItemWithoutNumPy(unittest.TestCase):
+    """Test array valued data items without NumPy."""
+
+    def test_no_numpy(self):
+        """Arrays need NumPy."""
+        with self.assertRaises(ImportError):
+            ArrayDataItem([1.0, 2.0])
+        with self.assertRaises(ImportError):
+            ContainerItem().add_array_column('curve', [1.0, 2.0])
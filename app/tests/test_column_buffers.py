@@ -0,0 +1,232 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+from array import array
+import copy
+from datetime import datetime
+import os
+import tempfile
+import unittest
+
+from ..column_buffers import export_column, import_column, numpy, pyarrow, to_arrow, to_numpy
+from ..container_item import ContainerItem
+from ..mmap_container_item import MmapContainerItem, write_mmap_container
+from ..system_item import DependencyResult, SystemItem
+
+
+def _make_container() -> ContainerItem:
+    """A container with a column of every exportable type, with nulls."""
+    container = ContainerItem()
+    container.add_integer_column('qty', 10)
+    container.add_row('qty', None)
+    container.add_row('qty', -30)
+    container.add_float_column('price', 1.5)
+    container.add_row('price', 2.5)
+    container.add_row('price', None)
+    container.add_bool_column('active', True)
+    container.add_row('active', False)
+    container.add_string_column('name', 'IBM')
+    container.add_row('name', None)
+    container.add_row('name', 'Société Générale')
+    container.add_datetime_column('time', datetime(2019, 3, 5, 8, 23, 5, 123456))
+    container.add_row('time', None)
+    return container
+
+
+class TestColumnBuffers(unittest.TestCase):
+    """Test exporting and importing columns as buffers."""
+
+    def test_export(self):
+        """Test exporting regular and mapped columns."""
+        container = _make_container()
+        qty = export_column(container, 'qty')
+        self.assertEqual((qty.column_type, qty.length, qty.null_count), (int, 3, 1))
+        self.assertEqual(qty.values.format, 'q')
+        self.assertEqual(qty.values.tolist(), [10, 0, -30])
+        self.assertEqual(bytes(qty.validity), b'\x05')
+        name = export_column(container, container.column_index('name'))
+        self.assertEqual(name.values.tolist(), [0, 3, 3, 3 + len('Société Générale'.encode())])
+        self.assertEqual(bytes(name.blob), 'IBMSociété Générale'.encode())
+        self.assertEqual(export_column(container, 'time').null_count, 1)
+
+        nested = ContainerItem()
+        nested.add_container_column('nested', container)
+        with self.assertRaises(TypeError):
+            export_column(nested, 'nested')
+        with self.assertRaises(IndexError):
+            export_column(container, 10)
+
+        # Mapped columns are exported without copying
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            write_mmap_container(container, path)
+            mapped = MmapContainerItem(path, copy_on_write=True)
+            price = export_column(mapped, 'price')
+            self.assertEqual((price.length, price.null_count), (3, 1))
+            mapped.get(row=1, column='price').set_value(7.25)
+            self.assertEqual(price.values[1], 7.25)
+            del price
+            mapped.close()
+        finally:
+            os.remove(path)
+
+    def test_import(self):
+        """Test adopting buffers as columns."""
+        container = ContainerItem()
+        container.add_integer_column('id', 1)
+        prices = array('d', [1.0, 2.0, 3.0, 4.0])
+        data_item = import_column(container, 'price', float, prices, validity=bytearray([0x0B]))
+        self.assertEqual(data_item.get_value(), 1.0)
+        self.assertEqual(container.number_of_rows('price'), 4)
+        self.assertIsNone(container.get(row=2, column='price').get_value())
+
+        # The container sees changes to the buffer and writes through to it
+        prices[3] = 40.0
+        self.assertEqual(container.get(row=3, column='price').get_value(), 40.0)
+        container.get(row=0, column='price').set_value(10.0)
+        self.assertEqual(prices[0], 10.0)
+
+        import_column(container, 'name', str, array('q', [0, 3, 7]), blob=b'IBMMSFT')
+        self.assertEqual(container.get(row=1, column='name').get_value(), 'MSFT')
+        with self.assertRaises(NotImplementedError):
+            container.add_row('price', 5.0)
+        with self.assertRaises(RuntimeError):
+            import_column(container, 'price', float, prices)
+        with self.assertRaises(ValueError):
+            import_column(container, 'symbol', str, array('q', [0, 3]))
+
+        # A copy is a regular container
+        copied = ContainerItem()
+        copied.set_value(container)
+        copied.add_row('price', 5.0)
+        self.assertEqual(copied.number_of_rows('price'), 5)
+
+        # Round trip
+        round_trip = ContainerItem()
+        for name in ('qty', 'price', 'active', 'name', 'time'):
+            buffers = export_column(_make_container(), name)
+            import_column(round_trip, name, buffers.column_type, buffers.values, buffers.validity,
+                          buffers.blob)
+        self.assertEqual(round_trip.get_string(), _make_container().get_string())
+        self.assertIsInstance(copy.deepcopy(round_trip._column_data)[0], list)
+
+    def test_import_into_system(self):
+        """Test adopting buffers as a column that drives dependencies."""
+        system = SystemItem()
+        prices = array('d', [100.0])
+        import_column(system, 'price', float, prices)
+        system.add_float_column('doubled', 0.0)
+
+        def to_doubled(price_col: int, doubled_col: int) -> DependencyResult:
+            system.get(column=doubled_col).set_value(system.get(column=price_col).get_value() * 2)
+            return DependencyResult.SUCCESS
+
+        system.add_dependency('price', 'doubled', to_doubled)
+        system.get(column='price').set_value(21.0)
+        self.assertEqual(prices[0], 21.0)
+        self.assertEqual(system.get(column='doubled').get_value(), 42.0)
+        self.assertIn('21.0', system.get_string())
+
+    def test_imported_cycle(self):
+        """Test that a cycle over imported columns is cut like any other."""
+        system = SystemItem()
+        import_column(system, 'bid', float, array('d', [1.0]))
+        import_column(system, 'ask', float, array('d', [2.0]))
+        calls = []
+
+        def bid_to_ask(bid_col: int, ask_col: int) -> DependencyResult:
+            calls.append('ask')
+            system.get(column=ask_col).set_value(system.get(column=bid_col).get_value() + 1.0)
+            return DependencyResult.SUCCESS
+
+        def ask_to_bid(ask_col: int, bid_col: int) -> DependencyResult:
+            calls.append('bid')
+            system.get(column=bid_col).set_value(system.get(column=ask_col).get_value() + 1.0)
+            return DependencyResult.SUCCESS
+
+        system.add_dependency('bid', 'ask', bid_to_ask)
+        system.add_dependency('ask', 'bid', ask_to_bid)
+        system.get(column='bid').set_value(10.0)
+        self.assertEqual(calls, ['ask'])  # The default circle max is 1
+        self.assertEqual(system.get(column='bid')._dependency_circle_count, 0)
+
+    def test_imported_memo(self):
+        """Test that a pure dependency on an imported column remembers its input versions."""
+        system = SystemItem()
+        import_column(system, 'price', float, array('d', [100.0]))
+        system.add_float_column('doubled', 0.0)
+        calls = []
+
+        def to_doubled(price_col: int, doubled_col: int) -> DependencyResult:
+            calls.append(system.get(column=price_col).get_value())
+            system.get(column=doubled_col).set_value(system.get(column=price_col).get_value() * 2)
+            return DependencyResult.SUCCESS
+
+        system.add_pure_dependency('price', 'doubled', to_doubled)
+        system.get(column='price').set_value(21.0)
+        system._dependency_engine(0, system.column_index('price'))  # Nothing changed
+        self.assertEqual(calls, [21.0])
+        system.get(column='price').set_value(22.0)
+        self.assertEqual(calls, [21.0, 22.0])
+        self.assertEqual(system.get(column='doubled').get_value(), 44.0)
+
+    def test_imported_locking(self):
+        """Test that locking reaches the rows of an imported column."""
+        system = SystemItem()
+        import_column(system, 'price', float, array('d', [1.0]))
+        system.enable_locking()
+        self.assertIsNotNone(system._lock)
+        self.assertIs(system.get(column='price')._lock, system._lock)
+        system.get(column='price').set_value(2.0)
+        system.disable_locking()
+        self.assertIsNone(system.get(column='price')._lock)
+
+    def test_imported_clone(self):
+        """Test that a clone copies an imported column into a regular one."""
+        system = SystemItem()
+        prices = array('d', [1.0])
+        import_column(system, 'price', float, prices)
+        system.add_float_column('doubled', 0.0)
+
+        def to_doubled(price_col: int, doubled_col: int) -> DependencyResult:
+            system.get(column=doubled_col).set_value(system.get(column=price_col).get_value() * 2)
+            return DependencyResult.SUCCESS
+
+        system.add_dependency('price', 'doubled', to_doubled)
+        twin = system.clone()
+        twin.get(column='price').set_value(5.0)
+        self.assertEqual(prices[0], 1.0)
+        self.assertEqual(system.get(column='price').get_value(), 1.0)
+        self.assertEqual(twin.get(column='price').get_value(), 5.0)
+        self.assertEqual(twin.get(column='doubled').get_value(), 0.0)  # Bound to system
+        prices[0] = 7.0
+        self.assertEqual(twin.get(column='price').get_value(), 5.0)
+        copied = copy.deepcopy(system._column_data[0])
+        self.assertEqual([data_item.get_value() for data_item in copied], [7.0])
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_numpy(self):
+        """Test NumPy masked arrays."""
+        container = _make_container()
+        price = to_numpy(export_column(container, 'price'))
+        self.assertEqual(price.mask.tolist(), [False, False, True])
+        self.assertEqual(price.sum(), 4.0)
+        self.assertEqual(to_numpy(export_column(container, 'time'))[0],
+                         numpy.datetime64('2019-03-05T08:23:05.123456'))
+        self.assertEqual(to_numpy(export_column(container, 'name'))[2], 'Société Générale')
+
+    @unittest.skipIf(pyarrow is None, 'PyArrow is not installed')
+    def test_arrow(self):
+        """Test Arrow arrays."""
+        container = _make_container()
+        self.assertEqual(to_arrow(export_column(container, 'qty')).to_pylist(), [10, None, -30])
+        self.assertEqual(to_arrow(export_column(container, 'name')).to_pylist(),
+                         ['IBM', None, 'Société Générale'])
+        self.assertEqual(to_arrow(export_column(container, 'active')).to_pylist(), [True, False])
+        self.assertEqual(to_arrow(export_column(container, 'time')).to_pylist(),
+                         [datetime(2019, 3, 5, 8, 23, 5, 123456), None])
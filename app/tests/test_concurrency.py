@@ -0,0 +1,152 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+from threading import Event, Thread
+import unittest
+
+from ..concurrency import SystemWriter
+from ..container_item import ContainerItem
+from ..system_item import DependencyResult, SystemItem
+
+
+class Spread(SystemItem):
+    """Bid/ask spread. The invariant is mid == (bid + ask) / 2 and width == ask - bid."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        super().__init__()
+        self.add_float_column('bid', 0)
+        self.add_float_column('ask', 0)
+        self.add_float_column('mid', 0)
+        self.add_float_column('width', 0)
+        self.add_integer_column('ticks', 0)
+        self.add_dependency('bid', 'mid', self.to_mid)
+        self.add_dependency('ask', 'mid', self.to_mid)
+        self.add_dependency('mid', 'width', self.to_width)
+        self.add_dependency('width', 'ticks', self.count_tick)
+
+    def to_mid(self, col: int, mid_col: int) -> DependencyResult:
+        """Mid calculation."""
+        bid = self.get(column='bid').get_value()
+        ask = self.get(column='ask').get_value()
+        self.get(column=mid_col).set_value((bid + ask) / 2.0)
+        return DependencyResult.SUCCESS
+
+    def to_width(self, col: int, width_col: int) -> DependencyResult:
+        """Width calculation."""
+        bid = self.get(column='bid').get_value()
+        ask = self.get(column='ask').get_value()
+        self.get(column=width_col).set_value(ask - bid)
+        return DependencyResult.SUCCESS
+
+    def count_tick(self, col: int, ticks_col: int) -> DependencyResult:
+        """Not thread safe without a lock: read, then write."""
+        ticks = self.get(column=ticks_col)
+        ticks.set_value(ticks.get_value() + 1)
+        return DependencyResult.SUCCESS
+
+
+class TestConcurrency(unittest.TestCase):
+    """Test system locking, snapshots and SystemWriter."""
+
+    def test_locking(self):
+        """Test many threads updating the same locked system."""
+        spread = Spread()
+        spread.enable_locking()
+        container = ContainerItem()
+        container.add_float_column('level', 1.0)
+        spread.add_container_column('book', container)
+        # Everything in the system shares the system lock, including rows added later
+        self.assertIs(container.get(column='level')._lock, spread._lock)
+        self.assertIs(container.add_row('level', 2.0)._lock, spread._lock)
+
+        def feed(offset: int) -> None:
+            for i in range(500):
+                spread.get(column='bid').set_value(float(offset * 1000 + i))
+
+        threads = [Thread(target=feed, args=(offset, )) for offset in range(1, 5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Every bid change moved the width exactly once
+        self.assertEqual(spread.get(column='ticks').get_value(), 2000)
+        self.assertEqual(spread.get(column='mid').get_value(),
+                         spread.get(column='bid').get_value() / 2.0)
+
+        spread.disable_locking()
+        self.assertIsNone(container.get(column='level', row=1)._lock)
+        # A clone is never locked
+        spread.enable_locking()
+        clone = spread.clone()
+        self.assertIsNone(clone._lock)
+        self.assertIsNone(clone.get(column='bid')._lock)
+        clone.get(column='ask').set_value(10000.0)
+        self.assertEqual(clone.get(column='width').get_value(),
+                         10000.0 - spread.get(column='bid').get_value())
+
+    def test_snapshot(self):
+        """Test that readers only see settled systems."""
+        spread = Spread()
+        with self.assertRaises(RuntimeError):
+            spread.snapshot()
+        spread.enable_snapshots()
+        spread.get(column='ask').set_value(2.0)
+        snapshot = spread.snapshot()
+        self.assertEqual(snapshot['mid'], 1.0)
+        self.assertEqual(snapshot['width'], 2.0)
+
+        writer = SystemWriter(spread)
+        writer.start()
+        done = Event()
+        inconsistent = []
+
+        def read() -> None:
+            while not done.is_set():
+                snapshot = writer.snapshot()
+                if (snapshot['mid'] != (snapshot['bid'] + snapshot['ask']) / 2.0 or
+                        snapshot['width'] != snapshot['ask'] - snapshot['bid']):
+                    inconsistent.append(snapshot)
+
+        def feed(offset: int) -> None:
+            for i in range(300):
+                writer.submit('bid', float(offset + i))
+                writer.submit('ask', float(offset + i + 1 + i % 3))
+
+        reader = Thread(target=read)
+        reader.start()
+        feeders = [Thread(target=feed, args=(offset, )) for offset in (100, 200, 300)]
+        for feeder in feeders:
+            feeder.start()
+        for feeder in feeders:
+            feeder.join()
+        writer.submit('no_such_column', 1.0)
+        writer.submit('ask', None)
+        writer.stop()
+        done.set()
+        reader.join()
+
+        self.assertEqual(inconsistent, [])
+        self.assertEqual(len(writer.errors()), 2)  # The unknown column and the null ask in to_mid
+        self.assertEqual(writer.errors()[0][0], 'no_such_column')
+        # The failed propagation left the system inconsistent, so it was not published
+        self.assertIsNone(spread.get(column='ask').get_value())
+        self.assertIsNotNone(spread.snapshot()['ask'])
+        self.assertIsNot(spread.snapshot(), snapshot)
+        self.assertEqual(snapshot['mid'], 1.0)  # Old snapshots never change
+
+        # The writer goes on after the error, and later writes still propagate
+        ticks = spread.get(column='ticks').get_value()
+        writer.start()
+        writer.submit('ask', 10.0)
+        writer.submit('bid', 4.0)
+        writer.stop()
+        self.assertEqual(len(writer.errors()), 2)
+        self.assertEqual(spread.get(column='mid').get_value(), 7.0)
+        self.assertEqual(spread.get(column='width').get_value(), 6.0)
+        self.assertEqual(spread.get(column='ticks').get_value(), ticks + 2)
+        self.assertEqual(writer.snapshot()['width'], 6.0)
@@ -0,0 +1,214 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+from array import array
+import unittest
+
+from ..column_buffers import import_column
+from ..container_delta import DeltaOp, DeltaPublisher, apply_delta, diff
+from ..container_item import ContainerItem
+from ..system_item import DependencyResult, SystemItem
+
+
+def order_book() -> ContainerItem:
+    """A container with a nested container of levels."""
+    levels = ContainerItem()
+    levels.add_float_column('price', 100.0)
+    levels.add_row('price', 99.5)
+    levels.add_row('price', 99.0)
+    levels.add_integer_column('size', 10)
+    levels.add_row('size', 20)
+    levels.add_row('size', 30)
+
+    book = ContainerItem()
+    book.add_string_column('symbol', 'IBM')
+    book.add_null_column('venue')
+    book.add_container_column('bids', levels)
+    return book
+
+
+class Position(SystemItem):
+    """A system whose value follows its quantity."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        super().__init__()
+        self.add_integer_column('quantity', 0)
+        self.add_float_column('price', 10.0)
+        self.add_float_column('value', 0.0)
+        self.add_dependency('quantity', 'value', self.revalue)
+
+    def revalue(self, col: int, value_col: int) -> DependencyResult:
+        """Value calculation."""
+        self.get(column=value_col).set_value(
+            self.get(column=col).get_value() * self.get(column='price').get_value()
+        )
+        return DependencyResult.SUCCESS
+
+
+class TestStructuralHash(unittest.TestCase):
+
+    def test_equal_containers(self) -> None:
+        book1 = order_book()
+        book2 = order_book()
+        self.assertEqual(book1.structural_hash(), book2.structural_hash())
+        book2.get(column='symbol').set_value('MSFT')
+        self.assertNotEqual(book1.structural_hash(), book2.structural_hash())
+        self.assertNotEqual(book1, book2)
+        book2.get(column='symbol').set_value('IBM')
+        self.assertEqual(book1.structural_hash(), book2.structural_hash())
+
+    def test_hashes_are_kept(self) -> None:
+        book = order_book()
+        book_hash = book.structural_hash()
+        self.assertIs(book.structural_hash(), book_hash)
+        symbol_hash = book.column_hash('symbol')
+        bids_hash = book.column_hash('bids')
+        book.get(column='symbol').set_value('MSFT')
+        self.assertNotIn(book.column_index('symbol'), book._column_hashes)
+        self.assertIn(book.column_index('bids'), book._column_hashes)
+        self.assertNotEqual(book.column_hash('symbol'), symbol_hash)
+        self.assertIs(book.column_hash('bids'), bids_hash)
+
+    def test_nested_changes(self) -> None:
+        book = order_book()
+        book_hash = book.structural_hash()
+        levels = book.get(column='bids')
+        levels_hash = levels.structural_hash()
+        levels.get(row=2, column='size').set_value(35)  # Not the first row
+        self.assertNotEqual(levels.structural_hash(), levels_hash)
+        self.assertNotEqual(book.structural_hash(), book_hash)
+        book_hash = book.structural_hash()
+        levels.add_row('price', 98.5)
+        self.assertNotEqual(book.structural_hash(), book_hash)
+        book_hash = book.structural_hash()
+        levels.remove_row('price', 3)
+        levels.remove_column('size')
+        self.assertNotEqual(book.structural_hash(), book_hash)
+
+    def test_types_and_names(self) -> None:
+        container1 = ContainerItem()
+        container1.add_integer_column('a', 1)
+        container2 = ContainerItem()
+        container2.add_float_column('a', 1.0)
+        container3 = ContainerItem()
+        container3.add_integer_column('b', 1)
+        container4 = ContainerItem()
+        container4.add_float_column('a', -0.0)
+        container5 = ContainerItem()
+        container5.add_float_column('a', 0.0)
+        self.assertNotEqual(container1.structural_hash(), container2.structural_hash())
+        self.assertNotEqual(container1.structural_hash(), container3.structural_hash())
+        self.assertEqual(container4.structural_hash(), container5.structural_hash())
+
+    def test_mapped_columns(self) -> None:
+        container = ContainerItem()
+        values = array('q', [1, 2, 3])
+        import_column(container, 'ids', int, values)
+        container_hash = container.structural_hash()
+        values[1] = 5  # The container is not told
+        self.assertNotEqual(container.structural_hash(), container_hash)
+
+    def test_system_clone(self) -> None:
+        position = Position()
+        position.get(column='quantity').set_value(3)
+        position_hash = position.structural_hash()
+        clone = position.clone()
+        self.assertEqual(clone.structural_hash(), position_hash)
+        clone.get(column='quantity').set_value(4)
+        self.assertNotEqual(clone.structural_hash(), position_hash)
+        self.assertEqual(position.structural_hash(), position_hash)
+
+
+class TestContainerDelta(unittest.TestCase):
+
+    def test_no_changes(self) -> None:
+        self.assertEqual(diff(order_book(), order_book()), [])
+
+    def test_changed_values(self) -> None:
+        old = order_book()
+        new = order_book()
+        new.get(column='venue').set_value('NYSE')
+        new.get(column='bids').get(row=1, column='size').set_value(25)
+        delta = diff(old, new)
+        self.assertEqual(delta, [
+            DeltaOp('set', (), 'venue', type(None), 0, 'NYSE'),
+            DeltaOp('set', (('bids', 0), ), 'size', int, 1, 25),
+        ])
+        apply_delta(old, delta)
+        self.assertEqual(old.structural_hash(), new.structural_hash())
+        self.assertEqual(old.get(column='venue').get_value(), 'NYSE')
+
+    def test_structural_changes(self) -> None:
+        old = order_book()
+        new = order_book()
+        new.remove_column('venue')
+        new.add_bool_column('halted', False)
+        levels = new.get(column='bids')
+        levels.add_row('price', 98.5)
+        levels.remove_row('size', 2)
+        asks = ContainerItem()
+        asks.add_float_column('price', 100.5)
+        new.add_container_column('asks', asks)
+        delta = diff(old, new)
+        self.assertEqual([op.kind for op in delta],
+                         ['remove_column', 'append', 'truncate', 'add_column', 'add_column'])
+        apply_delta(old, delta)
+        self.assertEqual(old.structural_hash(), new.structural_hash())
+        self.assertEqual(old, new)
+
+        # The delta does not share anything with the containers
+        other = order_book()
+        apply_delta(other, delta)
+        asks.get(column='price').set_value(101.0)
+        self.assertNotEqual(old.structural_hash(), new.structural_hash())
+        self.assertEqual(old.structural_hash(), other.structural_hash())
+
+    def test_apply_to_system(self) -> None:
+        old = Position()
+        new = Position()
+        new.get(column='quantity').set_value(2)
+        delta = diff(old, new)
+        self.assertEqual(len(delta), 2)
+        apply_delta(old, delta)
+        self.assertEqual(old.get(column='value').get_value(), 20.0)
+        self.assertEqual(old.structural_hash(), new.structural_hash())
+
+    def test_publisher(self) -> None:
+        book = order_book()
+        publisher = DeltaPublisher(book)
+        self.assertEqual(publisher.publish(), [])
+        replica = order_book()
+
+        book.get(column='bids').get(row=0, column='price').set_value(100.5)
+        delta = publisher.publish()
+        self.assertEqual(delta, [DeltaOp('set', (('bids', 0), ), 'price', float, 0, 100.5)])
+        apply_delta(replica, delta)
+        self.assertEqual(replica.structural_hash(), book.structural_hash())
+        self.assertEqual(publisher.published().structural_hash(), book.structural_hash())
+        self.assertEqual(publisher.publish(), [])
+
+        # A column added again with another type is replaced. A null column that got a type is not.
+        book.remove_column('symbol')
+        book.add_integer_column('symbol', 7)
+        book.get(column='venue').set_value('NYSE')
+        delta = publisher.publish()
+        self.assertEqual([(op.kind, op.column) for op in delta],
+                         [('remove_column', 'symbol'), ('set', 'venue'), ('add_column', 'symbol')])
+        apply_delta(replica, delta)
+        self.assertEqual(replica.structural_hash(), book.structural_hash())
+        self.assertEqual(replica.get(column='symbol').get_value(), 7)
+
+        position = Position()
+        publisher = DeltaPublisher(position)
+        position.get(column='quantity').set_value(5)
+        self.assertEqual([(op.column, op.value) for op in publisher.publish()],
+                         [('quantity', 5), ('value', 50.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+import unittest
+
+from ..container_item import ContainerItem
+from ..container_view import ContainerView
+from ..system_item import DependencyResult, SystemItem
+
+
+def blotter() -> ContainerItem:
+    """Orders, one per row."""
+    orders = ContainerItem()
+    orders.add_string_column('symbol', 'IBM')
+    orders.add_integer_column('qty', 100)
+    orders.add_float_column('price', 120.5)
+    orders.add_string_column('trader', 'ann')
+    for symbol, qty, price, trader in (('MSFT', 0, 300.0, 'bob'),
+                                       ('AAPL', 50, 180.25, 'ann'),
+                                       ('GOOG', -20, 140.0, 'cal')):
+        orders.add_row('symbol', symbol)
+        orders.add_row('qty', qty)
+        orders.add_row('price', price)
+        orders.add_row('trader', trader)
+    return orders
+
+
+def column_values(container: ContainerItem, column: str):
+    """The values of a column."""
+    return [container.get(row, column).get_value()
+            for row in range(container.number_of_rows(column))]
+
+
+class RiskScreen(SystemItem):
+    """A system that screens the open orders."""
+
+    def __init__(self, open_orders: ContainerView) -> None:
+        """Initialize."""
+        super().__init__()
+        self.add_container_column('open_orders', open_orders)
+        self.add_float_column('gross', 0.0)
+        self.add_dependency('open_orders', 'gross', self.to_gross)
+        self.recalculations = 0
+
+    def to_gross(self, col: int, gross_col: int) -> DependencyResult:
+        """Gross notional of the open orders."""
+        self.recalculations += 1
+        orders = self.get(column=col)
+        gross = sum(abs(orders.get(row, 'qty').get_value()) * orders.get(row, 'price').get_value()
+                    for row in range(orders.number_of_rows('qty')))
+        self.get(column=gross_col).set_value(gross)
+        return DependencyResult.SUCCESS
+
+
+class TestContainerView(unittest.TestCase):
+
+    def test_filter_and_project(self) -> None:
+        orders = blotter()
+        view = ContainerView(orders, columns=('symbol', 'qty'),
+                             predicate=lambda row: row['qty'] != 0)
+        self.assertEqual(view.number_of_columns(), 2)
+        self.assertFalse(view.contains('price'))
+        self.assertEqual(column_values(view, 'symbol'), ['IBM', 'AAPL', 'GOOG'])
+        self.assertEqual(view.source_row(1), 2)
+
+        orders.get(2, 'qty').set_value(75)  # Modified in place
+        self.assertEqual(column_values(view, 'qty'), [100, 75, -20])
+        orders.get(1, 'qty').set_value(10)  # Comes into the view
+        self.assertEqual(column_values(view, 'symbol'), ['IBM', 'MSFT', 'AAPL', 'GOOG'])
+        orders.get(0, 'qty').set_value(0)  # Leaves the view
+        self.assertEqual(column_values(view, 'symbol'), ['MSFT', 'AAPL', 'GOOG'])
+        self.assertEqual(view.get(2, 'qty')._my_row_in_container, 2)
+
+        orders.get(3, 'price').set_value(141.0)  # Not in the view
+        self.assertEqual(column_values(view, 'qty'), [10, 75, -20])
+
+    def test_rows_added_and_removed(self) -> None:
+        orders = blotter()
+        view = ContainerView(orders, columns=('symbol', ), predicate=lambda row: row['qty'])
+        orders.add_row('symbol', 'TSLA')
+        self.assertEqual(column_values(view, 'symbol'), ['IBM', 'AAPL', 'GOOG'])  # qty is None
+        orders.add_row('qty', 5)
+        self.assertEqual(column_values(view, 'symbol'), ['IBM', 'AAPL', 'GOOG', 'TSLA'])
+
+        for column in ('symbol', 'qty', 'price', 'trader'):
+            orders.remove_row(column, 0)
+        self.assertEqual(column_values(view, 'symbol'), ['AAPL', 'GOOG', 'TSLA'])
+        self.assertEqual([view.source_row(row) for row in range(3)], [1, 2, 3])
+
+        everything = ContainerView(orders)  # Rows missing cells get nulls
+        self.assertEqual(column_values(everything, 'trader'), ['bob', 'ann', 'cal', None])
+        self.assertEqual(everything.number_of_rows('symbol'), 4)
+
+    def test_source_columns(self) -> None:
+        orders = blotter()
+        view = ContainerView(orders, predicate=lambda row: row['trader'] == 'ann')
+        self.assertEqual(view.number_of_columns(), 4)
+        orders.add_bool_column('urgent', True)
+        self.assertEqual(view.number_of_columns(), 5)
+        self.assertEqual(column_values(view, 'urgent'), [True, None])
+        orders.remove_column('price')
+        self.assertFalse(view.contains('price'))
+        self.assertEqual(column_values(view, 'symbol'), ['IBM', 'AAPL'])
+
+        empty = ContainerView(orders, columns=('symbol', ), predicate=lambda row: False)
+        self.assertEqual(empty.number_of_rows('symbol'), 0)
+        self.assertEqual(empty.structural_hash(), empty.structural_hash())
+
+    def test_view_of_view(self) -> None:
+        orders = blotter()
+        open_orders = ContainerView(orders, predicate=lambda row: row['qty'] != 0)
+        buys = ContainerView(open_orders, columns=('symbol', ),
+                             predicate=lambda row: row['qty'] > 0)
+        self.assertEqual(column_values(buys, 'symbol'), ['IBM', 'AAPL'])
+        orders.get(3, 'qty').set_value(20)
+        self.assertEqual(column_values(buys, 'symbol'), ['IBM', 'AAPL', 'GOOG'])
+        orders.get(0, 'qty').set_value(0)
+        self.assertEqual(column_values(buys, 'symbol'), ['AAPL', 'GOOG'])
+        orders.get(2, 'symbol').set_value('AMZN')
+        self.assertEqual(column_values(buys, 'symbol'), ['AMZN', 'GOOG'])
+
+    def test_subscriptions_and_hashes(self) -> None:
+        orders = blotter()
+        view = ContainerView(orders, columns=('qty', ), predicate=lambda row: row['qty'] > 0)
+        changes = []
+        view.subscribe(lambda container, changed: changes.append(changed))
+        view_hash = view.structural_hash()
+        orders.get(2, 'qty').set_value(60)
+        self.assertEqual(changes, [{'qty': 60}])  # The value of the row that changed
+        self.assertNotEqual(view.structural_hash(), view_hash)
+        view_hash = view.structural_hash()
+        orders.get(3, 'qty').set_value(5)
+        self.assertEqual(len(changes), 2)
+        self.assertNotEqual(view.structural_hash(), view_hash)
+
+    def test_system_input(self) -> None:
+        orders = blotter()
+        open_orders = ContainerView(orders, columns=('qty', 'price'),
+                                    predicate=lambda row: row['qty'] != 0)
+        screen = RiskScreen(open_orders)
+        orders.get(2, 'qty').set_value(60)
+        self.assertEqual(screen.get(column='gross').get_value(),
+                         100 * 120.5 + 60 * 180.25 + 20 * 140.0)
+        recalculations = screen.recalculations
+        orders.get(1, 'price').set_value(310.0)  # Not an open order
+        self.assertEqual(screen.recalculations, recalculations)
+        orders.get(0, 'qty').set_value(0)
+        self.assertEqual(screen.get(column='gross').get_value(), 60 * 180.25 + 20 * 140.0)
+
+    def test_read_only(self) -> None:
+        view = ContainerView(blotter())
+        with self.assertRaises(TypeError):
+            view.add_row('qty', 1)
+        with self.assertRaises(TypeError):
+            view.remove_row('qty', 0)
+        with self.assertRaises(TypeError):
+            view.add_integer_column('extra', 1)
+        with self.assertRaises(TypeError):
+            view.remove_column('qty')
+        with self.assertRaises(TypeError):
+            view.set_value(blotter())
+
+    def test_detach(self) -> None:
+        orders = blotter()
+        view = ContainerView(orders, columns=('qty', ))
+        view.detach()
+        orders.get(0, 'qty').set_value(1)
+        self.assertEqual(view.get(0, 'qty').get_value(), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -153,10 +153,17 @@ class TestDataItems(unittest.TestCase):
         self.assertEqual(ci.column_index('int_column'), 3)
         self.assertEqual(ci.get(column='int_column2').get_value(), 5)
         self.assertTrue(ci.contains('int_column'))
+        int_column2 = ci.get(column='int_column2')
         ci.remove_column('int_column')
         self.assertEqual(ci.number_of_columns(), 6)
+        # Column indices are stable
         self.assertEqual(ci.column_index('str_column'), 2)
-        self.assertEqual(ci.column_index('int_column2'), 3)
+        self.assertEqual(ci.column_index('int_column2'), 4)
+        self.assertEqual(int_column2._my_column_in_container, 4)
+        with self.assertRaises(IndexError):
+            ci.get(column=3)
+        with self.assertRaises(IndexError):
+            ci.column_name(3)
         self.assertEqual(ci.get(column='int_column2').get_value(), 5)
         self.assertFalse(ci.contains('int_column'))
         with self.assertRaises(IndexError):
@@ -0,0 +1,141 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+from datetime import datetime
+import os
+import tempfile
+import unittest
+
+from ..journal import OP_CHECKPOINT, OP_SET_TO_NULL, OP_SET_VALUE, OP_SYSTEM
+from ..journal import JournalReplayer, SystemJournal
+
+from ..system_item import DependencyResult, SystemItem
+
+
+class Position(SystemItem):
+    """A position in an instrument."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        super().__init__()
+        self.add_integer_column('qty', 0)
+        self.add_float_column('price', 0)
+        self.add_float_column('market_value', 0)
+        self.add_string_column('trader', None)
+        self.add_datetime_column('last_trade', None)
+        self.add_dependency('qty', 'market_value', self.to_market_value)
+        self.add_dependency('price', 'market_value', self.to_market_value)
+
+    def to_market_value(self, col: int, market_value_col: int) -> DependencyResult:
+        """Market value calculation."""
+        qty = self.get(column='qty').get_value()
+        price = self.get(column='price').get_value()
+        self.get(column=market_value_col).set_value(qty * price)
+        return DependencyResult.SUCCESS
+
+
+class AlertedPosition(Position):
+    """A position that counts its price alerts in a deferred action."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        super().__init__()
+        self.add_integer_column('alerts', 0)
+        self.add_action('price', self.alert)
+        self.set_deferred_actions(True)
+
+    def alert(self, col: int) -> DependencyResult:
+        """Count the alert."""
+        alerts = self.get(column='alerts')
+        alerts.set_value(alerts.get_value() + 1)
+        return DependencyResult.SUCCESS
+
+
+def _make_position(key):
+    """Construct a fresh position."""
+    return Position()
+
+
+def _make_alerted_position(key):
+    """Construct a fresh position with alerts."""
+    return AlertedPosition()
+
+
+class TestJournal(unittest.TestCase):
+    """Test SystemJournal and JournalReplayer."""
+
+    def setUp(self):
+        """Get a temporary file name."""
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+        os.remove(self.path)
+
+    def tearDown(self):
+        """Remove the temporary file."""
+        os.remove(self.path)
+
+    def test_journal_and_replay(self):
+        """Test recording and replaying a day of events."""
+        journal = SystemJournal(self.path)
+        ibm = Position()
+        msft = Position()
+        ibm.attach_journal(journal, 'IBM')
+        msft.attach_journal(journal, 'MSFT')
+        with self.assertRaises(RuntimeError):
+            journal.attach(ibm, 'IBM_again')
+
+        ibm.get(column='qty').set_value(100)
+        ibm.get(column='price').set_value(120.5)
+        msft.get(column='price').set_value(99.0)
+        msft.get(column='trader').set_value('Bugs Bunny')
+        ibm.get(column='last_trade').set_value(datetime(2019, 3, 5, 8, 23, 5, 123456))
+        msft.get(column='qty').set_value(-20)
+        msft.get(column='trader').set_to_null()
+        journal.checkpoint(ibm)
+        journal.checkpoint(msft)
+        journal.close()
+
+        replayer = JournalReplayer(self.path)
+        records = list(replayer.records())
+        # Two systems and seven external changes. Nothing done by the dependencies is recorded.
+        self.assertEqual([r.op for r in records[:9]],
+                         [OP_SYSTEM, OP_SYSTEM, OP_SET_VALUE, OP_SET_VALUE, OP_SET_VALUE,
+                          OP_SET_VALUE, OP_SET_VALUE, OP_SET_VALUE, OP_SET_TO_NULL])
+        self.assertEqual(records[0].value, 'IBM')
+        self.assertEqual(records[5].value, 'Bugs Bunny')
+        self.assertEqual(records[6].value, datetime(2019, 3, 5, 8, 23, 5, 123456))
+
+        systems = replayer.replay(_make_position)
+        self.assertEqual(replayer.mismatches(), [])
+        self.assertEqual(systems['IBM'].get_string(), ibm.get_string())
+        self.assertEqual(systems['MSFT'].get_string(), msft.get_string())
+        self.assertEqual(systems['MSFT'].get(column='market_value').get_value(), -1980.0)
+
+        # Replaying into a broken system is caught by the checkpoints
+        broken = Position()
+        broken.turn_dependency_off()
+        replayer.replay(_make_position, speed=1000.0, systems={'IBM': broken})
+        self.assertEqual(replayer.mismatches(), [('IBM', 'market_value', 12050.0, 0.0)])
+
+    def test_deferred_actions(self):
+        """Test that changes made by deferred actions are not recorded, but replayed."""
+        journal = SystemJournal(self.path)
+        ibm = AlertedPosition()
+        ibm.attach_journal(journal, 'IBM')
+        ibm.get(column='price').set_value(120.5)
+        ibm.get(column='price').set_value(121.0)
+        self.assertEqual(ibm.get(column='alerts').get_value(), 2)
+        journal.checkpoint(ibm)
+        journal.close()
+
+        replayer = JournalReplayer(self.path)
+        # Only the two price changes. The alerts are counted again by replay.
+        self.assertEqual([r.op for r in replayer.records() if r.op != OP_CHECKPOINT],
+                         [OP_SYSTEM, OP_SET_VALUE, OP_SET_VALUE])
+        systems = replayer.replay(_make_alerted_position)
+        self.assertEqual(replayer.mismatches(), [])
+        self.assertEqual(systems['IBM'].get(column='alerts').get_value(), 2)
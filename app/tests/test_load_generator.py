@@ -0,0 +1,74 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+import contextlib
+import io
+import unittest
+
+from ..benchmarks.load_generator import (
+    LatencyRecorder, SyntheticSystem, drive, main, tick_stream
+)
+
+
+class TestLoadGenerator(unittest.TestCase):
+    """Test the synthetic load generator."""
+
+    def test_tick_stream(self):
+        """Test the arrivals and repeat prices."""
+        ticks = list(tick_stream(10, 20000, rate=1000.0, repeat_fraction=0.25, seed=7))
+        self.assertEqual(ticks, list(tick_stream(10, 20000, rate=1000.0, repeat_fraction=0.25,
+                                                 seed=7)))
+        self.assertAlmostEqual(ticks[-1].due, 20.0, delta=1.0)
+        last_prices = {}
+        repeats = 0
+        for tick in ticks:
+            repeats += last_prices.get(tick.instrument) == tick.price
+            last_prices[tick.instrument] = tick.price
+        self.assertAlmostEqual(repeats / len(ticks), 0.25, delta=0.02)
+
+        bursty = list(tick_stream(10, 20000, rate=1000.0, arrival='bursty', burst_size=10.0,
+                                  seed=7))
+        self.assertAlmostEqual(bursty[-1].due, 20.0, delta=3.0)
+        gaps = sum(1 for prev, tick in zip(bursty, bursty[1:]) if tick.due > prev.due)
+        self.assertAlmostEqual(gaps, 2000, delta=200)
+        with self.assertRaises(ValueError):
+            next(tick_stream(10, 1, arrival='uniform'))
+
+    def test_latency(self):
+        """Test driving systems and recording the latencies."""
+        recorder = LatencyRecorder()
+        with self.assertRaises(ValueError):
+            recorder.percentile(50.0)
+        recorder.latencies = [float(value) for value in range(1, 101)]
+        self.assertEqual(recorder.percentile(50.0), 50.0)
+        self.assertEqual(recorder.percentile(99.9), 100.0)
+        self.assertEqual(recorder.summary()['p90'], 90.0 * 1e6)
+
+        recorder = LatencyRecorder()
+        systems = [SyntheticSystem(recorder, 5, 'fan', loop_size=3, circle_max=2)
+                   for _ in range(3)]
+        self.assertEqual(systems[0].analyze_graph().cycles(), [['c2', 'c3', 'c4']])
+        ticks = list(tick_stream(3, 500, repeat_fraction=0.5, seed=3))
+        self.assertEqual(drive(systems, recorder, iter(ticks)), 500)
+        # Only the ticks that changed a price reached the action, once each
+        last_prices = {}
+        changes = 0
+        for tick in ticks:
+            changes += last_prices.get(tick.instrument) != tick.price
+            last_prices[tick.instrument] = tick.price
+        self.assertEqual(len(recorder.latencies), changes)
+        with self.assertRaises(ValueError):
+            SyntheticSystem(recorder, 5, 'star')
+
+    def test_main(self):
+        """Test the command line."""
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            summary = main(['--instruments', '5', '--ticks', '300', '--loop-size', '2',
+                            '--arrival', 'bursty', '--seed', '1'])
+        self.assertEqual(summary['count'], 300)
+        self.assertIn('latency (us): count: 300', output.getvalue())
@@ -0,0 +1,91 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+import sys
+import time
+import unittest
+
+from ..container_item import ContainerItem
+from ..memory_usage import MemorySampler, deep_sizeof, flatten_memory_usage
+from ..system_item import DependencyResult, SystemItem
+
+
+class Book(SystemItem):
+    """An order book with a nested container of levels."""
+
+    def __init__(self, levels: int) -> None:
+        """Initialize."""
+        super().__init__()
+        self._levels = ContainerItem()
+        self._levels.add_float_column('price', 100.0)
+        self._levels.add_string_column('venue', 'NYSE')
+        for level in range(1, levels):
+            self._levels.add_row('price', 100.0 + level)
+            self._levels.add_row('venue', f'venue_{level}')
+        self.add_container_column('levels', self._levels)
+        self.add_float_column('mid', 0)
+        self.add_float_column('spread', 0)
+        self.add_pure_dependency('mid', 'spread', self.to_spread)
+
+    def to_spread(self, col: int, spread_col: int) -> DependencyResult:
+        """Spread calculation."""
+        self.get(column=spread_col).set_value(self.get(column='mid').get_value() / 1000.0)
+        return DependencyResult.SUCCESS
+
+
+class TestMemoryUsage(unittest.TestCase):
+    """Test memory accounting."""
+
+    def test_memory_usage(self):
+        """Test the breakdown of a system with a nested container."""
+        book = Book(10)
+        usage = book.memory_usage()
+        self.assertEqual(set(usage), {'total', 'columns', 'dependencies', 'other'})
+        self.assertEqual(list(usage['columns']), ['levels', 'mid', 'spread'])
+        # The breakdown adds up and matches counting the whole object graph at once
+        self.assertEqual(usage['total'],
+                         sum(column['values'] for column in usage['columns'].values()) +
+                         usage['dependencies'] + usage['other'])
+        self.assertEqual(usage['total'], deep_sizeof(book, set()))
+        levels = usage['columns']['levels']
+        # The column is its list of rows and the nested container
+        self.assertEqual(levels['values'],
+                         sys.getsizeof(book._column_data[0]) + levels['nested'][0]['total'])
+        self.assertNotIn('dependencies', levels['nested'][0])
+        self.assertGreater(levels['nested'][0]['columns']['venue']['values'],
+                           usage['columns']['mid']['values'])
+
+        # Bigger books use more memory in their levels
+        bigger = Book(100).memory_usage()
+        self.assertGreater(bigger['columns']['levels']['values'], levels['values'] * 5)
+        self.assertLess(bigger['dependencies'], bigger['columns']['levels']['values'] / 5)
+
+        # The pure dependency memo is dependency metadata
+        book.get(column='mid').set_value(1.5)
+        self.assertGreater(book.memory_usage()['dependencies'], usage['dependencies'])
+
+    def test_sampler(self):
+        """Test sampling as flat metrics."""
+        book = Book(3)
+        book.enable_locking()
+        exported = []
+        sampler = MemorySampler({'IBM': book, 'MSFT': Book(2)}, exported.append, interval=0.01)
+        metrics = sampler.sample()
+        self.assertEqual(exported, [metrics])
+        self.assertEqual(metrics['IBM.total'], book.memory_usage()['total'])
+        self.assertIn('IBM.columns.levels.0.columns.venue', metrics)
+        self.assertIn('MSFT.dependencies', metrics)
+        self.assertEqual(flatten_memory_usage(book.memory_usage(), 'IBM.'),
+                         {key: value for key, value in metrics.items() if key.startswith('IBM.')})
+
+        sampler.start()
+        with self.assertRaises(RuntimeError):
+            sampler.start()
+        while len(exported) < 3:
+            time.sleep(0.01)
+        sampler.stop()
+        self.assertEqual(exported[-1], metrics)
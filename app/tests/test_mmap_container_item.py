@@ -0,0 +1,94 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+from datetime import datetime
+import os
+import tempfile
+import unittest
+
+from ..container_item import ContainerItem
+from ..mmap_container_item import MmapContainerItem, write_mmap_container
+
+
+class TestMmapContainerItem(unittest.TestCase):
+    """Test MmapContainerItem."""
+
+    def setUp(self):
+        """Write a container to a temporary file."""
+        ci = ContainerItem()
+        ci.add_float_column('float_column', 45.5)
+        ci.add_string_column('str_column', 'Alakazam')
+        ci.add_integer_column('int_column', 34)
+        ci.add_bool_column('bool_column', True)
+        ci.add_datetime_column('datetime_column', datetime(2019, 2, 23, 23, 30, 45, 965234))
+        ci.add_null_column('null_column')
+        ci.add_row('float_column', None)
+        ci.add_row('str_column', 'Bugs Bunny')
+        ci.add_row('str_column', None)
+        ci.add_row('int_column', 50)
+        ci.add_row('int_column', 51)
+        self.container = ci
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+        write_mmap_container(ci, self.path)
+
+    def tearDown(self):
+        """Remove the temporary file."""
+        os.remove(self.path)
+
+    def test_read_only(self):
+        """Test reading a mapped container."""
+        mci = MmapContainerItem(self.path)
+        self.assertEqual(mci.number_of_columns(), 6)
+        self.assertEqual(mci.number_of_rows('int_column'), 3)
+        self.assertEqual(mci.number_of_rows('str_column'), 3)
+        self.assertEqual(mci.column_index('bool_column'), 3)
+        self.assertEqual(mci.get(column='float_column').get_value(), 45.5)
+        self.assertIsNone(mci.get(row=1, column='float_column').get_value())
+        self.assertEqual(mci.get(row=1, column='str_column').get_value(), 'Bugs Bunny')
+        self.assertIsNone(mci.get(row=2, column='str_column').get_value())
+        self.assertEqual(mci.get(row=2, column='int_column').get_value(), 51)
+        self.assertTrue(mci.get(column='bool_column').get_value())
+        self.assertEqual(mci.get(column='datetime_column').get_value(),
+                         datetime(2019, 2, 23, 23, 30, 45, 965234))
+        self.assertIsNone(mci.get(column='null_column').get_value())
+        self.assertEqual(mci.get_string(), self.container.get_string())
+        self.assertTrue(mci.get(column='float_column') > mci.get(column='int_column'))
+
+        with self.assertRaises(IndexError):
+            mci.get(row=3, column='int_column')
+        with self.assertRaises(TypeError):
+            mci.get(column='int_column').set_value(35)
+        with self.assertRaises(NotImplementedError):
+            mci.add_integer_column('another_int_column', 1)
+        with self.assertRaises(NotImplementedError):
+            mci.add_row('int_column', 52)
+        mci.close()
+
+    def test_copy_on_write(self):
+        """Test private in-place changes."""
+        mci = MmapContainerItem(self.path, copy_on_write=True)
+        mci.get(row=1, column='int_column').set_value(500)
+        mci.get(column='float_column').set_to_null()
+        mci.get(column='datetime_column').set_value(datetime(2020, 1, 1))
+        self.assertEqual(mci.get(row=1, column='int_column').get_value(), 500)
+        self.assertIsNone(mci.get(column='float_column').get_value())
+        self.assertEqual(mci.get(column='datetime_column').get_value(), datetime(2020, 1, 1))
+        with self.assertRaises(TypeError):
+            mci.get(column='str_column').set_value('Daffy Duck')
+
+        # The file itself is untouched
+        other = MmapContainerItem(self.path)
+        self.assertEqual(other.get(row=1, column='int_column').get_value(), 50)
+        self.assertEqual(other.get(column='float_column').get_value(), 45.5)
+
+        copied = mci.to_container()
+        self.assertEqual(copied.get(row=1, column='int_column').get_value(), 500)
+        copied.add_row('int_column', 52)
+        self.assertEqual(copied.number_of_rows('int_column'), 4)
+        mci.close()
+        other.close()
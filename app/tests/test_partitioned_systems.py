@@ -0,0 +1,252 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+import os
+import signal
+from threading import Thread
+import time
+import unittest
+
+from ..partitioned_systems import Link, PartitionedSystems, partition_systems
+from ..system_item import DependencyResult, SystemItem
+from ..timer_wheel import TimerWheel
+
+
+class Quote(SystemItem):
+    """A quote with its mid price."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        super().__init__()
+        self.add_float_column('bid', 0.0)
+        self.add_float_column('ask', 0.0)
+        self.add_float_column('mid', 0.0)
+        self.add_dependency('bid', 'mid', self.to_mid)
+        self.add_dependency('ask', 'mid', self.to_mid)
+
+    def to_mid(self, col: int, mid_col: int) -> DependencyResult:
+        """Mid calculation."""
+        self.get(column=mid_col).set_value(
+            (self.get(column='bid').get_value() + self.get(column='ask').get_value()) / 2.0
+        )
+        return DependencyResult.SUCCESS
+
+
+class Position(SystemItem):
+    """A position valued at a price."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        super().__init__()
+        self.add_integer_column('quantity', 10)
+        self.add_float_column('price', 0.0)
+        self.add_float_column('value', 0.0)
+        self.add_dependency('price', 'value', self.revalue)
+        self.add_dependency('quantity', 'value', self.revalue)
+
+    def revalue(self, col: int, value_col: int) -> DependencyResult:
+        """Value calculation."""
+        self.get(column=value_col).set_value(
+            self.get(column='quantity').get_value() * self.get(column='price').get_value()
+        )
+        return DependencyResult.SUCCESS
+
+    def on_mid(self, col: int) -> DependencyResult:
+        """Action on a quote, bound to the position, so the two change each other directly."""
+        self.get(column='price').set_value(self._quote.get(column=col).get_value())
+        return DependencyResult.SUCCESS
+
+    def follow(self, quote: Quote) -> None:
+        """Follow the mid price of the quote directly."""
+        self._quote = quote
+        quote.add_action('mid', self.on_mid)
+
+
+class Metronome(SystemItem):
+    """Counts the beats of a timer."""
+
+    def __init__(self, wheel: TimerWheel) -> None:
+        """Initialize."""
+        super().__init__()
+        self.add_integer_column('beats', 0)
+        self.add_timer('beats', self.beat, interval=0.01, wheel=wheel)
+
+    def beat(self, col: int) -> DependencyResult:
+        """Beat calculation."""
+        self.get(column=col).set_value(self.get(column=col).get_value() + 1)
+        return DependencyResult.SUCCESS
+
+
+def universe():
+    """Two directly connected systems, and two that are only linked."""
+    ibm_quote = Quote()
+    ibm_position = Position()
+    ibm_position.follow(ibm_quote)
+    msft_quote = Quote()
+    msft_position = Position()
+    systems = {'ibm_quote': ibm_quote,
+               'ibm_position': ibm_position,
+               'msft_quote': msft_quote,
+               'msft_position': msft_position}
+    links = [Link('msft_quote', 'mid', 'msft_position', 'price')]
+    return systems, links
+
+
+class TestPartitioning(unittest.TestCase):
+
+    def test_automatic(self) -> None:
+        systems, links = universe()
+        partitions = partition_systems(systems, 2, links)
+        self.assertEqual(partitions['ibm_quote'], partitions['ibm_position'])
+        self.assertEqual(partitions['msft_quote'], partitions['msft_position'])
+        self.assertNotEqual(partitions['ibm_quote'], partitions['msft_quote'])
+
+        partitions = partition_systems(systems, 4)  # Links are not needed to split the work
+        self.assertEqual(len(set(partitions.values())), 3)
+
+    def test_shared_lock(self) -> None:
+        systems, _ = universe()
+        systems['ibm_quote'].enable_locking()
+        systems['msft_quote'].enable_locking(systems['ibm_quote']._lock)
+        partitions = partition_systems(systems, 4)
+        self.assertEqual(partitions['ibm_quote'], partitions['msft_quote'])
+
+    def test_manual(self) -> None:
+        systems, links = universe()
+        partitions = partition_systems(systems, 2, links, {'msft_position': 1, 'ibm_quote': 1})
+        self.assertEqual(partitions['msft_position'], 1)
+        self.assertEqual(partitions['msft_quote'], 1)  # Follows its link
+        self.assertEqual(partitions['ibm_position'], 1)  # Follows its direct connection
+        partitions = partition_systems(systems, 2, links, {'msft_position': 1, 'msft_quote': 0})
+        self.assertEqual(partitions['msft_quote'], 0)
+        with self.assertRaises(ValueError):
+            partition_systems(systems, 2, links, {'ibm_quote': 0, 'ibm_position': 1})
+        with self.assertRaises(ValueError):
+            partition_systems(systems, 2, links, {'ibm_quote': 2})
+        with self.assertRaises(KeyError):
+            partition_systems(systems, 2, [Link('msft_quote', 'mid', 'nobody', 'price')])
+
+
+class TestPartitionedSystems(unittest.TestCase):
+
+    def test_run(self) -> None:
+        systems, links = universe()
+        # The link between the MSFT systems crosses workers
+        runner = PartitionedSystems(systems, 2, links,
+                                    {'ibm_quote': 0, 'msft_quote': 0, 'msft_position': 1})
+        runner.start()
+        try:
+            runner.submit('ibm_quote', 'bid', 99.0)
+            runner.submit('ibm_quote', 'ask', 101.0)
+            runner.submit('msft_quote', 'bid', 299.0)
+            runner.submit('msft_quote', 'ask', 301.0)
+            runner.submit('msft_position', 'quantity', 3)
+            runner.submit('msft_position', 'nonsense', 3)
+            self.assertTrue(runner.wait_quiescent(30.0))
+            self.assertEqual(runner.snapshot('ibm_position', 30.0)['value'], 1000.0)
+            self.assertEqual(runner.snapshot('msft_position', 30.0)['value'], 900.0)
+            self.assertEqual(runner.snapshot('msft_quote', 30.0)['mid'], 300.0)
+            self.assertEqual(len(runner.errors()), 1)
+            stats = runner.stats()
+            self.assertEqual(stats[0]['count'], 4)
+            self.assertEqual(stats[1]['count'], 4)  # 2 link changes and 2 submitted
+        finally:
+            runner.stop()
+        # The systems of this process are not changed
+        self.assertEqual(systems['ibm_position'].get(column='value').get_value(), 0.0)
+
+    def test_restart(self) -> None:
+        systems, links = universe()
+        runner = PartitionedSystems(systems, 2, links)
+        for _ in range(2):
+            runner.start()
+            try:
+                runner.submit('ibm_quote', 'bid', 99.0)
+                self.assertTrue(runner.wait_quiescent(30.0))
+                stats = runner.stats()  # Of this run only
+                self.assertEqual(len(stats), 2)
+                self.assertEqual(sum(worker['count'] for worker in stats.values()), 1)
+            finally:
+                runner.stop()
+
+    def test_stop_when_busy(self) -> None:
+        systems, links = universe()
+        runner = PartitionedSystems(systems, 1, links)
+        runner.start()
+        for i in range(20000):
+            runner.submit('ibm_quote', 'bid', float(i))
+        started = time.monotonic()
+        runner.stop(timeout=60.0)  # The workers never block on acks nobody reads
+        self.assertLess(time.monotonic() - started, 60.0)
+
+    def test_concurrent_snapshots(self) -> None:
+        systems, links = universe()
+        runner = PartitionedSystems(systems, 1, links)
+        runner.start()
+        wrong = []
+
+        def read(key: str, column: str) -> None:
+            for _ in range(200):
+                if column not in runner.snapshot(key, 30.0):
+                    wrong.append(key)
+
+        try:
+            readers = [Thread(target=read, args=('ibm_quote', 'mid')),
+                       Thread(target=read, args=('ibm_position', 'quantity'))]
+            for reader in readers:
+                reader.start()
+            for reader in readers:
+                reader.join()
+        finally:
+            runner.stop()
+        self.assertEqual(wrong, [])
+
+    def test_dead_worker(self) -> None:
+        systems, links = universe()
+        runner = PartitionedSystems(systems, 2, links,
+                                    {'ibm_quote': 0, 'msft_quote': 1, 'msft_position': 1})
+        runner.start()
+        try:
+            os.kill(runner._processes[1].pid, signal.SIGKILL)
+            runner._processes[1].join()
+            runner.submit('msft_quote', 'bid', 299.0)
+            runner.submit('ibm_quote', 'bid', 99.0)
+            self.assertTrue(runner.wait_quiescent(30.0))
+            self.assertEqual([error[0] for error in runner.errors()], ['msft_quote'])
+            with self.assertRaises(RuntimeError):
+                runner.snapshot('msft_position', 30.0)
+            self.assertEqual(runner.snapshot('ibm_quote', 30.0)['mid'], 49.5)
+        finally:
+            runner.stop()
+
+    def test_timers(self) -> None:
+        wheel = TimerWheel(tick=0.005)  # Not started. The worker advances it.
+        metronome = Metronome(wheel)
+        systems, links = universe()
+        systems['metronome'] = metronome
+        runner = PartitionedSystems(systems, 2, links)
+        runner.start()
+        try:
+            deadline = time.monotonic() + 30.0
+            while (runner.snapshot('metronome', 30.0)['beats'] < 3 and
+                   time.monotonic() < deadline):
+                time.sleep(0.01)
+            self.assertGreaterEqual(runner.snapshot('metronome', 30.0)['beats'], 3)
+        finally:
+            runner.stop()
+        self.assertEqual(metronome.get(column='beats').get_value(), 0)
+
+    def test_not_started(self) -> None:
+        systems, links = universe()
+        runner = PartitionedSystems(systems, 1, links)
+        with self.assertRaises(RuntimeError):
+            runner.submit('ibm_quote', 'bid', 1.0)
+        runner.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
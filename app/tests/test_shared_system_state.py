@@ -0,0 +1,94 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+from datetime import datetime
+import multiprocessing
+import unittest
+
+from ..shared_system_state import SharedSystemReader
+from ..system_item import DependencyResult, SystemItem
+
+
+class Quote(SystemItem):
+    """A quote with a derived mid price."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        super().__init__()
+        self.add_float_column('bid', 99.0)
+        self.add_float_column('ask', 101.0)
+        self.add_float_column('mid', 100.0)
+        self.add_integer_column('size', None)
+        self.add_string_column('symbol', 'IBM')
+        self.add_datetime_column('time', datetime(2019, 3, 5, 8, 23, 5, 123456))
+        self.add_dependency('bid', 'mid', self.to_mid)
+        self.add_dependency('ask', 'mid', self.to_mid)
+
+    def to_mid(self, quote_col: int, mid_col: int) -> DependencyResult:
+        """Mid price calculation."""
+        bid = self.get(column='bid').get_value()
+        ask = self.get(column='ask').get_value()
+        self.get(column=mid_col).set_value((bid + ask) / 2.0)
+        return DependencyResult.SUCCESS
+
+
+def _read_snapshot(name, queue):
+    """Take a snapshot in another process."""
+    reader = SharedSystemReader(name)
+    queue.put(reader.snapshot())
+    reader.close()
+
+
+class TestSharedSystemState(unittest.TestCase):
+    """Test sharing SystemItem state."""
+
+    def test_shared_state(self):
+        """Test publishing and reading the shared state."""
+        quote = Quote()
+        name = quote.share_state()
+        reader = SharedSystemReader(name)
+        self.assertEqual(reader.column_names(), ['bid', 'ask', 'mid', 'size', 'time'])
+        self.assertEqual(reader.snapshot(), {
+            'bid': 99.0,
+            'ask': 101.0,
+            'mid': 100.0,
+            'size': None,
+            'time': datetime(2019, 3, 5, 8, 23, 5, 123456),
+        })
+        version = reader.version()
+
+        quote.get(column='bid').set_value(100.0)
+        quote.get(column='size').set_value(300)
+        snapshot = reader.snapshot()
+        self.assertEqual(snapshot['bid'], 100.0)
+        self.assertEqual(snapshot['mid'], 100.5)
+        self.assertEqual(snapshot['size'], 300)
+        # One publish per settled propagation, not one per changed column
+        self.assertEqual(reader.version(), version + 2)
+
+        quote.get(column='size').set_to_null()
+        self.assertIsNone(reader.snapshot()['size'])
+        # A value that cannot be shared reads as null, and the change still goes through
+        quote.get(column='size').set_value('lots')
+        self.assertEqual(quote.get(column='size').get_value(), 'lots')
+        self.assertIsNone(reader.snapshot()['size'])
+        self.assertEqual(reader.version(), version + 4)
+
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_read_snapshot, args=(name, queue))
+        process.start()
+        snapshot = queue.get(timeout=10)
+        process.join()
+        self.assertEqual(snapshot['mid'], 100.5)
+        self.assertEqual(snapshot['ask'], 101.0)
+
+        with self.assertRaises(RuntimeError):
+            quote.share_state()
+        reader.close()
+        quote.stop_sharing_state()
+        quote.get(column='bid').set_value(101.0)
+        self.assertEqual(quote.get(column='mid').get_value(), 101.0)
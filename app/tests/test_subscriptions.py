@@ -0,0 +1,133 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+import gc
+import unittest
+
+from ..container_item import ContainerItem
+from ..system_item import DependencyResult, SystemItem
+
+
+class Converger(SystemItem):
+    """A circular dependency that goes around a few times before it settles."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        super().__init__()
+        self.add_float_column('input', 0)
+        self.add_float_column('estimate', 0)
+        self.add_float_column('correction', 0)
+        self.add_string_column('label', 'none')
+        self.add_dependency('input', 'estimate', self.to_estimate)
+        self.add_dependency('estimate', 'correction', self.to_correction)
+        self.add_dependency('correction', 'estimate', self.to_estimate)
+        self.set_dependency_circle_max(5)
+        self.estimate_sets = 0
+
+    def to_estimate(self, col: int, estimate_col: int) -> DependencyResult:
+        """Estimate calculation."""
+        self.estimate_sets += 1
+        value = self.get(column='input').get_value() - self.get(column='correction').get_value()
+        self.get(column=estimate_col).set_value(value)
+        return DependencyResult.SUCCESS
+
+    def to_correction(self, col: int, correction_col: int) -> DependencyResult:
+        """Correction calculation."""
+        self.get(column=correction_col).set_value(self.get(column=col).get_value() / 2.0)
+        return DependencyResult.SUCCESS
+
+
+class Listener(object):
+    """A subscriber whose method is the callback."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.changes = []
+
+    def on_change(self, container, changes) -> None:
+        """Keep the changes."""
+        self.changes.append(changes)
+
+
+class TestSubscriptions(unittest.TestCase):
+    """Test subscriptions to column changes."""
+
+    def test_system_subscriptions(self):
+        """Test batched delivery, column sets, filters and weak references."""
+        system = Converger()
+        everything = []
+        system.subscribe(lambda container, changes: everything.append(changes))
+        labels = []
+        label_subscription = system.subscribe(
+            lambda container, changes: labels.append((container, changes)), columns=['label']
+        )
+        big = []
+        system.subscribe(lambda container, changes: big.append(changes),
+                         change_filter=lambda name, value: type(value) is float and value > 5.0)
+        listener = Listener()
+        weak_subscription = system.subscribe(listener.on_change, columns=[1], weak=True)
+
+        system.get(column='input').set_value(12.0)
+        # The estimate was set many times, but it is delivered once with its final value
+        self.assertGreater(system.estimate_sets, 2)
+        final = {'input': 12.0,
+                 'estimate': system.get(column='estimate').get_value(),
+                 'correction': system.get(column='correction').get_value()}
+        self.assertEqual(everything, [final])
+        self.assertEqual(labels, [])
+        self.assertEqual(big, [{name: value for name, value in final.items() if value > 5.0}])
+        self.assertEqual(listener.changes, [{'estimate': final['estimate']}])
+
+        system.get(column='label').set_value('converged')
+        self.assertEqual(labels, [(system, {'label': 'converged'})])
+        self.assertEqual(everything[-1], {'label': 'converged'})
+        self.assertEqual(len(big), 1)
+        system.get(column='label').set_value('converged')  # Not a change
+        self.assertEqual(len(everything), 2)
+
+        label_subscription.unsubscribe()
+        self.assertFalse(label_subscription.is_active())
+        del listener
+        gc.collect()
+        self.assertFalse(weak_subscription.is_active())
+        system.get(column='label').set_value('again')
+        self.assertEqual(len(labels), 1)
+        self.assertEqual(len(system._subscriptions), 2)
+        # Clones do not inherit the subscriptions
+        system.clone().get(column='label').set_value('clone')
+        self.assertEqual(everything[-1], {'label': 'again'})
+
+    def test_container_subscriptions(self):
+        """Test delivery from a plain container."""
+        container = ContainerItem()
+        container.add_integer_column('count', 0)
+        container.add_string_column('name', 'IBM')
+        changes = []
+        container.subscribe(lambda source, change: changes.append(change))
+        container.get(column='count').set_value(1)
+        container.get(column='name').set_value('MSFT')
+        self.assertEqual(changes, [{'count': 1}, {'name': 'MSFT'}])
+
+        # Every row reports its own value
+        container.add_row('count', 10)
+        container.add_row('count', 20)
+        container.get(row=2, column='count').set_value(25)
+        self.assertEqual(changes[-1], {'count': 25})
+        container.remove_row('count', 0)
+        container.get(row=0, column='count').set_value(11)
+        self.assertEqual(changes[-1], {'count': 11})
+        self.assertEqual(len(changes), 4)
+
+        # A copy reports its changes to its own subscribers, not to the original's
+        copied = ContainerItem()
+        copied.add_integer_column('count', 5)
+        copied.set_value(container)
+        copied_changes = []
+        copied.subscribe(lambda source, change: copied_changes.append(change))
+        copied.get(column='count').set_value(2)
+        self.assertEqual(copied_changes, [{'count': 2}])
+        self.assertEqual(len(changes), 4)
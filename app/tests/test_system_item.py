@@ -8,6 +8,7 @@ Distributed under the BSD Software License (see file LICENSE)
 from datetime import datetime
 import unittest
 
+from ..container_item import ContainerItem
 from ..system_item import DependencyResult, SystemItem
 
 
@@ -141,7 +142,498 @@ class TestSystemItem(unittest.TestCase):
         self.assertTrue(abs(us_bond.get(column='price').get_value() - 100.5) < 0.001)
         self.assertAlmostEqual(us_bond.get(column='yield').get_value(), 1.50751016)
 
-        with self.assertRaises(NotImplementedError):
-            us_bond.remove_column('yield')
         with self.assertRaises(NotImplementedError):
             us_bond.remove_row('yield', 0)
+
+
+class Quote(SystemItem):
+    """A quote whose mid is a pure function of bid and ask."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        super().__init__()
+        self.add_float_column('bid', 99.0)
+        self.add_float_column('ask', 101.0)
+        self.add_integer_column('tick', 0)
+        self.add_float_column('mid', 100.0)
+        self.mid_calls = 0
+        self.add_pure_dependency('bid', 'mid', self.to_mid, ['bid', 'ask'])
+        self.add_pure_dependency('ask', 'mid', self.to_mid, ['bid', 'ask'])
+        self.add_pure_dependency('tick', 'mid', self.to_mid, ['bid', 'ask'])
+
+    def to_mid(self, quote_col: int, mid_col: int) -> DependencyResult:
+        """Mid price calculation."""
+        self.mid_calls += 1
+        bid = self.get(column='bid').get_value()
+        ask = self.get(column='ask').get_value()
+        self.get(column=mid_col).set_value((bid + ask) / 2.0)
+        return DependencyResult.SUCCESS
+
+
+class TestPureDependency(unittest.TestCase):
+    """Test memoization of pure dependencies."""
+
+    def test_pure_dependency(self):
+        """Test the pure dependency is skipped when its inputs have not changed."""
+        quote = Quote()
+        quote.get(column='bid').set_value(100.0)
+        self.assertEqual(quote.get(column='mid').get_value(), 100.5)
+        self.assertEqual(quote.mid_calls, 1)
+
+        # The tick does not change any of the inputs
+        quote.get(column='tick').set_value(1)
+        quote.get(column='tick').set_value(2)
+        self.assertEqual(quote.mid_calls, 1)
+
+        quote.get(column='ask').set_value(102.0)
+        self.assertEqual(quote.get(column='mid').get_value(), 101.0)
+        self.assertEqual(quote.mid_calls, 2)
+        quote.get(column='tick').set_value(3)
+        self.assertEqual(quote.mid_calls, 2)
+
+        # Setting the same value is not a change, and a change back is still a change
+        quote.get(column='bid').set_value(100.0)
+        self.assertEqual(quote.mid_calls, 2)
+        quote.get(column='bid').set_value(99.0)
+        quote.get(column='bid').set_value(100.0)
+        self.assertEqual(quote.mid_calls, 4)
+        self.assertEqual(quote.get(column='mid').get_value(), 101.0)
+
+    def test_container_input(self):
+        """Test a change nested in a container input runs the pure dependency again."""
+        basket = Basket()
+        legs = basket.get(column='legs')
+        legs.get(0, 'x').set_value(2.0)
+        self.assertEqual(basket.get(column='total').get_value(), 3.0)
+        legs.get(1, 'x').set_value(3.0)
+        self.assertEqual(basket.get(column='total').get_value(), 5.0)
+        self.assertEqual(basket.total_calls, 2)
+
+        basket.get(column='tick').set_value(1)  # The inputs have not changed
+        self.assertEqual(basket.total_calls, 2)
+
+        # A failed run is not memoized
+        basket.fail = True
+        with self.assertRaises(ValueError):
+            legs.get(0, 'x').set_value(4.0)
+        basket.fail = False
+        basket.get(column='tick').set_value(2)  # Same inputs as the failed run
+        self.assertEqual(basket.get(column='total').get_value(), 7.0)
+        self.assertEqual(basket.total_calls, 4)
+
+
+class Basket(SystemItem):
+    """A total over a nested container, computed by a pure dependency."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        super().__init__()
+        legs = ContainerItem()
+        legs.add_float_column('x', 1.0)
+        legs.add_row('x', 1.0)
+        self.add_container_column('legs', legs)
+        self.add_integer_column('tick', 0)
+        self.add_float_column('total', 0.0)
+        self.add_pure_dependency('legs', 'total', self.to_total, ['legs'])
+        self.add_pure_dependency('tick', 'total', self.to_total, ['legs'])
+        self.total_calls = 0
+        self.fail = False
+
+    def to_total(self, col: int, total_col: int) -> DependencyResult:
+        """Total calculation."""
+        self.total_calls += 1
+        if self.fail:
+            raise ValueError('to_total failed')
+        legs = self.get(column='legs')
+        self.get(column=total_col).set_value(
+            sum(legs.get(row, 'x').get_value() for row in range(legs.number_of_rows('x')))
+        )
+        return DependencyResult.SUCCESS
+
+
+class RiskModel(SystemItem):
+    """A model whose callbacks decide what is worth propagating."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        super().__init__()
+        self.add_float_column('price', 100.0)
+        self.add_float_column('rounded_price', 100.0)
+        self.add_float_column('risk', 0.0)
+        self.add_integer_column('risk_updates', 0)
+        self.add_dependency('price', 'rounded_price', self.to_rounded_price)
+        self.add_dependency('rounded_price', 'risk', self.to_risk)
+        self.add_action('risk', self.risk_action)
+
+    def to_rounded_price(self, price_col: int, rounded_col: int) -> DependencyResult:
+        """Round the price and only report material changes."""
+        price = self.get(column=price_col).get_value()
+        old_rounded = self.get(column=rounded_col).get_value()
+        self.get(column=rounded_col).set_value(round(price, 1))
+        if abs(round(price, 1) - old_rounded) < 1.0:
+            return DependencyResult.NO_CHANGE
+        return DependencyResult.SUCCESS
+
+    def to_risk(self, rounded_col: int, risk_col: int) -> DependencyResult:
+        """Risk calculation, that fails for negative prices."""
+        rounded = self.get(column=rounded_col).get_value()
+        self.get(column=risk_col).set_value(rounded * 0.01)
+        if rounded < 0:
+            return DependencyResult.FAILURE
+        return DependencyResult.SUCCESS
+
+    def risk_action(self, risk_col: int) -> DependencyResult:
+        """Count risk updates."""
+        updates = self.get(column='risk_updates')
+        updates.set_value(updates.get_value() + 1)
+        return DependencyResult.SUCCESS
+
+
+class TestDependencyResult(unittest.TestCase):
+    """Test how the engine honors DependencyResult."""
+
+    def test_no_change_and_failure(self):
+        """Test NO_CHANGE prunes and FAILURE stops downstream work."""
+        model = RiskModel()
+        model.get(column='price').set_value(100.52)
+        # The rounded price is stored, but the change is immaterial, so risk is not touched
+        self.assertEqual(model.get(column='rounded_price').get_value(), 100.5)
+        self.assertEqual(model.get(column='risk').get_value(), 0.0)
+        self.assertEqual(model.get(column='risk_updates').get_value(), 0)
+
+        model.get(column='price').set_value(102.0)
+        self.assertAlmostEqual(model.get(column='risk').get_value(), 1.02)
+        self.assertEqual(model.get(column='risk_updates').get_value(), 1)
+        self.assertEqual(model.get_dependency_errors(), [])
+
+        model.get(column='price').set_value(-5.0)
+        self.assertAlmostEqual(model.get(column='risk').get_value(), -0.05)
+        self.assertEqual(model.get(column='risk_updates').get_value(), 1)
+        self.assertEqual(model.get_dependency_errors(), [(1, 2, 'to_risk')])
+        model.clear_dependency_errors()
+        self.assertEqual(model.get_dependency_errors(), [])
+
+    def test_callback_exception(self):
+        """Test propagation still works after a dependency callback raised."""
+        model = RiskModel()
+        with self.assertRaises(TypeError):
+            model.get(column='price').set_to_null()  # round(None) in to_rounded_price
+        self.assertEqual(model._held_columns, {})
+        model.get(column='price').set_value(110.0)
+        self.assertEqual(model.get(column='rounded_price').get_value(), 110.0)
+        self.assertAlmostEqual(model.get(column='risk').get_value(), 1.1)
+        self.assertEqual(model.get(column='risk_updates').get_value(), 1)
+
+    def test_change_threshold(self):
+        """Test the materiality threshold of float columns."""
+        model = RiskModel()
+        model.set_change_threshold('price', 0.5)
+        model.get(column='price').set_value(100.3)
+        model.get(column='price').set_value(100.45)
+        # Stored, but not propagated
+        self.assertEqual(model.get(column='price').get_value(), 100.45)
+        self.assertEqual(model.get(column='rounded_price').get_value(), 100.0)
+        # The threshold is measured from the last propagated value, not the last value
+        model.get(column='price').set_value(101.5)
+        self.assertEqual(model.get(column='rounded_price').get_value(), 101.5)
+        self.assertEqual(model.get(column='risk_updates').get_value(), 1)
+        model.get(column='price').set_value(101.9)
+        self.assertEqual(model.get(column='rounded_price').get_value(), 101.5)
+
+        model.set_change_threshold('price', None)
+        model.get(column='price').set_value(101.95)
+        self.assertEqual(model.get(column='rounded_price').get_value(), 102.0)
+
+
+class TestGraphAnalysis(unittest.TestCase):
+    """Test the static analysis of the dependency graph."""
+
+    def test_graph_analysis(self):
+        """Test SCCs, fan-out, depth, costs and exports."""
+        global SOMETHING_TO_CHANGE
+        something_to_change = SOMETHING_TO_CHANGE
+        us_bond = USTreasuryBond()
+        us_bond.turn_dependency_on()
+        us_bond.set_callback_timing(True)
+        us_bond.get(column='price').set_value(101.5)
+        us_bond.set_callback_timing(False)
+        SOMETHING_TO_CHANGE = something_to_change  # Other tests count on it
+
+        analysis = us_bond.analyze_graph()
+        self.assertEqual(analysis.cycles(), [['price', 'yield', 'yield2', 'yield3', 'yield4']])
+        order = analysis.topological_order()
+        self.assertLess(order.index('yield4'), order.index('dv01'))
+        self.assertEqual(len(analysis.components()), 3)
+
+        price = us_bond.column_index('price')
+        dv01 = us_bond.column_index('dv01')
+        self.assertEqual(analysis.fan_out(price), 5)
+        self.assertEqual(analysis.fan_out(dv01), 0)
+        self.assertEqual(analysis.critical_path_depth(price), 6)
+        self.assertEqual(analysis.critical_path_depth(dv01), 0)
+        self.assertGreater(analysis.estimated_cost(price), analysis.estimated_cost(dv01))
+        self.assertGreater(analysis.estimated_cost(dv01), 0.0)
+
+        report = analysis.report()
+        self.assertEqual(set(report.keys()),
+                         {'price', 'yield', 'yield2', 'yield3', 'yield4', 'dv01'})
+        self.assertEqual(report['yield']['fan_out'], 5)
+        dot = analysis.to_dot()
+        self.assertIn(f'c{price} [label="price"];', dot)
+        self.assertIn(f'c{us_bond.column_index("yield4")} -> c{price};', dot)
+        self.assertIn(f'a{dv01}_0 [label="dv01_action", shape=box];', dot)
+        self.assertIn(f'c{dv01} -> a{dv01}_0;', dot)
+
+        # Actions with the same name are different nodes. Names are escaped.
+        system = SystemItem()
+        system.add_float_column('say "hi"', 0)
+        system.add_action(0, lambda col: DependencyResult.SUCCESS)
+        system.add_action(0, lambda col: DependencyResult.SUCCESS)
+        dot = system.analyze_graph().to_dot()
+        self.assertIn('c0 [label="say \\"hi\\""];', dot)
+        self.assertIn('c0 -> a0_0;', dot)
+        self.assertIn('c0 -> a0_1;', dot)
+        self.assertIn('a0_1 [label="<lambda>", shape=box];', dot)
+        self.assertIn('"components"', analysis.to_json())
+
+
+class Bond(SystemItem):
+    """A bond with a price <-> yield circle and a few actions."""
+
+    def __init__(self, max_yield_publishes=None) -> None:
+        """Initialize."""
+        super().__init__()
+        self.add_float_column('price', 0)
+        self.add_float_column('yield', 0)
+        self.add_float_column('dv01', 0)
+        self.published = []
+        self.add_dependency('price', 'yield', self.price_to_yield)
+        self.add_dependency('yield', 'price', self.yield_to_price)
+        self.add_dependency('price', 'dv01', self.price_to_dv01)
+        self.add_action('dv01', self.publish_dv01)
+        self.add_action('dv01', self.audit_dv01, priority=10)
+        self.add_action('yield', self.publish_yield, max_per_second=max_yield_publishes)
+        self.set_dependency_circle_max(10)
+
+    def price_to_yield(self, price_col: int, yield_col: int) -> DependencyResult:
+        """Price to yield calculation."""
+        self.get(column=yield_col).set_value(self.get(column=price_col).get_value() * 0.0151)
+        return DependencyResult.SUCCESS
+
+    def yield_to_price(self, yield_col: int, price_col: int) -> DependencyResult:
+        """Yield to price calculation."""
+        self.get(column=price_col).set_value(self.get(column=yield_col).get_value() / 0.015)
+        return DependencyResult.SUCCESS
+
+    def price_to_dv01(self, price_col: int, dv01_col: int) -> DependencyResult:
+        """Price to dv01 calculation."""
+        self.get(column=dv01_col).set_value(self.get(column=price_col).get_value() / 100.0)
+        return DependencyResult.SUCCESS
+
+    def publish_dv01(self, dv01_col: int) -> DependencyResult:
+        """Publish dv01."""
+        self.published.append(('dv01', self.get(column=dv01_col).get_value()))
+        return DependencyResult.SUCCESS
+
+    def audit_dv01(self, dv01_col: int) -> DependencyResult:
+        """Audit dv01."""
+        self.published.append(('audit', self.get(column=dv01_col).get_value()))
+        return DependencyResult.SUCCESS
+
+    def publish_yield(self, yield_col: int) -> DependencyResult:
+        """Publish yield."""
+        self.published.append(('yield', self.get(column=yield_col).get_value()))
+        return DependencyResult.SUCCESS
+
+
+class TestDeferredActions(unittest.TestCase):
+    """Test the deferred action queue."""
+
+    def test_deferred_actions(self):
+        """Test actions run once, by priority, with final values."""
+        inline_bond = Bond()
+        inline_bond.get(column='price').set_value(100.0)
+        yield_publishes = [p for p in inline_bond.published if p[0] == 'yield']
+        self.assertGreater(len(yield_publishes), 1)  # Intermediate values went out
+
+        bond = Bond()
+        bond.set_deferred_actions(True)
+        bond.get(column='price').set_value(100.0)
+        final_dv01 = bond.get(column='dv01').get_value()
+        final_yield = bond.get(column='yield').get_value()
+        self.assertEqual(bond.published,
+                         [('audit', final_dv01), ('yield', final_yield), ('dv01', final_dv01)])
+
+    def test_throttled_actions(self):
+        """Test the per-action throttle, where the latest value wins."""
+        bond = Bond(max_yield_publishes=2)
+        bond.set_dependency_circle_max(1)
+        for price in (100.0, 101.0, 102.0, 103.0):
+            bond.get(column='price').set_value(price)
+        yield_publishes = [p for p in bond.published if p[0] == 'yield']
+        self.assertEqual(len(yield_publishes), 2)
+        self.assertEqual(len([p for p in bond.published if p[0] == 'dv01']), 4)
+
+        bond.flush_pending_actions()  # Still throttled
+        self.assertEqual(len([p for p in bond.published if p[0] == 'yield']), 2)
+        for dep in bond._pending_actions:
+            dep.fire_times.clear()  # As if a second went by
+        bond.flush_pending_actions()
+        yield_publishes = [p for p in bond.published if p[0] == 'yield']
+        self.assertEqual(yield_publishes[-1], ('yield', bond.get(column='yield').get_value()))
+        self.assertEqual(len(yield_publishes), 3)
+
+
+class TestClone(unittest.TestCase):
+    """Test cloning wired system items."""
+
+    def test_clone(self):
+        """Test the clone is wired, independent and keeps the settings."""
+        def make_bond():
+            bond = Bond(max_yield_publishes=5)
+            bond.set_deferred_actions(True)
+            bond.set_change_threshold('price', 0.5)
+            bond.get(column='price').set_value(100.0)
+            return bond
+
+        bond = make_bond()
+        published = list(bond.published)
+        original = bond.get_string()
+        twin = bond.clone()
+        self.assertIsInstance(twin, Bond)
+        self.assertEqual(twin.get_string(), bond.get_string())
+        self.assertEqual(twin.published, published)
+        self.assertEqual(twin._dependency_circle_max, 10)
+        self.assertEqual(twin.column_index('dv01'), 2)
+
+        # The clone behaves exactly like a newly constructed instance
+        constructed = make_bond()
+        for price in (90.0, 90.1, 95.0):
+            twin.get(column='price').set_value(price)
+            constructed.get(column='price').set_value(price)
+        self.assertEqual(twin.get_string(), constructed.get_string())
+        self.assertEqual(twin.published, constructed.published)
+        # And it is independent of the original
+        self.assertEqual(bond.published, published)
+        self.assertEqual(bond.get_string(), original)
+
+    def test_clone_nested(self):
+        """Test cloning a system with a nested system."""
+        portfolio = SystemItem()
+        portfolio.add_container_column('bond', Bond())
+        portfolio.add_integer_column('bond_changes', 0)
+
+        def count_changes(bond_col, changes_col):
+            changes = portfolio.get(column=changes_col)
+            changes.set_value(changes.get_value() + 1)
+            return DependencyResult.SUCCESS
+
+        portfolio.add_dependency('bond', 'bond_changes', count_changes)
+        twin = portfolio.clone()
+        twin_bond = twin.get(column='bond')
+        twin_bond.get(column='price').set_value(100.0)
+        self.assertIsNot(twin_bond, portfolio.get(column='bond'))
+        self.assertEqual(portfolio.get(column='bond').get(column='price').get_value(), 0)
+        # A plain function callback is shared, so it still counts on the original
+        self.assertGreater(portfolio.get(column='bond_changes').get_value(), 0)
+        self.assertEqual(twin.get(column='bond_changes').get_value(), 0)
+
+
+class Factors(SystemItem):
+    """A system with derived factor columns."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        super().__init__()
+        self.add_float_column('price', 100.0)
+        self.add_float_column('momentum', 0)
+        self.add_float_column('value', 0)
+        self.add_float_column('score', 0)
+        self.add_integer_column('alerts', 0)
+        self.add_dependency('price', 'momentum', self.to_momentum)
+        self.add_dependency('price', 'value', self.to_value)
+        self.add_pure_dependency('value', 'score', self.to_score,
+                                 input_columns=['value', 'momentum'])
+        self.add_dependency('score', 'alerts', self.to_alerts)
+        self.set_change_threshold('momentum', 0.5)
+
+    def to_momentum(self, col: int, momentum_col: int) -> DependencyResult:
+        """Momentum calculation."""
+        self.get(column=momentum_col).set_value(self.get(column=col).get_value() / 100.0)
+        return DependencyResult.SUCCESS
+
+    def to_value(self, col: int, value_col: int) -> DependencyResult:
+        """Value calculation."""
+        self.get(column=value_col).set_value(100.0 / self.get(column=col).get_value())
+        return DependencyResult.SUCCESS
+
+    def to_score(self, col: int, score_col: int) -> DependencyResult:
+        """Score calculation."""
+        self.get(column=score_col).set_value(self.get(column='value').get_value() +
+                                             self.get(column='momentum').get_value())
+        return DependencyResult.SUCCESS
+
+    def to_alerts(self, col: int, alerts_col: int) -> DependencyResult:
+        """Count the score changes."""
+        alerts = self.get(column=alerts_col)
+        alerts.set_value(alerts.get_value() + 1)
+        return DependencyResult.SUCCESS
+
+
+class TestRemoveColumn(unittest.TestCase):
+    """Test removing columns with stable column indices."""
+
+    def test_remove_column(self):
+        """Test removing a column and its dependencies."""
+        factors = Factors()
+        factors.enable_snapshots()
+        momentum = factors.get(column='momentum')
+        alerts = factors.get(column='alerts')
+        factors.remove_column('momentum')
+        self.assertEqual(factors.number_of_columns(), 4)
+        self.assertEqual(factors.column_index('alerts'), 4)
+        self.assertEqual(alerts._my_column_in_container, 4)
+        self.assertNotIn('momentum', factors.snapshot())
+        self.assertEqual(factors.get_string(),
+                         'price: 100.0, -> to_value,\n'
+                         'value: 0.0,\n'
+                         'score: 0.0, -> to_alerts,\n'
+                         'alerts: 0,\n')
+
+        # The pure dependency read momentum, so it went with it
+        factors.get(column='price').set_value(50.0)
+        self.assertEqual(factors.get(column='value').get_value(), 2.0)
+        self.assertEqual(factors.get(column='score').get_value(), 0.0)
+        self.assertEqual(factors.snapshot()['value'], 2.0)
+        # The removed data item is detached
+        momentum.set_value(7.0)
+        self.assertEqual(factors.get(column='score').get_value(), 0.0)
+
+        analysis = factors.analyze_graph()
+        self.assertEqual(sorted(analysis.topological_order()),
+                         ['alerts', 'price', 'score', 'value'])
+        self.assertEqual(analysis.report()['price']['fan_out'], 1)
+        twin = factors.clone()
+        twin.add_dependency('value', 'score', twin.to_alerts)
+        twin.get(column='price').set_value(25.0)
+        self.assertEqual(twin.get(column='score').get_value(), 1.0)
+        self.assertEqual(twin.get(column='alerts').get_value(), 1)
+
+        # Columns added later get new indices
+        factors.add_float_column('momentum', 0)
+        self.assertEqual(factors.column_index('momentum'), 5)
+        factors.add_dependency('price', 'momentum', factors.to_momentum)
+        factors.get(column='price').set_value(200.0)
+        self.assertEqual(factors.get(column='momentum').get_value(), 2.0)
+        # Pure dependencies can still be added after a removal
+        factors.add_pure_dependency('momentum', 'score', factors.to_score,
+                                    input_columns=['value', 'momentum'])
+        factors.get(column='price').set_value(100.0)
+        self.assertEqual(factors.get(column='score').get_value(), 2.0)
+
+        with self.assertRaises(IndexError):
+            factors.remove_column(1)
+        with self.assertRaises(IndexError):
+            factors.get(column=1)
+        with self.assertRaises(IndexError):
+            factors.add_dependency('value', 1, factors.to_score)
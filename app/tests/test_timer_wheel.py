@@ -0,0 +1,199 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+from datetime import datetime, timedelta
+import time
+import unittest
+
+from ..system_item import DependencyResult, SystemItem
+from ..timer_wheel import TimerWheel
+
+
+class FakeClock(object):
+    """A clock that moves only when told to."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        super().__init__()
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        """The current time."""
+        return self.now
+
+
+class Option(SystemItem):
+    """An option whose time to expiry and stale flag are recomputed on time."""
+
+    def __init__(self, wheel: TimerWheel, clock: FakeClock) -> None:
+        """Initialize."""
+        super().__init__()
+        self._clock = clock
+        self.add_float_column('expiry_time', clock.now + 10.0)
+        self.add_float_column('time_to_expiry', 10.0)
+        self.add_float_column('decay', 1.0)
+        self.add_bool_column('stale', False)
+        self.add_dependency('time_to_expiry', 'decay', self.to_decay)
+        self.add_action('decay', self.on_decay)
+        self.set_deferred_actions(True)
+        self.add_timer('time_to_expiry', self.to_time_to_expiry, interval=1.0, wheel=wheel)
+        self.add_timer('stale', self.to_stale, at=datetime.now() + timedelta(seconds=5),
+                       wheel=wheel)
+        self.decay_actions = 0
+        self.settles = 0
+
+    def to_time_to_expiry(self, col: int) -> DependencyResult:
+        """Time to expiry calculation."""
+        self.get(column=col).set_value(
+            max(self.get(column='expiry_time').get_value() - self._clock.now, 0.0)
+        )
+        return DependencyResult.SUCCESS
+
+    def to_decay(self, col: int, decay_col: int) -> DependencyResult:
+        """Decay calculation."""
+        self.get(column=decay_col).set_value(self.get(column=col).get_value() / 10.0)
+        return DependencyResult.SUCCESS
+
+    def to_stale(self, col: int) -> DependencyResult:
+        """Stale flag calculation."""
+        self.get(column=col).set_value(True)
+        return DependencyResult.SUCCESS
+
+    def on_decay(self, col: int) -> DependencyResult:
+        """Action on the decay."""
+        self.decay_actions += 1
+        return DependencyResult.SUCCESS
+
+    def _propagation_complete(self) -> None:
+        """Count the times the system settles."""
+        self.settles += 1
+        super()._propagation_complete()
+
+
+class TestTimerWheel(unittest.TestCase):
+
+    def test_schedule_and_cancel(self) -> None:
+        clock = FakeClock()
+        wheel = TimerWheel(tick=0.01, slots=16, clock=clock)
+        fired = []
+        wheel.schedule(lambda: fired.append('once'), 0.05)
+        periodic = wheel.schedule(lambda: fired.append('periodic'), 0.1, interval=0.1)
+        far = wheel.schedule(lambda: fired.append('far'), 1.0)  # Many times around the wheel
+        self.assertEqual(len(wheel), 3)
+
+        clock.now += 0.04
+        self.assertEqual(wheel.advance(), 0)
+        clock.now += 0.07
+        self.assertEqual(wheel.advance(), 2)
+        self.assertEqual(fired, ['once', 'periodic'])
+        self.assertEqual(len(wheel), 2)
+        clock.now += 0.1
+        wheel.advance()
+        self.assertEqual(fired, ['once', 'periodic', 'periodic'])
+
+        periodic.cancel()
+        self.assertEqual(len(wheel), 1)
+        clock.now += 0.5  # Falling far behind visits every slot once
+        self.assertEqual(wheel.advance(), 0)
+        clock.now += 0.3
+        self.assertEqual(wheel.advance(), 1)
+        self.assertEqual(fired, ['once', 'periodic', 'periodic', 'far'])
+        self.assertEqual(len(wheel), 0)
+        far.cancel()
+        self.assertEqual(len(wheel), 0)
+
+    def test_falling_behind(self) -> None:
+        clock = FakeClock()
+        wheel = TimerWheel(tick=0.01, slots=16, clock=clock)
+        fired = []
+        wheel.schedule(lambda: fired.append(clock.now), 0.1, interval=0.1)
+        clock.now += 1.05
+        wheel.advance()
+        self.assertEqual(len(fired), 1)  # Not once per missed period
+        clock.now += 0.1
+        wheel.advance()
+        self.assertEqual(len(fired), 2)
+
+    def test_errors(self) -> None:
+        clock = FakeClock()
+        wheel = TimerWheel(tick=0.01, clock=clock)
+        wheel.schedule(lambda: 1 / 0, 0.0)
+        wheel.schedule(lambda: None, 0.0)
+        self.assertEqual(wheel.advance(), 2)
+        self.assertEqual(len(wheel.errors()), 1)
+        self.assertIsInstance(wheel.errors()[0][1], ZeroDivisionError)
+
+    def test_thread(self) -> None:
+        wheel = TimerWheel(tick=0.001)
+        fired = []
+        wheel.schedule(lambda: fired.append(True), 0.01)
+        wheel.start()
+        try:
+            deadline = time.monotonic() + 5.0
+            while not fired and time.monotonic() < deadline:
+                time.sleep(0.005)
+        finally:
+            wheel.stop()
+        self.assertEqual(fired, [True])
+
+
+class TestSystemTimers(unittest.TestCase):
+
+    def test_timers(self) -> None:
+        clock = FakeClock()
+        wheel = TimerWheel(tick=0.01, clock=clock)
+        option = Option(wheel, clock)
+        self.assertEqual(len(wheel), 2)
+
+        clock.now += 1.0
+        wheel.advance()
+        self.assertEqual(option.get(column='time_to_expiry').get_value(), 9.0)
+        self.assertAlmostEqual(option.get(column='decay').get_value(), 0.9)
+        self.assertEqual(option.decay_actions, 1)
+        self.assertEqual(option.settles, 1)
+
+        # Both timers are due, so they run in one propagation
+        clock.now += 4.0
+        wheel.advance()
+        self.assertEqual(option.get(column='time_to_expiry').get_value(), 5.0)
+        self.assertTrue(option.get(column='stale').get_value())
+        self.assertEqual(option.decay_actions, 2)
+        self.assertEqual(option.settles, 2)
+        self.assertEqual(len(wheel), 1)  # The stale timer fired once
+
+        option.remove_column('time_to_expiry')
+        self.assertEqual(len(wheel), 0)
+        clock.now += 1.0
+        self.assertEqual(wheel.advance(), 0)
+
+    def test_no_change(self) -> None:
+        clock = FakeClock()
+        wheel = TimerWheel(tick=0.01, clock=clock)
+        option = Option(wheel, clock)
+        option.cancel_timers('stale')
+        clock.now += 11.0
+        wheel.advance()
+        self.assertEqual(option.settles, 1)
+        clock.now += 1.0
+        wheel.advance()  # Nothing changed, so the system does not settle again
+        self.assertEqual(option.settles, 1)
+        option.cancel_timers()
+        self.assertEqual(len(wheel), 0)
+
+    def test_bad_timers(self) -> None:
+        clock = FakeClock()
+        wheel = TimerWheel(tick=0.01, clock=clock)
+        option = Option(wheel, clock)
+        with self.assertRaises(ValueError):
+            option.add_timer('decay', option.to_stale, wheel=wheel)
+        with self.assertRaises(IndexError):
+            option.add_timer('missing', option.to_stale, interval=1.0, wheel=wheel)
+        self.assertEqual(len(option.clone()._timers), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
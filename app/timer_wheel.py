@@ -0,0 +1,210 @@
+"""
+Hossein Moein
+February 8, 2019
+Copyright (C) 2019-2020 Hossein Moein
+Distributed under the BSD Software License (see file LICENSE)
+"""
+
+from threading import Event, RLock, Thread
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+
+_TimerType = TypeVar('_TimerType', bound='Timer')
+_TimerWheelType = TypeVar('_TimerWheelType', bound='TimerWheel')
+
+
+class Timer(object):
+    """A timer scheduled on a TimerWheel."""
+
+    def __init__(
+        self: _TimerType,
+        due: float,
+        callback: Callable[[], Any],
+        interval: Optional[float] = None,
+        owner: Any = None,
+    ) -> None:
+        """Initialize."""
+        super().__init__()
+        self.due: float = due  # Clock time when it fires next
+        self.callback: Callable[[], Any] = callback
+        self.interval: Optional[float] = interval  # Seconds between firings. None fires once.
+        # If set, the due timers of the same owner are handed to owner._fire_timers() together
+        self.owner: Any = owner
+        self.cancelled: bool = False
+        self._wheel: Optional[TimerWheel] = None
+
+    def cancel(self: _TimerType) -> None:
+        """Do not fire anymore."""
+        self.cancelled = True
+        wheel = self._wheel
+        if wheel is not None:
+            with wheel._lock:
+                if self._wheel is wheel:  # It may have just fired
+                    wheel._count -= 1
+                    self._wheel = None
+
+
+class TimerWheel(object):
+    """
+    A hashed timer wheel. Timers are kept in slots by their due tick, so scheduling and
+    cancelling are O(1) and advancing the wheel is O(elapsed ticks + due timers), however many
+    timers there are.
+        1. Timers are fired at the earliest tick after they are due. So, the resolution is one
+           tick.
+        2. The due timers of the same owner (e.g. a SystemItem) are fired together, so the
+           owner can batch them (see SystemItem.add_timer()).
+        3. A periodic timer that fell behind fires once and is rescheduled from now. It does not
+           fire once for every period it missed.
+        4. Exceptions raised by timers are kept in errors(). The wheel goes on.
+    The wheel is driven by calling advance(), or by a background thread (see start()).
+    """
+
+    def __init__(
+        self: _TimerWheelType,
+        tick: float = 0.001,
+        slots: int = 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Initialize."""
+        super().__init__()
+        if tick <= 0 or slots < 1:
+            raise ValueError('TimerWheel::__init__(): tick and slots must be positive')
+        self._tick: float = tick  # Seconds per slot
+        self._slots: List[List[Timer]] = [[] for _ in range(slots)]
+        self._clock: Callable[[], float] = clock
+        self._current_tick: int = int(clock() / tick)  # The last tick advanced to
+        self._count: int = 0  # Number of scheduled timers
+        self._lock: RLock = RLock()  # Timers can be scheduled from any thread
+        self._errors: List[Tuple[Timer, Exception]] = []
+        self._stopped: Event = Event()
+        self._thread: Optional[Thread] = None
+
+    def clock(self: _TimerWheelType) -> float:
+        """The current time, by the clock of the wheel."""
+        return self._clock()
+
+    def __len__(self: _TimerWheelType) -> int:
+        """Number of scheduled timers."""
+        return self._count
+
+    def schedule(
+        self: _TimerWheelType,
+        callback: Callable[[], Any],
+        delay: float,
+        interval: Optional[float] = None,
+        owner: Any = None,
+    ) -> Timer:
+        """
+        Call callback() in delay seconds and then, if interval is given, every interval seconds
+        until the timer is cancelled.
+        """
+        if interval is not None and interval <= 0:
+            raise ValueError('TimerWheel::schedule(): interval must be positive')
+        timer = Timer(self._clock() + delay, callback, interval, owner)
+        with self._lock:
+            self._add(timer)
+        return timer
+
+    def _add(self: _TimerWheelType, timer: Timer) -> None:
+        """Put the timer in the slot of its due tick. Overdue timers go in the current slot."""
+        due_tick = max(int(timer.due / self._tick), self._current_tick)
+        self._slots[due_tick % len(self._slots)].append(timer)
+        timer._wheel = self
+        self._count += 1
+
+    def advance(self: _TimerWheelType, now: Optional[float] = None) -> int:
+        """Fire the timers that are due by now (by default, the clock). Returns how many fired."""
+        if now is None:
+            now = self._clock()
+        due: List[Timer] = []
+        with self._lock:
+            target_tick = int(now / self._tick)
+            # Every slot is visited at most once, however long it has been
+            ticks = min(target_tick - self._current_tick, len(self._slots) - 1)
+            for tick in range(target_tick - ticks, target_tick + 1):
+                slot = self._slots[tick % len(self._slots)]
+                if not slot:
+                    continue
+                kept: List[Timer] = []
+                for timer in slot:
+                    if timer.cancelled:
+                        continue
+                    if timer.due <= now:
+                        due.append(timer)
+                        self._count -= 1
+                        timer._wheel = None
+                    else:
+                        kept.append(timer)
+                slot[:] = kept
+            self._current_tick = max(target_tick, self._current_tick)
+
+        due.sort(key=lambda timer: timer.due)
+        batches: Dict[int, List[Timer]] = {}  # id(owner) -> its due timers, in order
+        for timer in due:
+            if timer.owner is None:
+                self._fire([timer], None)
+            else:
+                batches.setdefault(id(timer.owner), []).append(timer)
+        for timers in batches.values():
+            self._fire(timers, timers[0].owner)
+
+        with self._lock:
+            for timer in due:
+                if timer.interval is not None and not timer.cancelled:
+                    timer.due += timer.interval
+                    if timer.due <= now:  # It fell behind
+                        timer.due = now + timer.interval
+                    self._add(timer)
+        return len(due)
+
+    def _fire(self: _TimerWheelType, timers: List[Timer], owner: Any) -> None:
+        """Fire the timers, by themselves or through their owner."""
+        try:
+            if owner is None:
+                timers[0].callback()
+            else:
+                owner._fire_timers(timers)
+        except Exception as ex:
+            self._errors.append((timers[0], ex))
+
+    def errors(self: _TimerWheelType) -> List[Tuple[Timer, Exception]]:
+        """Exceptions raised by the timers, with the (first) timer that raised them."""
+        return self._errors
+
+    def start(self: _TimerWheelType) -> None:
+        """Advance the wheel every tick in a background thread."""
+        if self._thread is not None:
+            raise RuntimeError('TimerWheel::start(): Wheel is already started')
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, name='TimerWheel', daemon=True)
+        self._thread.start()
+
+    def stop(self: _TimerWheelType) -> None:
+        """Stop the background thread."""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self: _TimerWheelType) -> None:
+        """The wheel thread."""
+        while not self._stopped.wait(self._tick):
+            self.advance()
+
+
+_shared_wheel: Optional[TimerWheel] = None
+_shared_wheel_lock: RLock = RLock()
+
+
+def shared_timer_wheel() -> TimerWheel:
+    """
+    The wheel that system timers use by default. It is created on first use and is not started.
+    Start it, or advance it from your own loop.
+    """
+    global _shared_wheel
+    with _shared_wheel_lock:
+        if _shared_wheel is None:
+            _shared_wheel = TimerWheel()
+        return _shared_wheel